@@ -1,14 +1,16 @@
 # -*- coding: utf-8 -*-
+import time
+# 起動時間(モジュールの読み込みから判定の開始まで)の計測開始
+START_TIME = time.perf_counter()
 from logging import getLogger, config, StreamHandler, DEBUG
 import settings
-import json
-from difflib import SequenceMatcher 
 
 import sys
 sys.path.append('./')
-from commentutil import OutputCommentKeyEnum, CommentTypeEnum 
 from util import LogUtil
-from judgement import NotUseMPLGJudgement, UseMPLGJudegement
+from writer import ResultWriter
+from columnar import ColumnarWriter
+from jsoncodec import JsonCodec, PageReader
 
 logger = getLogger(__name__)
 log_conf = LogUtil.get_log_conf('./log_config.json')
@@ -19,57 +21,64 @@ logger.setLevel(DEBUG)
 logger.addHandler(handler)
 logger.propagate = False
 
-# envのキーを読み込む。
-VIDEO_ID = settings.ENV_DIC['video_id']
-
-# 形態素解析を使用するかどうか。
-USE_MPLG = bool(int(settings.ENV_DIC['mplg']))
-
-# 類似度閾値
-SIMILARITY_THRESHOLD = float(settings.ENV_DIC['similarity_threshold'])
-
-OUTPUT_DIR_ALL = './output/all/'
-OUTPUT_DIR_NG_CHANNEL = './output/ng_channel/'
-OUTPUT_DIR_OK_MESSAGES = './output/ok_message/'
-OUTPUT_DIR_NG_MESSAGES = './output/ng_message/'
-OUTPUT_DIR_WARN_MESSAGES = './output/warn_message/'
+# cProfileでプロファイルを取得するかどうか。
+USE_PROFILE = bool(int(settings.ENV_DIC['profile']))
 
 if __name__ == '__main__':
   logger.info("start.")
   # 設定値のログ出力
-  logger.info("video_id : {}".format(VIDEO_ID))
-  logger.info("USE_MPLG : {}".format(USE_MPLG))
+  logger.info("video_id : {}".format(settings.VIDEO_ID))
+  settings.log_judgement_settings(logger)
+  logger.info("PARALLEL_WORKERS : {}".format(settings.PARALLEL_WORKERS))
 
-  if USE_MPLG:
-    judgement = UseMPLGJudegement(VIDEO_ID, SIMILARITY_THRESHOLD)
-  else:
-    judgement = NotUseMPLGJudgement(VIDEO_ID, SIMILARITY_THRESHOLD)
+  JsonCodec.set_backend(settings.JSON_BACKEND)
+  PageReader.READ_AHEAD = settings.READ_AHEAD
+  logger.info("OUTPUT_FORMAT : {}".format(settings.OUTPUT_FORMAT))
+  columnar_format = ColumnarWriter.resolve_format(settings.COLUMNAR_FORMAT)
+  logger.info("COLUMNAR_FORMAT : {}".format(columnar_format))
+  logger.info("USE_PROFILE : {}".format(USE_PROFILE))
 
+  judgement = settings.create_judgement(settings.VIDEO_ID, settings.PARALLEL_WORKERS, settings.PARALLEL_CHUNK_SIZE)
   logger.info("instance type : {}".format(type(judgement)))
 
   # 判定実行
-  judgement.exec()
+  # 判定結果はコメント1件ずつ書き込む。
+  # all : NGフラグを設定したコメントのjson
+  # ok_message, ng_message, warn_message : OK, NG, WARNに設定したコメントのみ
+  writer = ResultWriter(settings.VIDEO_ID, settings.OUTPUT_FORMAT == 'jsonl', columnar_format=columnar_format)
+
+  # 起動時間（モジュールの読み込み, 設定の読み込み, 判定インスタンスの生成）
+  startup_time = time.perf_counter() - START_TIME
+  judgement.metrics.add_time('startup', startup_time)
+  logger.info("startup : {:.3f} sec".format(startup_time))
 
-  # NGフラグを設定したコメントのjsonを出力
-  with open(OUTPUT_DIR_ALL + 'result_' + VIDEO_ID + '.json', encoding='utf-8' , mode='w') as f:
-   f.write(json.dumps(judgement.get_result_all_comments()))
-  
-  # NGに設定したユーザのチャンネルURLを出力
-  with open(OUTPUT_DIR_NG_CHANNEL + 'result_' + VIDEO_ID + '.txt' , mode='w') as f:
-    for ng_channel in judgement.get_result_ng_channels():
-      f.write(ng_channel+'\n')
+  profiler = None
+  if USE_PROFILE:
+    # プロファイラは取得する場合だけ読み込む。
+    import cProfile
+    profiler = cProfile.Profile()
+  try:
+    if profiler is not None:
+      profiler.enable()
+    judgement.exec(writer)
 
-  # OKに設定したコメントのみを出力
-  with open(OUTPUT_DIR_OK_MESSAGES + 'result_' + VIDEO_ID + '.json', encoding='utf-8' , mode='w') as f:
-    f.write(json.dumps(judgement.get_result_ok_comments()))
-  
-  # NGに設定したコメントのみを出力
-  with open(OUTPUT_DIR_NG_MESSAGES + 'result_' + VIDEO_ID + '.json', encoding='utf-8' , mode='w') as f:
-    f.write(json.dumps(judgement.get_result_ng_comments()))
+    # NGに設定したユーザのチャンネルURLを出力
+    writer.write_ng_channels(judgement.get_result_ng_channels())
+    judgement.record_ng_channels(judgement.get_result_ng_channels())
+  finally:
+    if profiler is not None:
+      profiler.disable()
+    writer.close()
 
-  # WARNに設定したコメントのみを出力
-  with open(OUTPUT_DIR_WARN_MESSAGES + 'result_' + VIDEO_ID + '.json', encoding='utf-8' , mode='w') as f:
-    f.write(json.dumps(judgement.get_result_warn_comments()))
+  # 計測結果を出力
+  ResultWriter.write_report(settings.VIDEO_ID, judgement.get_report())
+  if profiler is not None:
+    profiler.dump_stats(ResultWriter.OUTPUT_DIR_METRICS + 'profile_' + settings.VIDEO_ID + '.prof')
+    import io
+    import pstats
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+    logger.debug(stream.getvalue())
 
   logger.info("finish.")
   # logger.debug(json.dumps(result_ng_channels))
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+import time
+# 起動時間(モジュールの読み込みから判定の開始まで)の計測開始
+START_TIME = time.perf_counter()
+from logging import getLogger, config, StreamHandler, DEBUG
+from concurrent.futures import ProcessPoolExecutor
+import settings
+import argparse
+import os
+import glob
+
+import sys
+sys.path.append('./')
+from util import LogUtil
+from blocklist import ChannelBlocklistStore
+from writer import ResultWriter
+from columnar import ColumnarWriter
+from jsoncodec import JsonCodec, PageReader
+
+logger = getLogger(__name__)
+log_conf = LogUtil.get_log_conf('./log_config.json')
+config.dictConfig(log_conf)
+handler = StreamHandler()
+handler.setLevel(DEBUG)
+logger.setLevel(DEBUG)
+logger.addHandler(handler)
+logger.propagate = False
+
+# 同時に判定する動画数。2以上の場合、複数プロセスで動画ごとに判定する。
+BATCH_WORKERS = int(settings.ENV_DIC['batch_workers'])
+
+# コメントjsonを配置するディレクトリ
+INPUT_COMMENT_DIR = './input/comment/'
+
+# プロセス内で使い回す判定インスタンス
+_batch_judgement = None
+
+def list_video_ids(patterns):
+  """
+  input/comment配下のディレクトリ名から、判定する動画IDの一覧を返す。
+
+  Parameters:
+  ----
+  patterns : list[string]
+    動画ID, またはglobのパターン。(例: abc*)
+
+  Returns:
+  ----
+  video_ids : list[string]
+    重複を除いた動画ID。パターンの指定順, パターン内は名前順。
+  """
+  video_ids = []
+  video_id_set = set()
+  for pattern in patterns:
+    for path in sorted(glob.glob(INPUT_COMMENT_DIR + pattern)):
+      video_id = os.path.basename(path)
+      if os.path.isdir(path) and video_id not in video_id_set:
+        video_id_set.add(video_id)
+        video_ids.append(video_id)
+  return video_ids
+
+def init_worker(judgement_class, threshold, ng_channels, ng_pattern_index, cache, match_top_k=0, json_backend='json', read_ahead=PageReader.READ_AHEAD, \
+  warn_rules=None, warn_target='judged', flood_detector=None, ng_channel_store_mode='none'):
+  """
+  ワーカープロセスの初期化。
+  NGチャンネル一覧とNGパターンはワーカープロセスごとに1回だけ受け取り、以降の動画で使い回す。
+  """
+  global _batch_judgement
+  # ワーカープロセスが親プロセスの状態を引き継がない場合(spawn)に備えて、設定し直す。
+  JsonCodec.set_backend(json_backend)
+  PageReader.READ_AHEAD = read_ahead
+  _batch_judgement = judgement_class(None, threshold, cache=cache, match_top_k=match_top_k, warn_rules=warn_rules, warn_target=warn_target)
+  _batch_judgement.ng_channels = ng_channels
+  _batch_judgement.ng_pattern_index = ng_pattern_index
+  _batch_judgement.flood_detector = flood_detector
+  # 蓄積したNGチャンネルはng_channelsに含まれているので、ワーカープロセスでは追記だけに使う。
+  _batch_judgement.ng_channel_store = ChannelBlocklistStore.create(ng_channel_store_mode)
+
+def judge_video(video_id, json_lines=False, columnar_format=None):
+  """
+  動画1件分のコメントを判定し、output/*/result_${動画ID}に出力する。
+
+  Parameters:
+  ----
+  video_id : string
+    動画ID
+  json_lines : boolean
+    Trueの場合はJSON Lines形式で出力する。
+  columnar_format : string
+    parquet or csvの場合、output/columnar配下にも出力する。
+
+  Returns:
+  ----
+  summary : dict
+    動画ごとの件数と処理時間。判定に失敗した場合はerrorにメッセージを入れて返す。
+  """
+  judgement = _batch_judgement
+  judgement.reset(video_id)
+  start = time.perf_counter()
+  try:
+    writer = ResultWriter(video_id, json_lines, columnar_format=columnar_format)
+    try:
+      judgement.exec(writer)
+      writer.write_ng_channels(judgement.get_result_ng_channels())
+      judgement.record_ng_channels(judgement.get_result_ng_channels())
+    finally:
+      writer.close()
+    ResultWriter.write_report(video_id, judgement.get_report())
+  except Exception as e:
+    # 1件の失敗でバッチ全体を止めない。
+    logger.exception("failed : {}".format(video_id))
+    return {'video_id': video_id, 'error': repr(e)}
+
+  summary = {'video_id': video_id}
+  summary.update(writer.get_counts())
+  summary['ng_channels'] = len(judgement.get_result_ng_channels())
+  summary['time'] = time.perf_counter() - start
+  logger.info("judged : {}".format(summary))
+  return summary
+
+def judge_videos(judgement, video_ids, workers, json_lines=False, columnar_format=None):
+  """
+  複数の動画を判定する。
+
+  Parameters:
+  ----
+  judgement : JudgementInterface
+    prepareを実行済みの判定インスタンス
+  video_ids : list[string]
+    判定する動画ID
+  workers : int
+    同時に判定する動画数。2以上の場合、複数プロセスで判定する。
+  json_lines : boolean
+    Trueの場合はJSON Lines形式で出力する。
+  columnar_format : string
+    parquet or csvの場合、output/columnar配下にも出力する。
+
+  Returns:
+  ----
+  summaries : list[dict]
+    judge_videoの戻り値の配列。video_idsと同じ順序で返す。
+  """
+  global _batch_judgement
+  if workers <= 1 or len(video_ids) <= 1:
+    _batch_judgement = judgement
+    return [judge_video(video_id, json_lines, columnar_format) for video_id in video_ids]
+
+  # use_shared_dataの場合は、ワーカープロセスにはファイルパスだけを渡す。
+  ng_channels, ng_pattern_index = judgement.get_worker_reference_data()
+  with ProcessPoolExecutor( \
+    max_workers=min(workers, len(video_ids)), \
+    initializer=init_worker, \
+    initargs=(type(judgement), judgement.threshold, ng_channels, ng_pattern_index, judgement.cache, judgement.match_top_k, \
+      JsonCodec.dumps_backend, PageReader.READ_AHEAD, judgement.warn_rules, judgement.warn_target, \
+      judgement.flood_detector, 'none' if judgement.ng_channel_store is None else judgement.ng_channel_store.mode)) as executor:
+    # 件数の多い動画が最後に残らないように、1件ずつ割り当てる。
+    return list(executor.map(judge_video, video_ids, [json_lines] * len(video_ids), [columnar_format] * len(video_ids), chunksize=1))
+
+def summarize(summaries, elapsed):
+  """
+  動画ごとの判定結果を集計する。
+  """
+  total = {'videos': len(summaries), 'failed': 0, 'all': 0, 'ok': 0, 'ng': 0, 'warn': 0, 'ng_channels': 0}
+  for summary in summaries:
+    if 'error' in summary:
+      total['failed'] += 1
+      continue
+    for key in ['all', 'ok', 'ng', 'warn', 'ng_channels']:
+      total[key] += summary[key]
+  total['time'] = elapsed
+  total['comments_per_second'] = total['all'] / elapsed if elapsed > 0 else 0.0
+  return {'total': total, 'videos': summaries}
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description='複数の動画のコメントをまとめて判定する')
+  parser.add_argument('video_ids', nargs='*', default=['*'], \
+    help='input/comment配下の動画ID, またはglobのパターン。省略した場合はすべての動画を判定する。')
+  parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help='同時に判定する動画数')
+  return parser.parse_args(argv)
+
+if __name__ == '__main__':
+  args = parse_args()
+  logger.info("start.")
+  # 設定値のログ出力
+  settings.log_judgement_settings(logger)
+  logger.info("BATCH_WORKERS : {}".format(args.workers))
+
+  JsonCodec.set_backend(settings.JSON_BACKEND)
+  PageReader.READ_AHEAD = settings.READ_AHEAD
+  logger.info("OUTPUT_FORMAT : {}".format(settings.OUTPUT_FORMAT))
+  columnar_format = ColumnarWriter.resolve_format(settings.COLUMNAR_FORMAT)
+  logger.info("COLUMNAR_FORMAT : {}".format(columnar_format))
+
+  video_ids = list_video_ids(args.video_ids)
+  logger.info("video_ids : {}".format(video_ids))
+
+  # 言語ごとの文字列長, NGチャンネル一覧, NGパターンは1回だけ読み込む。
+  start = time.perf_counter()
+  judgement = settings.create_judgement(None)
+
+  # 起動時間（モジュールの読み込み, 設定の読み込み, 判定インスタンスの生成）
+  startup_time = time.perf_counter() - START_TIME
+  logger.info("startup : {:.3f} sec".format(startup_time))
+  judgement.prepare()
+
+  summaries = judge_videos(judgement, video_ids, args.workers, settings.OUTPUT_FORMAT == 'jsonl', columnar_format)
+  summary = summarize(summaries, time.perf_counter() - start)
+  summary['total']['startup'] = startup_time
+  ResultWriter.write_batch_summary(summary)
+  logger.info("batch summary : {}".format(summary['total']))
+  logger.info("finish.")
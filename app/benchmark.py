@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger, config, StreamHandler, DEBUG
+import os
+import argparse
+import json
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import platform
+
+import sys
+sys.path.append('./')
+from util import LogUtil
+
+logger = getLogger(__name__)
+log_conf = LogUtil.get_log_conf('./log_config.json')
+config.dictConfig(log_conf)
+handler = StreamHandler()
+handler.setLevel(DEBUG)
+logger.setLevel(DEBUG)
+logger.addHandler(handler)
+logger.propagate = False
+
+# 計測対象の判定クラス
+JUDGEMENT_CLASS_NAMES = ['NotUseMPLGJudgement', 'UseMPLGJudegement']
+
+# 起動時間の計測用に、別プロセスで実行するスクリプト
+# 引数 : 判定クラス名, 動画ID, しきい値
+# 出力 : モジュールの読み込み時間, 判定インスタンスの生成時間（秒）
+STARTUP_SCRIPT = '''
+import sys
+import time
+start = time.perf_counter()
+import judgement
+judgement_class = getattr(judgement, sys.argv[1])
+imported = time.perf_counter()
+judgement_class(sys.argv[2], float(sys.argv[3]))
+print(imported - start, time.perf_counter() - imported)
+'''
+
+class SyntheticLiveChatGenerator():
+  """
+  GoogleAPIで取得したライブコメントjsonを模したデータを生成する。
+  """
+
+  # コメントの種類と出現比率
+  EVENT_WEIGHTS = [
+    ('textMessageEvent', 90),
+    ('superChatEvent', 5),
+    ('superStickerEvent', 3),
+    ('newSponsorEvent', 2)
+  ]
+
+  # 日本語のコメント
+  JAPANESE_TEXTS = [
+    'こんにちは', 'こんばんは', 'おはようございます', 'かわいい', 'すごい', 'ありがとう', 'おつかれさまでした',
+    '初見です', '今日も配信ありがとうございます', 'その発想はなかった', 'ナイス！', 'がんばれー',
+    'BGMなんて曲ですか？', '次の配信も楽しみにしています', 'それな', 'なるほどね', 'いいね', 'マジか'
+  ]
+
+  # 連投されやすいコメント
+  FLOOD_TEXTS = ['草', '888', 'ｗｗｗ', 'www', 'かわいい', '！？', '🎉🎉🎉', 'おつ']
+
+  # 日本語以外のコメント
+  MULTILINGUAL_TEXTS = [
+    'hello', 'lol', 'so cute', 'nice play', 'good morning from brazil', 'first time here',
+    '안녕하세요', '귀여워', '你好', '太可爱了', 'hola', 'que bonito', 'bonjour', 'привет'
+  ]
+
+  # NGコメントの元になる文字列
+  NG_TEXTS = [
+    'チャンネル登録お願いします', '副業で稼げる方法を教えます', 'プロフィール見てください', 'ここで無料で見られます',
+    'check my channel', 'free gift card here', '詳しくはDMで', '稼げるアプリ紹介'
+  ]
+
+  def __init__(self, seed=0):
+    self.random = random.Random(seed)
+
+  def generate_channel_ids(self, count):
+    return ['UC' + ''.join(self.random.choice('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_') for _ in range(22)) \
+      for _ in range(count)]
+
+  def generate_ng_patterns(self, count):
+    """
+    NGパターンを生成する。元になる文字列に数字や記号を付けて重複しないようにする。
+    """
+    patterns = []
+    for i in range(count):
+      base = self.NG_TEXTS[i % len(self.NG_TEXTS)]
+      patterns.append(base if i < len(self.NG_TEXTS) else base + str(i))
+    return patterns
+
+  def generate_message(self, ng_patterns, ng_ratio):
+    rand = self.random.random()
+    if rand < ng_ratio and len(ng_patterns) > 0:
+      # NGパターンを少し変化させたコメント
+      return self.random.choice(ng_patterns) + self.random.choice(['', '！', 'です', 'ｗ', '!!'])
+    rand = self.random.random()
+    if rand < 0.35:
+      return self.random.choice(self.FLOOD_TEXTS) * self.random.randint(1, 5)
+    if rand < 0.8:
+      texts = self.random.sample(self.JAPANESE_TEXTS, self.random.randint(1, 3))
+      return ''.join(texts)
+    if rand < 0.97:
+      return self.random.choice(self.MULTILINGUAL_TEXTS)
+    # WARN判定される長いコメント
+    return ''.join(self.random.choice(self.JAPANESE_TEXTS) for _ in range(30))
+
+  def generate_comment(self, comment_id, channel_id, published_at, message):
+    event_type = self.random.choices([e[0] for e in self.EVENT_WEIGHTS], [e[1] for e in self.EVENT_WEIGHTS])[0]
+    snippet = {
+      'type': event_type,
+      'liveChatId': 'benchmark',
+      'authorChannelId': channel_id,
+      'publishedAt': published_at,
+      'hasDisplayContent': True,
+      'displayMessage': message
+    }
+    if event_type == 'textMessageEvent':
+      snippet['textMessageDetails'] = {'messageText': message}
+    elif event_type == 'superChatEvent':
+      snippet['superChatDetails'] = {'amountMicros': '1000000000', 'currency': 'JPY', 'amountDisplayString': '￥1,000', 'tier': 2}
+      if self.random.random() < 0.8:
+        snippet['superChatDetails']['userComment'] = message
+    elif event_type == 'superStickerEvent':
+      snippet['superStickerDetails'] = {
+        'superStickerMetadata': {'stickerId': 'sticker', 'altText': message, 'language': 'ja'},
+        'amountMicros': '200000000', 'currency': 'JPY', 'amountDisplayString': '￥200', 'tier': 1
+      }
+    elif event_type == 'newSponsorEvent':
+      snippet['displayMessage'] = 'メンバーになりました'
+    return {
+      'kind': 'youtube#liveChatMessage',
+      'etag': 'etag' + comment_id,
+      'id': comment_id,
+      'snippet': snippet,
+      'authorDetails': {
+        'channelId': channel_id,
+        'channelUrl': 'http://www.youtube.com/channel/' + channel_id,
+        'displayName': 'user_' + channel_id[2:8],
+        'profileImageUrl': 'https://yt3.ggpht.com/' + channel_id,
+        'isVerified': False,
+        'isChatOwner': False,
+        'isChatSponsor': self.random.random() < 0.1,
+        'isChatModerator': False
+      }
+    }
+
+  def generate(self, base_dir, video_id, comment_count, page_size, author_count, ng_channel_count, ng_pattern_count, ng_ratio):
+    """
+    base_dir配下にinput, outputディレクトリを作成し、データを配置する。
+
+    Returns:
+    ----
+    ng_patterns : list[string]
+      NGパターン。形態素解析結果のファイルは呼び出し元で作成する。
+    """
+    comment_dir = os.path.join(base_dir, 'input', 'comment', video_id)
+    os.makedirs(comment_dir, exist_ok=True)
+    for sub_dir in ['ng_channel', 'ng_comment', 'ng_pattern']:
+      os.makedirs(os.path.join(base_dir, 'input', sub_dir), exist_ok=True)
+    for sub_dir in ['all', 'ng_channel', 'ok_message', 'ng_message', 'warn_message', 'cache']:
+      os.makedirs(os.path.join(base_dir, 'output', sub_dir), exist_ok=True)
+
+    authors = self.generate_channel_ids(author_count)
+    ng_channels = self.random.sample(authors, min(ng_channel_count, len(authors)))
+    # 配信者以外のNGチャンネルも含める。
+    ng_channels += self.generate_channel_ids(max(0, ng_channel_count - len(ng_channels)))
+    with open(os.path.join(base_dir, 'input', 'ng_channel', 'ng_channel.txt'), mode='w') as f:
+      for channel_id in ng_channels:
+        f.write('http://www.youtube.com/channel/' + channel_id + '\n')
+
+    ng_patterns = self.generate_ng_patterns(ng_pattern_count)
+    with open(os.path.join(base_dir, 'input', 'ng_comment', 'ng_comment.txt'), encoding='utf-8', mode='w') as f:
+      for ng_pattern in ng_patterns:
+        f.write(ng_pattern + '\n')
+
+    for page in range((comment_count + page_size - 1) // page_size):
+      items = []
+      for i in range(page * page_size, min(comment_count, (page + 1) * page_size)):
+        published_at = '2022-01-01T{:02d}:{:02d}:{:02d}.000000+00:00'.format(i // 3600 % 24, i // 60 % 60, i % 60)
+        message = self.generate_message(ng_patterns, ng_ratio)
+        items.append(self.generate_comment('comment{:08d}'.format(i), self.random.choice(authors), published_at, message))
+      with open(os.path.join(comment_dir, 'page{:06d}.json'.format(page)), encoding='utf-8', mode='w') as f:
+        json.dump({'kind': 'youtube#liveChatMessageListResponse', 'etag': 'etag', 'items': items}, f)
+    return ng_patterns
+
+def write_ng_pattern_files(base_dir, ng_patterns):
+  """
+  NGパターンを形態素解析し、input/ng_pattern配下に配置する。
+  """
+  from tagger import TaggerEngine
+  from judgement import UseMPLGJudegement
+  engine = TaggerEngine.get_engine(UseMPLGJudegement.DIC_PATH)
+  for i, soup in enumerate(engine.parse_many(ng_patterns)):
+    with open(os.path.join(base_dir, 'input', 'ng_pattern', 'pattern{:06d}.txt'.format(i)), mode='w') as f:
+      f.write(soup)
+
+def run_stages(judgement_class, video_id, threshold):
+  """
+  JudgementInterface.execを段階ごとに分けて実行し、それぞれの処理時間を計測する。
+
+  Returns:
+  ----
+  stages : dict
+    key : 段階名
+    value : 処理時間（秒）
+  counts : dict
+    判定結果の件数
+  """
+  from judgement import JudgementInterface
+  from writer import ResultListWriter, ResultWriter
+
+  stages = {}
+  def measure(name, function):
+    start = time.perf_counter()
+    result = function()
+    stages[name] = time.perf_counter() - start
+    return result
+
+  judgement = measure('setup', lambda: judgement_class(video_id, threshold))
+  live_comments = measure('ingestion', lambda: judgement.import_live_comments(video_id))
+  measure('load_ng', judgement.prepare)
+  pickup_comments = measure('mplg', lambda: judgement.pickup_comment(live_comments))
+  measure('get_lang', lambda: [JudgementInterface.get_lang(pickup_comments[key]) for key in pickup_comments])
+  measure('judgement_by_pattern', lambda: [ \
+    judgement.judgement_by_pattern(pickup_comments[key], judgement.ng_pattern_index, threshold) for key in pickup_comments])
+  # 判定結果の作成（言語判定とNGパターンによる判定を含む）
+  judged_ng_comments, judged_warn_comments = measure('judge_comments', lambda: judgement.judge_comments(live_comments))
+  measure('merge_comments', lambda: judgement.merge_comments(live_comments, judged_ng_comments, judged_warn_comments))
+
+  def output():
+    writer = ResultWriter(video_id)
+    judgement.write_comments(writer, live_comments, judged_ng_comments, judged_warn_comments)
+    writer.write_ng_channels(judgement.get_result_ng_channels())
+    writer.close()
+    return writer.get_counts()
+  counts = measure('output', output)
+  return stages, counts
+
+def measure_peak_memory(judgement_class, video_id, threshold):
+  """
+  判定からファイル出力までのPythonのメモリ使用量のピーク（バイト）を計測する。
+  """
+  from writer import ResultWriter
+  tracemalloc.start()
+  try:
+    judgement = judgement_class(video_id, threshold)
+    writer = ResultWriter(video_id)
+    judgement.exec(writer)
+    writer.write_ng_channels(judgement.get_result_ng_channels())
+    writer.close()
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+def measure_startup(app_dir, class_name, video_id, threshold, budget):
+  """
+  新しいプロセスで判定モジュールを読み込み、判定インスタンスを生成するまでの時間を計測する。
+
+  Returns:
+  ----
+  startup : dict
+    process : プロセスの起動から終了までの時間（秒）
+    import : モジュールの読み込み時間（秒）
+    setup : 判定インスタンスの生成時間（秒）
+    budget : 起動時間の目標（秒）
+    within_budget : processが目標以下かどうか
+  """
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.pathsep.join([app_dir] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+  start = time.perf_counter()
+  completed = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, class_name, video_id, str(threshold)], \
+    env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+  process_time = time.perf_counter() - start
+  import_time, setup_time = [float(value) for value in completed.stdout.split()[-2:]]
+  return {
+    'process': process_time,
+    'import': import_time,
+    'setup': setup_time,
+    'budget': budget,
+    'within_budget': process_time <= budget
+  }
+
+def run_benchmark(args):
+  """
+  ベンチマークを実行し、結果をdictで返す。
+  """
+  app_dir = os.path.dirname(os.path.abspath(__file__))
+  base_dir = tempfile.mkdtemp(prefix='benchmark_')
+  video_id = 'benchmark'
+  cwd = os.getcwd()
+  result = {
+    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'parameters': {
+      'comments': args.comments,
+      'page_size': args.page_size,
+      'authors': args.authors,
+      'ng_channels': args.ng_channels,
+      'ng_patterns': args.ng_patterns,
+      'ng_ratio': args.ng_ratio,
+      'threshold': args.threshold,
+      'seed': args.seed,
+      'startup_budget': args.startup_budget
+    },
+    'results': []
+  }
+  try:
+    generator = SyntheticLiveChatGenerator(args.seed)
+    ng_patterns = generator.generate(base_dir, video_id, args.comments, args.page_size, \
+      args.authors, args.ng_channels, args.ng_patterns, args.ng_ratio)
+    shutil.copy(os.path.join(app_dir, 'input', 'lang_len.tsv'), os.path.join(base_dir, 'input', 'lang_len.tsv'))
+    shutil.copy(os.path.join(app_dir, 'log_config.json'), os.path.join(base_dir, 'log_config.json'))
+    os.makedirs(os.path.join(base_dir, 'log'), exist_ok=True)
+    os.chdir(base_dir)
+
+    for class_name in args.classes:
+      class_result = {'class': class_name}
+      try:
+        import judgement
+        judgement_class = getattr(judgement, class_name)
+        # 言語判定ライブラリ, MeCabは初めて使うときに読み込むので、ここで読み込めるか確認する。
+        judgement.JudgementInterface.load_lang_detector()
+        if class_name == 'UseMPLGJudegement':
+          write_ng_pattern_files(base_dir, ng_patterns)
+      except ImportError as e:
+        # MeCab, pycld2がインストールされていない環境
+        class_result['skipped'] = str(e)
+        result['results'].append(class_result)
+        logger.info("skip {} : {}".format(class_name, e))
+        continue
+
+      class_result['startup'] = measure_startup(app_dir, class_name, video_id, args.threshold, args.startup_budget)
+      logger.info("{} startup : {:.3f} sec".format(class_name, class_result['startup']['process']))
+      if not class_result['startup']['within_budget']:
+        logger.warning("{} startup exceeds budget : {:.3f} sec > {:.3f} sec".format( \
+          class_name, class_result['startup']['process'], args.startup_budget))
+
+      stages, counts = run_stages(judgement_class, video_id, args.threshold)
+      # judge_commentsは言語判定, 形態素解析済みコメントのNG判定を含むので、合計からは除外する。
+      total = sum(stages[name] for name in stages if name not in ('get_lang', 'judgement_by_pattern'))
+      class_result['stages'] = stages
+      class_result['total'] = total
+      class_result['comments_per_second'] = args.comments / total if total > 0 else 0.0
+      class_result['counts'] = counts
+      if not args.no_memory:
+        class_result['peak_memory_bytes'] = measure_peak_memory(judgement_class, video_id, args.threshold)
+      result['results'].append(class_result)
+      logger.info("{} : {:.1f} comments/sec".format(class_name, class_result['comments_per_second']))
+  finally:
+    os.chdir(cwd)
+    if args.keep:
+      logger.info("benchmark data : {}".format(base_dir))
+    else:
+      shutil.rmtree(base_dir, ignore_errors=True)
+  return result
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description='判定処理のベンチマーク')
+  parser.add_argument('--comments', type=int, default=10000, help='コメント数')
+  parser.add_argument('--page-size', type=int, default=200, help='1ファイルあたりのコメント数')
+  parser.add_argument('--authors', type=int, default=2000, help='コメントしたチャンネル数')
+  parser.add_argument('--ng-channels', type=int, default=1000, help='NGチャンネル数')
+  parser.add_argument('--ng-patterns', type=int, default=100, help='NGパターン数')
+  parser.add_argument('--ng-ratio', type=float, default=0.05, help='NGパターンに似せたコメントの割合')
+  parser.add_argument('--threshold', type=float, default=0.4, help='NG判定の類似度のしきい値')
+  parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+  parser.add_argument('--classes', nargs='+', default=JUDGEMENT_CLASS_NAMES, choices=JUDGEMENT_CLASS_NAMES, help='計測する判定クラス')
+  parser.add_argument('--startup-budget', type=float, default=1.0, help='起動時間の目標（秒）')
+  parser.add_argument('--no-memory', action='store_true', help='メモリ使用量を計測しない')
+  parser.add_argument('--keep', action='store_true', help='生成したデータを削除しない')
+  parser.add_argument('--output', default='./output/benchmark_result.json', help='計測結果の出力先')
+  return parser.parse_args(argv)
+
+if __name__ == '__main__':
+  args = parse_args()
+  logger.info("start.")
+  result = run_benchmark(args)
+  with open(args.output, encoding='utf-8', mode='w') as f:
+    f.write(json.dumps(result, indent=2))
+  logger.info("result : {}".format(args.output))
+  logger.info("finish.")
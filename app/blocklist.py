@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+from datetime import datetime, timezone
+import os
+import marshal
+import threading
+
+import sys
+sys.path.append('./')
+from util import FileUtil
+
+logger = getLogger("same_hierarchy")
+
+class ChannelBlocklist():
+  """
+  NGチャンネル一覧。
+  チャンネルURLはチャンネルIDに正規化し、ハッシュ集合で保持する。（判定は定数時間）
+  読み込み結果はoutput/cache配下に保存し、NGチャンネル一覧のファイルが変わっていなければ次回はそれを読み込む。
+  """
+
+  # チャンネルURLのうち、チャンネルIDの直前の文字列
+  CHANNEL_URL_SEPARATOR = '/channel/'
+
+  # 読み込み結果の保存先
+  INDEX_PATH = './output/cache/ng_channel.index'
+
+  def __init__(self, channel_ids):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    channel_ids : iterable
+      正規化済みのチャンネルID
+    """
+    self.channel_ids = frozenset(channel_ids)
+
+  def __contains__(self, channel_url):
+    return ChannelBlocklist.normalize(channel_url) in self.channel_ids
+
+  def __len__(self):
+    return len(self.channel_ids)
+
+  def union(self, channel_ids):
+    """
+    正規化済みのチャンネルIDを追加したChannelBlocklistを返す。
+    """
+    return ChannelBlocklist(self.channel_ids.union(channel_ids))
+
+  @classmethod
+  def normalize(cls, channel):
+    """
+    チャンネルURLをチャンネルIDに正規化する。
+    http://www.youtube.com/channel/${チャンネルID} の形式でない場合は前後の空白を除いてそのまま返す。
+    """
+    channel = channel.strip()
+    position = channel.find(ChannelBlocklist.CHANNEL_URL_SEPARATOR)
+    if position >= 0:
+      channel = channel[position + len(ChannelBlocklist.CHANNEL_URL_SEPARATOR):].rstrip('/')
+    return channel
+
+  @classmethod
+  def load(cls, path, index_path=INDEX_PATH):
+    """
+    指定されたディレクトリ配下のNGチャンネル一覧を読み込む。
+
+    Parameters:
+    ----
+    path : string
+      NGチャンネル一覧のファイルを配置しているディレクトリパス。.gitkeepは除外。
+    index_path : string
+      読み込み結果の保存先。Noneの場合は保存しない。
+
+    Returns:
+    ----
+    blocklist : ChannelBlocklist
+    """
+    files = FileUtil.list_files(path)
+    fingerprint = FileUtil.get_fingerprint(files)
+    if index_path is not None and os.path.isfile(index_path):
+      try:
+        with open(index_path, mode='rb') as f:
+          index_fingerprint, channel_ids = marshal.load(f)
+        if index_fingerprint == fingerprint:
+          logger.info("ng_channel index loaded : {}".format(index_path))
+          return ChannelBlocklist(channel_ids)
+      except (EOFError, ValueError, TypeError):
+        logger.info("ng_channel index is broken : {}".format(index_path))
+
+    channel_ids = set()
+    for file in files:
+      with open(file, mode='r') as f:
+        for line in f:
+          channel_id = ChannelBlocklist.normalize(line)
+          if channel_id != '':
+            channel_ids.add(channel_id)
+    blocklist = ChannelBlocklist(channel_ids)
+
+    if index_path is not None:
+      os.makedirs(os.path.dirname(index_path), exist_ok=True)
+      # 書き込み途中のファイルを読み込まないように、別名で書き込んでから置き換える。
+      tmp_path = index_path + '.' + str(os.getpid())
+      with open(tmp_path, mode='wb') as f:
+        marshal.dump((fingerprint, blocklist.channel_ids), f)
+      os.replace(tmp_path, index_path)
+    return blocklist
+
+class ChannelBlocklistStore():
+  """
+  動画をまたいでNGになったチャンネルを蓄積するNGチャンネル一覧。
+  チャンネルIDごとに、最初にNGになった動画ID, 日時と、NGになった回数（追記した動画の数）を保持する。
+
+  NGになったチャンネルはログ(LOG_FILE)の末尾に追記するだけで、追記する量は新しくNGになったチャンネル数に比例する。
+  ログを集計した結果はインデックス(INDEX_FILE)に保存し、読み込み時はインデックスと、その後に追記されたログだけを読む。
+  インデックス保存後のログがCOMPACT_LINES行を超えたら、インデックスを保存し直す。
+  ログは削除も書き換えもしないので、複数のプロセスが同時に追記, 読み込みをしてもよい。
+  """
+
+  MODES = ['none', 'write', 'merge']
+
+  # 保存先のディレクトリ
+  STORE_DIR = './output/blocklist/'
+  LOG_FILE = 'ng_channel.log'
+  INDEX_FILE = 'ng_channel.index'
+
+  # インデックス保存後のログがこの行数を超えたら、インデックスを保存し直す。
+  COMPACT_LINES = 10000
+
+  def __init__(self, mode, path=STORE_DIR):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    mode : string
+      write : 判定でNGになったチャンネルを蓄積する。
+      merge : 蓄積したチャンネルを、NGチャンネル一覧に加えて判定にも使う。
+    path : string
+      保存先のディレクトリ
+    """
+    if mode not in ChannelBlocklistStore.MODES or mode == 'none':
+      raise ValueError('ng_channel store mode must be one of {} : {}'.format(ChannelBlocklistStore.MODES[1:], mode))
+    self.mode = mode
+    self.log_path = os.path.join(path, ChannelBlocklistStore.LOG_FILE)
+    self.index_path = os.path.join(path, ChannelBlocklistStore.INDEX_FILE)
+    # 読み込み済みの集計結果
+    # key : チャンネルID
+    # value : [最初にNGになった動画ID, 日時, NGになった回数]
+    self.entries = None
+    # 集計済みのログの位置（バイト）と、インデックス保存後に集計したログの行数
+    self.offset = 0
+    self.pending_lines = 0
+    # このインスタンスで追記した行数（インデックスを保存し直すかどうかの確認用）
+    self.appended_lines = 0
+    # 判定のスレッドでの追記と、NGDataReloaderのスレッドでの読み込みを同時に行わないためのロック
+    self.lock = threading.RLock()
+
+  @classmethod
+  def create(cls, mode, path=STORE_DIR):
+    """
+    .envで指定したモードのChannelBlocklistStoreを返す。noneの場合はNoneを返す。
+    """
+    if mode not in ChannelBlocklistStore.MODES:
+      raise ValueError('ng_channel store mode must be one of {} : {}'.format(ChannelBlocklistStore.MODES, mode))
+    return None if mode == 'none' else ChannelBlocklistStore(mode, path)
+
+  def is_merged(self):
+    """
+    蓄積したチャンネルを判定に使うかどうか。
+    """
+    return self.mode == 'merge'
+
+  def load(self):
+    """
+    インデックスと、インデックス保存後に追記されたログを読み込む。2回目以降は前回以降に追記されたログだけを読む。
+    インデックス保存後のログがCOMPACT_LINES行を超えた場合は、インデックスを保存し直す。
+
+    Returns:
+    ----
+    entries : dict
+      key : チャンネルID
+      value : [最初にNGになった動画ID, 日時, NGになった回数]
+    """
+    with self.lock:
+      if self.entries is None:
+        self.entries = {}
+        self.offset = 0
+        if os.path.isfile(self.index_path):
+          try:
+            with open(self.index_path, mode='rb') as f:
+              self.offset, self.entries = marshal.load(f)
+          except (EOFError, ValueError, TypeError):
+            logger.info("ng_channel store index is broken : {}".format(self.index_path))
+            self.entries = {}
+            self.offset = 0
+        self.pending_lines = 0
+
+      if not os.path.isfile(self.log_path):
+        return self.entries
+      with open(self.log_path, mode='rb') as f:
+        f.seek(self.offset)
+        data = f.read()
+      # 他のプロセスが書き込み途中の行は、次回読み込む。
+      end = data.rfind(b'\n') + 1
+      skipped_lines = 0
+      for line in data[:end].splitlines():
+        values = ChannelBlocklistStore.parse_line(line)
+        if values is None:
+          skipped_lines += 1
+          continue
+        channel_id, video_id, first_seen = values
+        entry = self.entries.get(channel_id)
+        if entry is None:
+          self.entries[channel_id] = [video_id, first_seen, 1]
+        else:
+          entry[2] += 1
+        self.pending_lines += 1
+      self.offset += end
+      if skipped_lines > 0:
+        logger.info("ng_channel store skipped malformed lines : {}, {} lines".format(self.log_path, skipped_lines))
+      if self.pending_lines > ChannelBlocklistStore.COMPACT_LINES:
+        self.compact()
+      return self.entries
+
+  @classmethod
+  def parse_line(cls, line):
+    """
+    ログの1行を読み込む。
+
+    Parameters:
+    ----
+    line : bytes
+      改行を含まないログの1行
+
+    Returns:
+    ----
+    values : tuple or None
+      (チャンネルID, 動画ID, 日時)。書き込みが途切れた行などで形式が正しくない場合はNoneを返す。
+    """
+    try:
+      values = line.decode('utf-8').split('\t')
+    except UnicodeDecodeError:
+      return None
+    if len(values) != 3 or values[0] == '' or values[1] == '':
+      return None
+    try:
+      datetime.fromisoformat(values[2])
+    except ValueError:
+      return None
+    return tuple(values)
+
+  def get_channel_ids(self):
+    """
+    蓄積したチャンネルIDの一覧を返す。
+    """
+    with self.lock:
+      return list(self.load())
+
+  def append(self, video_id, channel_urls):
+    """
+    NGになったチャンネルを追記する。同じ動画で同じチャンネルは1回だけ数える。
+
+    Parameters:
+    ----
+    video_id : string
+      動画ID
+    channel_urls : list[string]
+      NGになったチャンネルURL
+    """
+    channel_ids = list(dict.fromkeys(ChannelBlocklist.normalize(channel_url) for channel_url in channel_urls))
+    channel_ids = [channel_id for channel_id in channel_ids if channel_id != '']
+    if not channel_ids:
+      return
+    first_seen = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    data = ''.join('{}\t{}\t{}\n'.format(channel_id, video_id, first_seen) for channel_id in channel_ids).encode('utf-8')
+    os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+    # 複数プロセスから追記しても行が混ざらないように、まとめてwriteで書き込む。
+    # 一部しか書き込めなかった場合は残りを書き込む。（行が混ざった場合は、読み込み時に読み飛ばす）
+    fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+      view = memoryview(data)
+      while len(view) > 0:
+        written = os.write(fd, view)
+        if written <= 0:
+          raise OSError('failed to append ng_channel store : {}'.format(self.log_path))
+        view = view[written:]
+    finally:
+      os.close(fd)
+
+    with self.lock:
+      self.appended_lines += len(channel_ids)
+      if self.appended_lines > ChannelBlocklistStore.COMPACT_LINES:
+        self.appended_lines = 0
+        self.load()
+
+  def compact(self):
+    """
+    読み込み済みの集計結果をインデックスに保存する。
+    """
+    entries = self.entries
+    # 書き込み途中のファイルを読み込まないように、別名で書き込んでから置き換える。
+    tmp_path = self.index_path + '.' + str(os.getpid())
+    with open(tmp_path, mode='wb') as f:
+      marshal.dump((self.offset, entries), f)
+    os.replace(tmp_path, self.index_path)
+    self.pending_lines = 0
+    logger.info("ng_channel store compacted : {} channels".format(len(entries)))
+
+  def get_stats(self):
+    with self.lock:
+      entries = self.load()
+      return {
+        'mode': self.mode,
+        'channels': len(entries),
+        'pending_lines': self.pending_lines
+      }
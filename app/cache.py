@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+import os
+import hashlib
+import json
+
+logger = getLogger("same_hierarchy")
+
+class JudgementCache():
+  """
+  判定結果のキャッシュ。output/cache配下のsqliteファイルに保存する。
+
+  下記をコメント本文のハッシュ値をキーにして保存する。
+    - 形態素解析結果
+    - 言語判定結果
+    - NGパターンによる判定結果（NGパターン一覧のフィンガープリント, しきい値も保存する）
+  NGパターンを追加, 削除した場合は、判定結果が変わり得るNGパターンとだけ比較し直す。
+  """
+
+  # キャッシュファイルのパス
+  CACHE_PATH = './output/cache/judgement_cache.sqlite3'
+
+  # 書き込み待ちの行がこの件数を超えたら書き込む。
+  WRITE_BATCH_SIZE = 1000
+
+  # テーブルごとの書き込み用SQL
+  WRITE_SQL = {
+    'mplg': 'INSERT OR REPLACE INTO mplg VALUES (?, ?)',
+    'lang': 'INSERT OR REPLACE INTO lang VALUES (?, ?)',
+    'pattern_set': 'INSERT OR IGNORE INTO pattern_set VALUES (?, ?)',
+    'pattern_result': 'INSERT OR REPLACE INTO pattern_result VALUES (?, ?, ?, ?, ?)'
+  }
+
+  def __init__(self, path=CACHE_PATH):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    path : string
+      キャッシュファイルのパス
+    """
+    self.path = path
+    dir_name = os.path.dirname(path)
+    if dir_name != '':
+      os.makedirs(dir_name, exist_ok=True)
+    # キャッシュを使用しない場合は読み込まないように、ここで読み込む。
+    import sqlite3
+    # 複数プロセスから書き込む場合があるので、ロック待ちを長めにする。
+    # 書き込みのロックを持ち続けないように自動のトランザクションは使わず、commitでまとめて書き込むときだけトランザクションを開始する。
+    self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+    self.connection.execute('PRAGMA journal_mode=WAL')
+    self.connection.execute('CREATE TABLE IF NOT EXISTS mplg (text_hash TEXT PRIMARY KEY, result TEXT)')
+    self.connection.execute('CREATE TABLE IF NOT EXISTS lang (text_hash TEXT PRIMARY KEY, lang TEXT)')
+    self.connection.execute('CREATE TABLE IF NOT EXISTS pattern_set (fingerprint TEXT PRIMARY KEY, pattern_hashes TEXT)')
+    self.connection.execute( \
+      'CREATE TABLE IF NOT EXISTS pattern_result (' \
+      'text_hash TEXT, threshold REAL, fingerprint TEXT, pattern_hash TEXT, similarity REAL, ' \
+      'PRIMARY KEY (text_hash, threshold))')
+
+    # 書き込み待ちの行。テーブルごとに主キーで上書きする。
+    # key : テーブル名
+    # value : dict (key : 主キー, value : 行)
+    self.pending_rows = {table: {} for table in JudgementCache.WRITE_SQL}
+    self.pending_count = 0
+
+    # 比較し直すNGパターンの位置
+    # key : (キャッシュ保存時のフィンガープリント, 現在のフィンガープリント)
+    # value : get_pattern_diffの戻り値
+    self.pattern_diff = {}
+    # NGになったNGパターンより前にある、比較し直すNGパターンの位置
+    # key : (キャッシュ保存時のフィンガープリント, 現在のフィンガープリント, NGになったNGパターンのハッシュ値)
+    # value : set[int]
+    self.recheck_positions = {}
+    # NGパターンのハッシュ値から現在の位置を求める辞書
+    # key : 現在のフィンガープリント
+    self.pattern_positions = {}
+
+    # 計測値
+    self.hit_count = {'mplg': 0, 'lang': 0, 'pattern': 0, 'pattern_partial': 0}
+    self.miss_count = {'mplg': 0, 'lang': 0, 'pattern': 0}
+
+  def __getstate__(self):
+    # ワーカープロセスにはパスだけ渡し、接続し直す。
+    return {'path': self.path}
+
+  def __setstate__(self, state):
+    self.__init__(state['path'])
+
+  @classmethod
+  def get_text_hash(cls, text, option=''):
+    return hashlib.sha1((option + '\0' + text).encode('utf-8')).hexdigest()
+
+  def get_mplg_many(self, texts, option, parse_many):
+    """
+    まとめて形態素解析する。キャッシュにない文字列だけparse_manyで解析する。
+
+    Parameters:
+    ----
+    texts : list[string]
+      対象の文字列の配列
+    option : string
+      MeCab.Taggerに渡す引数。辞書が異なる場合は別のキーになる。
+    parse_many : function
+      キャッシュにない文字列の配列を受け取り、形態素解析結果の配列を返す関数
+
+    Returns:
+    ----
+    list[string] : 形態素解析結果の配列。引数と同じ順序で返す。
+    """
+    text_hashes = [JudgementCache.get_text_hash(text, option) for text in texts]
+    results = [self.select_one('mplg', 'SELECT result FROM mplg WHERE text_hash = ?', text_hash) for text_hash in text_hashes]
+    misses = [i for i in range(len(texts)) if results[i] is None]
+    self.hit_count['mplg'] += len(texts) - len(misses)
+    self.miss_count['mplg'] += len(misses)
+    if len(misses) > 0:
+      parsed = parse_many([texts[i] for i in misses])
+      for i, result in zip(misses, parsed):
+        results[i] = result
+        self.write('mplg', text_hashes[i], (text_hashes[i], result))
+    return results
+
+  def get_lang(self, text, get_lang):
+    """
+    言語判定する。キャッシュにない場合はget_langで判定する。
+    """
+    text_hash = JudgementCache.get_text_hash(text)
+    lang = self.select_one('lang', 'SELECT lang FROM lang WHERE text_hash = ?', text_hash)
+    if lang is not None:
+      self.hit_count['lang'] += 1
+      return lang
+    self.miss_count['lang'] += 1
+    lang = get_lang(text)
+    self.write('lang', text_hash, (text_hash, lang))
+    return lang
+
+  def search_pattern(self, comment, ng_pattern_index, threshold):
+    """
+    NGパターンによる判定。NGPatternIndex.searchと同じ値を返す。
+
+    キャッシュ保存時からNGパターン一覧が変わっている場合は、下記だけ比較し直す。
+      - キャッシュ保存時にNGではなかった場合
+        新しく追加されたNGパターン
+      - キャッシュ保存時にNGだった場合（NGになったNGパターンが残っている場合）
+        そのNGパターンより前にあるNGパターンのうち、
+        新しく追加されたNGパターンと、キャッシュ保存時にはそのNGパターンより後ろにあったNGパターン
+
+    Parameters:
+    ----
+    comment : string
+      コメント本体 or コメントの形態素解析結果
+    ng_pattern_index : NGPatternIndex
+      NGパターンのインデックス
+    threshold : float
+      NG判定のしきい値
+
+    Returns:
+    ----
+    result : tuple or None
+      NG判定された場合、(NG判定されたときに返す値, 類似度)を返す。
+      NG判定されなかった場合、Noneを返す。
+    """
+    text_hash = JudgementCache.get_text_hash(comment)
+    fingerprint = ng_pattern_index.get_fingerprint()
+    pattern_hashes = ng_pattern_index.get_pattern_hashes()
+    if fingerprint not in self.pattern_positions:
+      self.pattern_positions[fingerprint] = {}
+      for i, pattern_hash in enumerate(pattern_hashes):
+        self.pattern_positions[fingerprint].setdefault(pattern_hash, i)
+    pattern_positions = self.pattern_positions[fingerprint]
+    pending_row = self.pending_rows['pattern_result'].get((text_hash, threshold))
+    if pending_row is not None:
+      row = pending_row[2:]
+    else:
+      row = self.connection.execute( \
+        'SELECT fingerprint, pattern_hash, similarity FROM pattern_result WHERE text_hash = ? AND threshold = ?', \
+        (text_hash, threshold)).fetchone()
+
+    result = None
+    if row is not None and row[0] == fingerprint:
+      self.hit_count['pattern'] += 1
+      if row[1] is not None:
+        result = (pattern_positions[row[1]], row[2])
+    else:
+      diff = None if row is None else self.get_pattern_diff(row[0], ng_pattern_index)
+      if diff is None:
+        self.miss_count['pattern'] += 1
+        result = ng_pattern_index.search_position(comment, threshold)
+      else:
+        self.hit_count['pattern_partial'] += 1
+        added_positions, old_positions = diff
+        if row[1] is None:
+          result = ng_pattern_index.search_position(comment, threshold, added_positions)
+        elif row[1] in pattern_positions:
+          position = pattern_positions[row[1]]
+          recheck_key = (row[0], fingerprint, row[1])
+          if recheck_key not in self.recheck_positions:
+            old_position = old_positions[row[1]]
+            self.recheck_positions[recheck_key] = set([i for i in range(position) \
+              if pattern_hashes[i] not in old_positions or old_positions[pattern_hashes[i]] > old_position])
+          positions = self.recheck_positions[recheck_key]
+          result = ng_pattern_index.search_position(comment, threshold, positions)
+          if result is None:
+            result = (position, row[2])
+        else:
+          # NGになったNGパターンが削除されている。
+          self.miss_count['pattern'] += 1
+          result = ng_pattern_index.search_position(comment, threshold)
+
+    if row is None or row[0] != fingerprint:
+      self.write('pattern_result', (text_hash, threshold), ( \
+        text_hash, threshold, fingerprint, \
+        None if result is None else pattern_hashes[result[0]], \
+        None if result is None else result[1]))
+
+    if result is None:
+      return None
+    return ng_pattern_index.values[result[0]], result[1]
+
+  def get_pattern_diff(self, old_fingerprint, ng_pattern_index):
+    """
+    キャッシュ保存時のNGパターン一覧と、現在のNGパターン一覧の差分を返す。
+    キャッシュ保存時のNGパターン一覧が分からない場合はNoneを返す。
+
+    Returns:
+    ----
+    added_positions : set[int]
+      新しく追加されたNGパターンの位置
+    old_positions : dict
+      key : NGパターンのハッシュ値
+      value : キャッシュ保存時のNGパターンの位置
+    """
+    key = (old_fingerprint, ng_pattern_index.get_fingerprint())
+    if key not in self.pattern_diff:
+      old_pattern_hashes = self.select_one('pattern_set', 'SELECT pattern_hashes FROM pattern_set WHERE fingerprint = ?', old_fingerprint)
+      if old_pattern_hashes is None:
+        self.pattern_diff[key] = None
+      else:
+        old_positions = {pattern_hash: i for i, pattern_hash in enumerate(json.loads(old_pattern_hashes))}
+        added_positions = set([i for i, pattern_hash in enumerate(ng_pattern_index.get_pattern_hashes()) \
+          if pattern_hash not in old_positions])
+        self.pattern_diff[key] = (added_positions, old_positions)
+    return self.pattern_diff[key]
+
+  def save_pattern_set(self, ng_pattern_index):
+    """
+    NGパターン一覧を保存する。次回以降の実行で差分を求めるために使う。
+    """
+    fingerprint = ng_pattern_index.get_fingerprint()
+    self.pending_rows['pattern_set'].setdefault(fingerprint, (fingerprint, json.dumps(ng_pattern_index.get_pattern_hashes())))
+    self.pending_count += 1
+    self.commit()
+
+  def select_one(self, table, sql, key):
+    """
+    1行読み込み、先頭の値を返す。書き込み待ちの行があればそちらを返す。
+    """
+    pending_row = self.pending_rows[table].get(key)
+    if pending_row is not None:
+      return pending_row[1]
+    row = self.connection.execute(sql, (key,)).fetchone()
+    return None if row is None else row[0]
+
+  def write(self, table, key, row):
+    """
+    書き込み待ちに追加する。WRITE_BATCH_SIZE件を超えたら書き込む。
+    """
+    self.pending_rows[table][key] = row
+    self.pending_count += 1
+    if self.pending_count >= JudgementCache.WRITE_BATCH_SIZE:
+      self.commit()
+
+  def commit(self):
+    """
+    書き込み待ちの行を1回のトランザクションで書き込む。
+    トランザクションは書き込む間だけなので、他のプロセスが書き込みのロックを待つ時間は短い。
+    """
+    if self.pending_count == 0:
+      return
+    self.connection.execute('BEGIN IMMEDIATE')
+    try:
+      for table, rows in self.pending_rows.items():
+        if rows:
+          self.connection.executemany(JudgementCache.WRITE_SQL[table], list(rows.values()))
+      self.connection.execute('COMMIT')
+    except Exception:
+      self.connection.execute('ROLLBACK')
+      raise
+    for rows in self.pending_rows.values():
+      rows.clear()
+    self.pending_count = 0
+
+  def get_stats(self):
+    """
+    キャッシュのヒット数とミス数を返す。
+    """
+    return {'hit': dict(self.hit_count), 'miss': dict(self.miss_count)}
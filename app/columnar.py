@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+import time
+
+import sys
+sys.path.append('./')
+from commentutil import AddNGInfoKeyEnum, AddWarnInfoKeyEnum, CommentTypeEnum, OutputCommentKeyEnum
+
+# インストールされている場合は、Parquet形式で出力する。
+# 読み込みに時間がかかるため、列形式で出力する場合だけ読み込む。(import_pyarrow)
+pyarrow = None
+
+def import_pyarrow():
+  """
+  pyarrowを読み込む。インストールされていない場合はNoneを返す。
+  """
+  global pyarrow
+  if pyarrow is None:
+    try:
+      import pyarrow
+      import pyarrow.parquet
+    except ImportError:
+      return None
+  return pyarrow
+
+class ColumnarWriter():
+  """
+  判定結果をコメント1件1行の列形式で書き込む。集計用にGoogleAPIのコメントjson全体は出力しない。
+
+  formatがparquetの場合はParquet形式(.parquet)で書き込む。ROW_GROUP_SIZE件ごとにまとめて書き込むので、全件をメモリに保持しない。
+  formatがcsvの場合はCSV形式(.csv)で書き込み、列の型を同じ名前の.schema.jsonに出力する。
+  """
+
+  FORMATS = ['none', 'auto', 'parquet', 'csv']
+
+  # (列名, 型)の配列
+  COLUMNS = [
+    ('id', 'string'),
+    ('channelId', 'string'),
+    ('displayName', 'string'),
+    ('message', 'string'),
+    # ok, ng, warn
+    ('verdict', 'string'),
+    # WARN判定された場合の言語。言語判定しなかった場合は空。
+    ('lang', 'string'),
+    # 判定対象のメッセージの文字列長
+    ('length', 'int64'),
+    # NGパターンとの類似度。NGパターンでNG判定されなかった場合は空。
+    ('similarity', 'float64'),
+    # NG判定されたNGパターン
+    ('pattern', 'string'),
+    # どのチェックで引っかかったか(ng_pattern, warn_pattern)をカンマ区切りにしたもの
+    ('judgement_patterns', 'string')
+  ]
+
+  # Parquet形式で一度に書き込む行数
+  ROW_GROUP_SIZE = 10000
+
+  def __init__(self, path, format):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    path : string
+      拡張子を除いた出力先のパス
+    format : string
+      parquet or csv
+    """
+    self.format = format
+    self.count = 0
+    # 書き込み時間の合計（秒）
+    self.write_time = 0.0
+    if format == 'parquet':
+      # 別プロセスで書き込む場合は、そのプロセスでまだ読み込んでいない。
+      import_pyarrow()
+      self.path = path + '.parquet'
+      self.schema = pyarrow.schema([(name, ColumnarWriter.get_arrow_type(type)) for name, type in ColumnarWriter.COLUMNS])
+      self.parquet_writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+      self.rows = []
+    else:
+      self.path = path + '.csv'
+      with open(path + '.schema.json', encoding='utf-8', mode='w') as f:
+        f.write(json.dumps(dict(ColumnarWriter.COLUMNS), indent=2))
+      self.file = open(self.path, encoding='utf-8', mode='w', newline='')
+      self.csv_writer = csv.writer(self.file)
+      self.csv_writer.writerow([name for name, _ in ColumnarWriter.COLUMNS])
+
+  @classmethod
+  def resolve_format(cls, format):
+    """
+    .envで指定した出力形式を、実際に出力する形式にする。
+
+    Parameters:
+    ----
+    format : string
+      none : 出力しない
+      auto : pyarrowがインストールされていればparquet, なければcsv
+      parquet : Parquet形式。pyarrowがインストールされていない場合はエラー
+      csv : CSV形式
+
+    Returns:
+    ----
+    format : string or None
+      parquet or csv。出力しない場合はNone。
+    """
+    if format not in ColumnarWriter.FORMATS:
+      raise ValueError('columnar format must be one of {} : {}'.format(ColumnarWriter.FORMATS, format))
+    if format == 'none':
+      return None
+    if format == 'auto':
+      return 'parquet' if import_pyarrow() is not None else 'csv'
+    if format == 'parquet' and import_pyarrow() is None:
+      raise ImportError('pyarrow is required for columnar format parquet')
+    return format
+
+  @classmethod
+  def get_arrow_type(cls, type):
+    return {
+      'string': pyarrow.string(),
+      'int64': pyarrow.int64(),
+      'float64': pyarrow.float64()
+    }[type]
+
+  @classmethod
+  def to_row(cls, comment_info):
+    """
+    NG情報を付与したコメント(merge_commentsの戻り値の要素)を1行にする。
+
+    Returns:
+    ----
+    row : list
+      COLUMNSの順序の値。値がない列はNone。
+    """
+    message = CommentTypeEnum.get_comment(comment_info)
+    lang = None
+    similarity = None
+    pattern = None
+    judgement_patterns = []
+    if comment_info[AddNGInfoKeyEnum.NG_FLG.value]:
+      verdict = 'ng'
+      ng_info = comment_info[AddNGInfoKeyEnum.NG_INFO.value]
+      if AddNGInfoKeyEnum.NG_COMMENT.value in ng_info:
+        ng_comment = ng_info[AddNGInfoKeyEnum.NG_COMMENT.value]
+        similarity = ng_comment[AddNGInfoKeyEnum.SIMILARITY.value]
+        pattern = str(ng_comment[AddNGInfoKeyEnum.PATTERN.value])
+      judgement_patterns = ng_info[AddNGInfoKeyEnum.NG_PATTERN.value]
+    elif comment_info[AddWarnInfoKeyEnum.WARN_FLG.value]:
+      verdict = 'warn'
+      warn_info = comment_info[AddWarnInfoKeyEnum.WARN_INFO.value]
+      # 連投, 繰り返し投稿だけでWARNになった場合は、言語判定していない。
+      if AddWarnInfoKeyEnum.WARN_COMMENT_INFO.value in warn_info:
+        lang = warn_info[AddWarnInfoKeyEnum.WARN_COMMENT_INFO.value][AddWarnInfoKeyEnum.LANG.value]
+      judgement_patterns = warn_info[AddWarnInfoKeyEnum.WARN_PATTERN.value]
+    else:
+      verdict = 'ok'
+    return [
+      OutputCommentKeyEnum.ID.get_value(comment_info),
+      OutputCommentKeyEnum.CHANNEL_ID.get_value(comment_info),
+      OutputCommentKeyEnum.DISPLAY_NAME.get_value(comment_info),
+      message,
+      verdict,
+      lang,
+      len(message),
+      similarity,
+      pattern,
+      ','.join(judgement_patterns)
+    ]
+
+  def write(self, comment_info):
+    start = time.perf_counter()
+    row = ColumnarWriter.to_row(comment_info)
+    if self.format == 'parquet':
+      self.rows.append(row)
+      if len(self.rows) >= ColumnarWriter.ROW_GROUP_SIZE:
+        self.flush()
+    else:
+      # 値がない列は空文字にする。
+      self.csv_writer.writerow(['' if value is None else value for value in row])
+    self.count += 1
+    self.write_time += time.perf_counter() - start
+
+  def flush(self):
+    """
+    保持している行をParquetの行グループとして書き込む。
+    """
+    if not self.rows:
+      return
+    columns = [pyarrow.array(list(values), type=field.type) for values, field in zip(zip(*self.rows), self.schema)]
+    self.parquet_writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+    self.rows = []
+
+  def close(self):
+    if self.format == 'parquet':
+      self.flush()
+      self.parquet_writer.close()
+    else:
+      self.file.close()
@@ -10,6 +10,7 @@ class AddNGInfoKeyEnum(Enum):
   SIMILARITY = 'similarity'
   NG_CHANNEL = 'ng_channel'
   NG_PATTERN = 'ng_pattern'
+  MATCHES = 'matches'
 
 class AddWarnInfoKeyEnum(Enum):
   """ 取り込んだコメントにNG情報を追加する際のキーを保持する。"""
@@ -18,9 +19,20 @@ class AddWarnInfoKeyEnum(Enum):
   WARN_COMMENT_INFO = 'warn_comment_info'
   LANG = 'lang'
   LENGTH = 'length'
+  EMOJI_RATIO = 'emoji_ratio'
+  SYMBOL_RATIO = 'symbol_ratio'
+  REPEAT_RUN = 'repeat_run'
+  URL_COUNT = 'url_count'
   WARN_CHANNEL = 'warn_channel'
   WARN_PATTERN = 'warn_pattern'
 
+class FloodInfoKeyEnum(Enum):
+  """ 連投, 繰り返し投稿を検出したコメントのNG情報, WARN情報に追加する際のキーを保持する。"""
+  FLOOD_INFO = 'flood_info'
+  WINDOW = 'window'
+  MESSAGE_COUNT = 'message_count'
+  DUPLICATE_COUNT = 'duplicate_count'
+
 class OutputCommentKeyEnum(Enum):
   ID = ('id', ['id'])
   CHANNEL_ID = ('channelId', ['authorDetails', 'channelId'])
@@ -38,6 +50,15 @@ class OutputCommentKeyEnum(Enum):
   def get_origin_key(self):
     return self.origin_key;
 
+  def get_value(self, comment_dict):
+    """
+    コメントdictからorigin_keyの値を取得する。
+    """
+    value = comment_dict
+    for key in self.origin_key:
+      value = value[key]
+    return value
+
   @classmethod
   def value_of(cls, ng_key):
     for e in OutputCommentKeyEnum:
@@ -127,6 +148,66 @@ class CommentTypeEnum(Enum):
           break
       return tmp
 
+class CommentRecord():
+  """
+  判定と出力に必要な項目だけを保持するコメント。
+  GoogleAPIで取得したコメントjson全体は保持せず、必要になったときに読み込み元のファイルから読み直す。
+  """
+  __slots__ = ('id', 'channel_id', 'channel_url', 'display_name', 'display_message', 'message', 'file', 'index', 'raw', 'published_at')
+
+  def __init__(self, id, channel_id, channel_url, display_name, display_message, message, file=None, index=None, raw=None, published_at=None):
+    self.id = id
+    self.channel_id = channel_id
+    self.channel_url = channel_url
+    self.display_name = display_name
+    self.display_message = display_message
+    # 判定対象のメッセージ(CommentTypeEnum.get_commentの戻り値)
+    self.message = message
+    # 読み込み元のファイルパスと、items配列内の位置
+    self.file = file
+    self.index = index
+    # 読み込み元のファイルがない場合は、コメントjsonをそのまま保持する。
+    self.raw = raw
+    # 投稿時刻(snippet.publishedAt)
+    self.published_at = published_at
+
+  @classmethod
+  def from_dict(cls, comment_dict, file=None, index=None):
+    """
+    コメントdictから生成する。
+
+    Parameters:
+    ----
+    comment_dict : dict
+      GoogleAPIで取得したコメント(items配列の要素)
+    file : string
+      読み込み元のファイルパス。Noneの場合はcomment_dictをそのまま保持する。
+    index : int
+      読み込み元のファイルのitems配列内の位置
+    """
+    return CommentRecord( \
+      OutputCommentKeyEnum.ID.get_value(comment_dict), \
+      OutputCommentKeyEnum.CHANNEL_ID.get_value(comment_dict), \
+      comment_dict['authorDetails']['channelUrl'], \
+      OutputCommentKeyEnum.DISPLAY_NAME.get_value(comment_dict), \
+      OutputCommentKeyEnum.DISPLAY_MESSAGE.get_value(comment_dict), \
+      CommentTypeEnum.get_comment(comment_dict), \
+      file, \
+      index, \
+      comment_dict if file is None else None, \
+      comment_dict['snippet'].get('publishedAt'))
+
+  def get_output_comment(self):
+    """
+    ok_message, ng_message, warn_message配下に出力する項目を返す。
+    """
+    return {
+      OutputCommentKeyEnum.ID.get_ng_key() :              self.id,
+      OutputCommentKeyEnum.CHANNEL_ID.get_ng_key() :      self.channel_id,
+      OutputCommentKeyEnum.DISPLAY_NAME.get_ng_key() :    self.display_name,
+      OutputCommentKeyEnum.DISPLAY_MESSAGE.get_ng_key() : self.display_message
+    }
+
 # TODO YoutubeCommentJsonへのアクセスをしやすくする。
 # class CommonCommentKeyEnum(Enum):
 #   kind=(["kind"])
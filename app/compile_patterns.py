@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger, config, StreamHandler, DEBUG
+import argparse
+import time
+
+import sys
+sys.path.append('./')
+from util import LogUtil
+from judgement import NotUseMPLGJudgement, UseMPLGJudegement
+from corpus import PatternCorpus
+
+logger = getLogger(__name__)
+log_conf = LogUtil.get_log_conf('./log_config.json')
+config.dictConfig(log_conf)
+handler = StreamHandler()
+handler.setLevel(DEBUG)
+logger.setLevel(DEBUG)
+logger.addHandler(handler)
+logger.propagate = False
+
+JUDGEMENT_CLASSES = {
+  'NotUseMPLGJudgement': NotUseMPLGJudgement,
+  'UseMPLGJudegement': UseMPLGJudegement
+}
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description='NGパターンをコンパイルし、output/cache配下に保存する')
+  parser.add_argument('--classes', nargs='+', default=list(JUDGEMENT_CLASSES), choices=list(JUDGEMENT_CLASSES), \
+    help='コンパイルする判定クラス')
+  return parser.parse_args(argv)
+
+if __name__ == '__main__':
+  args = parse_args()
+  logger.info("start.")
+  for class_name in args.classes:
+    start = time.perf_counter()
+    # 類似度のしきい値はコンパイル結果に影響しない。
+    judgement = JUDGEMENT_CLASSES[class_name](None, 1.0)
+    path = judgement.compile_ng_pattern()
+    corpus = PatternCorpus.load(path)
+    logger.info("compiled : {}, patterns : {}, vocabulary : {}, {:.3f} sec".format( \
+      path, len(corpus), corpus.vocabulary_count, time.perf_counter() - start))
+    corpus.close()
+  logger.info("finish.")
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+from array import array
+import os
+import mmap
+import struct
+
+import sys
+sys.path.append('./')
+from util import TextUtil
+
+logger = getLogger("same_hierarchy")
+
+class PatternCorpus():
+  """
+  コンパイル済みのNGパターン一覧。compile_patterns.pyで生成する。
+
+  NGパターンごとに下記を保持するバイナリファイルで、読み込み時はmmapで開いて必要な箇所だけ参照する。
+    - NG判定されたときに返す値と比較対象の文字列（NGPatternIndexに渡す値）
+    - 表層形, 原形それぞれのトークンIDの配列
+  トークンIDはファイル内の語彙(トークン文字列の配列)の位置。
+
+  ファイル構成（リトルエンディアン）
+    ヘッダ : マジック, バージョン, フィンガープリント, NGパターン数, 語彙数
+    文字列の終了位置 : uint64 x (NGパターン数 * 2 + 語彙数)
+    表層形トークンの終了位置 : uint32 x NGパターン数
+    原形トークンの終了位置 : uint32 x NGパターン数
+    表層形トークンID : uint32 x 表層形トークン数
+    原形トークンID : uint32 x 原形トークン数
+    文字列 : UTF-8 (値, 比較対象の文字列をNGパターン順に並べ、その後に語彙を並べる)
+  """
+
+  MAGIC = b'NGPC'
+  VERSION = 2
+  HEADER = struct.Struct('<4sI40sII')
+
+  # NGパターン1件あたりの文字列数（値, 比較対象の文字列）
+  STRINGS_PER_PATTERN = 2
+
+  def __init__(self, buffer, close=None):
+    """ コンストラクタ。loadから呼び出す。
+
+    Parameters:
+    ----
+    buffer : bytes or mmap
+      コーパスファイルの内容
+    close : callable
+      closeで呼び出す後処理
+    """
+    magic, version, fingerprint, pattern_count, vocabulary_count = PatternCorpus.HEADER.unpack_from(buffer, 0)
+    if magic != PatternCorpus.MAGIC or version != PatternCorpus.VERSION:
+      raise ValueError('unsupported corpus : magic={}, version={}'.format(magic, version))
+    self.fingerprint = fingerprint.decode('ascii')
+    self.pattern_count = pattern_count
+    self.vocabulary_count = vocabulary_count
+    self.buffer = buffer
+    self.close_buffer = close
+
+    view = memoryview(buffer)
+    position = PatternCorpus.HEADER.size
+    string_count = pattern_count * PatternCorpus.STRINGS_PER_PATTERN + vocabulary_count
+    self.string_ends = view[position:position + string_count * 8].cast('Q')
+    position += string_count * 8
+    self.surface_ends = view[position:position + pattern_count * 4].cast('I')
+    position += pattern_count * 4
+    self.base_ends = view[position:position + pattern_count * 4].cast('I')
+    position += pattern_count * 4
+    surface_count = self.surface_ends[-1] if pattern_count > 0 else 0
+    self.surface_ids = view[position:position + surface_count * 4].cast('I')
+    position += surface_count * 4
+    base_count = self.base_ends[-1] if pattern_count > 0 else 0
+    self.base_ids = view[position:position + base_count * 4].cast('I')
+    position += base_count * 4
+    self.strings = view[position:]
+
+    # 語彙は必要になったときに読み込む。
+    self.vocabulary = None
+
+  def __len__(self):
+    return self.pattern_count
+
+  def get_string(self, i):
+    start = self.string_ends[i - 1] if i > 0 else 0
+    return bytes(self.strings[start:self.string_ends[i]]).decode('utf-8')
+
+  def get_value(self, i):
+    """ i番目のNGパターンの、NG判定されたときに返す値 """
+    return self.get_string(i * PatternCorpus.STRINGS_PER_PATTERN)
+
+  def get_text(self, i):
+    """ i番目のNGパターンの比較対象の文字列 """
+    return self.get_string(i * PatternCorpus.STRINGS_PER_PATTERN + 1)
+
+  def get_patterns(self):
+    """
+    NGPatternIndexに渡す(NG判定されたときに返す値, 比較対象の文字列)の配列を返す。
+    """
+    return [(self.get_value(i), self.get_text(i)) for i in range(self.pattern_count)]
+
+  def get_token_ids(self, i, base_form=False):
+    """
+    i番目のNGパターンのトークンIDの配列を返す。
+
+    Parameters:
+    ----
+    i : int
+      NGパターンの位置
+    base_form : boolean
+      Trueの場合は原形, Falseの場合は表層形のトークンIDを返す。
+
+    Returns:
+    ----
+    token_ids : memoryview
+      uint32の配列。コーパスファイルを直接参照する。
+    """
+    ends, ids = (self.base_ends, self.base_ids) if base_form else (self.surface_ends, self.surface_ids)
+    start = ends[i - 1] if i > 0 else 0
+    return ids[start:ends[i]]
+
+  def get_vocabulary(self):
+    """
+    語彙（トークンIDの位置にトークン文字列を並べた配列）を返す。
+    """
+    if self.vocabulary is None:
+      offset = self.pattern_count * PatternCorpus.STRINGS_PER_PATTERN
+      self.vocabulary = [self.get_string(offset + i) for i in range(self.vocabulary_count)]
+    return self.vocabulary
+
+  def close(self):
+    for name in ['string_ends', 'surface_ends', 'base_ends', 'surface_ids', 'base_ids', 'strings']:
+      getattr(self, name).release()
+    if self.close_buffer is not None:
+      self.close_buffer()
+
+  @classmethod
+  def tokenize(cls, mplg_result):
+    """
+    形態素解析結果(MeCabの出力)を表層形, 原形のトークン配列にする。
+    トークンは正規化する。原形がない(*)場合は表層形を使う。
+
+    Parameters:
+    ----
+    mplg_result : string
+      形態素解析結果
+
+    Returns:
+    ----
+    surfaces : list[string]
+      表層形のトークン
+    bases : list[string]
+      原形のトークン
+    """
+    surfaces = []
+    bases = []
+    for line in mplg_result.splitlines():
+      if line == 'EOS' or line == '':
+        continue
+      surface, _, feature = line.partition('\t')
+      surface = TextUtil.normalize(surface)
+      if surface == '':
+        continue
+      features = feature.split(',')
+      base = TextUtil.normalize(features[6]) if len(features) > 6 and features[6] != '*' else ''
+      surfaces.append(surface)
+      bases.append(base if base != '' else surface)
+    return surfaces, bases
+
+  @classmethod
+  def save(cls, path, fingerprint, patterns, tokens):
+    """
+    コーパスファイルを書き込む。
+
+    Parameters:
+    ----
+    path : string
+      書き込み先
+    fingerprint : string
+      元にしたNGパターンのファイル一覧のフィンガープリント(sha1の16進数表記)
+    patterns : list[tuple]
+      (NG判定されたときに返す値, 比較対象の文字列)の配列
+    tokens : list[tuple]
+      NGパターンごとの(表層形のトークン, 原形のトークン)の配列。tokenizeの戻り値。
+    """
+    vocabulary = {}
+    def to_ids(token_list):
+      return [vocabulary.setdefault(token, len(vocabulary)) for token in token_list]
+
+    surface_ends, base_ends = array('I'), array('I')
+    surface_ids, base_ids = array('I'), array('I')
+    strings = []
+    for (value, text), (surfaces, bases) in zip(patterns, tokens):
+      strings.extend([str(value), text])
+      surface_ids.extend(to_ids(surfaces))
+      surface_ends.append(len(surface_ids))
+      base_ids.extend(to_ids(bases))
+      base_ends.append(len(base_ids))
+    strings.extend(vocabulary)
+
+    string_ends = array('Q')
+    encoded = []
+    total = 0
+    for string in strings:
+      data = string.encode('utf-8')
+      encoded.append(data)
+      total += len(data)
+      string_ends.append(total)
+
+    for values in [string_ends, surface_ends, base_ends, surface_ids, base_ids]:
+      if sys.byteorder != 'little':
+        values.byteswap()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 書き込み途中のファイルを読み込まないように、別名で書き込んでから置き換える。
+    tmp_path = path + '.' + str(os.getpid())
+    with open(tmp_path, mode='wb') as f:
+      f.write(PatternCorpus.HEADER.pack(PatternCorpus.MAGIC, PatternCorpus.VERSION, \
+        fingerprint.encode('ascii'), len(patterns), len(vocabulary)))
+      for values in [string_ends, surface_ends, base_ends, surface_ids, base_ids]:
+        values.tofile(f)
+      for data in encoded:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+  @classmethod
+  def load(cls, path):
+    """
+    コーパスファイルをmmapで開く。
+
+    Parameters:
+    ----
+    path : string
+      コーパスファイルのパス
+
+    Returns:
+    ----
+    corpus : PatternCorpus
+    """
+    with open(path, mode='rb') as f:
+      if os.fstat(f.fileno()).st_size == 0:
+        raise ValueError('empty corpus : {}'.format(path))
+      buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      return PatternCorpus(buffer, buffer.close)
+    except Exception:
+      buffer.close()
+      raise
+
+  @classmethod
+  def load_if_fresh(cls, path, fingerprint):
+    """
+    フィンガープリントが一致する場合だけコーパスファイルを読み込む。
+
+    Returns:
+    ----
+    corpus : PatternCorpus or None
+      ファイルがない, 壊れている, フィンガープリントが一致しない場合はNoneを返す。
+    """
+    if not os.path.isfile(path):
+      return None
+    try:
+      corpus = PatternCorpus.load(path)
+    except (ValueError, struct.error) as e:
+      logger.info("ng_pattern corpus is broken : {}, {}".format(path, e))
+      return None
+    if corpus.fingerprint != fingerprint:
+      logger.info("ng_pattern corpus is outdated. run compile_patterns.py : {}".format(path))
+      corpus.close()
+      return None
+    return corpus
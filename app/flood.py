@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+from collections import OrderedDict, deque
+from array import array
+from datetime import datetime
+import hashlib
+import re
+
+import sys
+sys.path.append('./')
+from commentutil import FloodInfoKeyEnum
+from util import TextUtil
+
+logger = getLogger("same_hierarchy")
+
+class FloodDetector():
+  """
+  チャンネルごとの連投と、同じ内容の繰り返し投稿を、直近window秒のコメントから検出する。
+  コメントの投稿時刻(snippet.publishedAt)で判定するので、判定を呼び出すまとめ方によらず結果は同じ。
+
+  rate : window秒以内のコメント数がrate_limitを超えた。
+    チャンネルごとに直近rate_limit + 1件の投稿時刻だけをリングバッファ(deque)で保持する。
+    保持するチャンネル数はmax_authorsまでで、超えた場合は最も古くにコメントしたチャンネルから捨てる。
+  duplicate : window秒以内に同じチャンネルが同じ内容(正規化後)のコメントをした回数がduplicate_limitを超えた。
+    (チャンネル, コメント)の回数はCount-Min Sketchで数え、チャンネル数, コメントの種類数によらずメモリは一定。
+    Count-Min Sketchは回数を多めに見積もることはあっても、少なく見積もることはない。
+    window秒ごとに新しいSketchに切り替え、1つ前のSketchの回数は経過時間に応じて割り引いて足す。(スライディングウィンドウの近似)
+  """
+
+  PATTERNS = ['rate', 'duplicate']
+
+  # 検出したコメントの判定。warn:WARNにする, ng:NGにする
+  ACTIONS = ['warn', 'ng']
+
+  # 投稿時刻を保持するチャンネル数
+  MAX_AUTHORS = 100000
+
+  # Count-Min Sketchの行数と列数
+  SKETCH_DEPTH = 4
+  SKETCH_WIDTH = 65536
+
+  # 同じ文字の繰り返し(連続する3文字以上は2文字にする)
+  REPEAT_PATTERN = re.compile(r'(.)\1{2,}', re.DOTALL)
+
+  def __init__(self, window, rate_limit, duplicate_limit, action='warn', max_authors=MAX_AUTHORS):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    window : float
+      判定に使う時間幅（秒）
+    rate_limit : int
+      window秒以内のコメント数の上限。0の場合は判定しない。
+    duplicate_limit : int
+      window秒以内の同じ内容のコメント数の上限。0の場合は判定しない。
+    action : string
+      warn or ng
+    max_authors : int
+      投稿時刻を保持するチャンネル数
+    """
+    if action not in FloodDetector.ACTIONS:
+      raise ValueError('flood action must be one of {} : {}'.format(FloodDetector.ACTIONS, action))
+    self.window = window
+    self.rate_limit = rate_limit
+    self.duplicate_limit = duplicate_limit
+    self.action = action
+    self.max_authors = max_authors
+    self.clear()
+
+  def clear(self):
+    """
+    保持している投稿時刻と回数を捨てる。判定対象の動画を切り替える場合に呼び出す。
+    """
+    # key : チャンネルID
+    # value : 投稿時刻(UNIX時間)のdeque。最大rate_limit + 1件
+    self.authors = OrderedDict()
+    # 現在のSketchと1つ前のSketch, 現在のSketchの開始時刻
+    self.sketch = FloodDetector.create_sketch()
+    self.previous_sketch = None
+    self.sketch_start = None
+
+    # 計測値
+    self.observed_count = 0
+    self.skipped_count = 0
+    self.evicted_count = 0
+    self.detected_counts = {pattern: 0 for pattern in FloodDetector.PATTERNS}
+
+  @classmethod
+  def create_sketch(cls):
+    return array('I', bytes(4 * FloodDetector.SKETCH_DEPTH * FloodDetector.SKETCH_WIDTH))
+
+  @classmethod
+  def parse_time(cls, published_at):
+    """
+    snippet.publishedAt(ISO 8601)をUNIX時間にする。読み込めない場合はNoneを返す。
+    """
+    if not published_at:
+      return None
+    try:
+      return datetime.fromisoformat(published_at.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+      return None
+
+  @classmethod
+  def normalize(cls, message):
+    """
+    繰り返し投稿の判定用に、コメントを正規化する。
+    NFKC正規化, 小文字化をして空白を除き、同じ文字の繰り返しを2文字にする。(「wwww」と「wwwwww」を同じ内容とする)
+    """
+    text = TextUtil.WHITESPACE_PATTERN.sub('', TextUtil.normalize(message).lower())
+    return FloodDetector.REPEAT_PATTERN.sub(r'\1\1', text)
+
+  @classmethod
+  def get_sketch_positions(cls, channel_id, text):
+    """
+    (チャンネル, コメント)に対応するSketchの位置を行ごとに返す。
+    プロセスによって結果が変わらないように、hash()ではなくblake2bを使う。
+    """
+    digest = hashlib.blake2b((channel_id + '\0' + text).encode('utf-8'), digest_size=4 * FloodDetector.SKETCH_DEPTH).digest()
+    return [row * FloodDetector.SKETCH_WIDTH + int.from_bytes(digest[row * 4:row * 4 + 4], 'little') % FloodDetector.SKETCH_WIDTH \
+      for row in range(FloodDetector.SKETCH_DEPTH)]
+
+  def observe_rate(self, channel_id, timestamp):
+    """
+    チャンネルの投稿時刻を記録し、window秒以内のコメント数を返す。（最大rate_limit + 1）
+    """
+    timestamps = self.authors.get(channel_id)
+    if timestamps is None:
+      timestamps = deque(maxlen=self.rate_limit + 1)
+      self.authors[channel_id] = timestamps
+      if len(self.authors) > self.max_authors:
+        self.authors.popitem(last=False)
+        self.evicted_count += 1
+    else:
+      self.authors.move_to_end(channel_id)
+    timestamps.append(timestamp)
+    return sum(1 for t in timestamps if timestamp - self.window < t <= timestamp)
+
+  def observe_duplicate(self, channel_id, timestamp, message):
+    """
+    (チャンネル, コメント)の回数を数え、window秒以内の回数の見積もりを返す。
+    """
+    text = FloodDetector.normalize(message)
+    if not text:
+      return 0
+    if self.sketch_start is None:
+      self.sketch_start = timestamp
+    elif timestamp >= self.sketch_start + self.window:
+      # window秒を過ぎたら新しいSketchに切り替える。2倍以上過ぎた場合は、1つ前のSketchも使わない。
+      self.previous_sketch = self.sketch if timestamp < self.sketch_start + 2 * self.window else None
+      self.sketch = FloodDetector.create_sketch()
+      self.sketch_start += (timestamp - self.sketch_start) // self.window * self.window
+
+    positions = FloodDetector.get_sketch_positions(channel_id, text)
+    sketch = self.sketch
+    for position in positions:
+      sketch[position] += 1
+    count = min(sketch[position] for position in positions)
+    if self.previous_sketch is not None:
+      # 1つ前のSketchの回数は、現在のSketchの経過時間の割合だけ割り引く。
+      # 現在のSketchの開始より前の時刻のコメント(順序が前後したコメント)は、割り引かずに数える。
+      weight = min(1.0, max(0.0, 1.0 - (timestamp - self.sketch_start) / self.window))
+      count += int(min(self.previous_sketch[position] for position in positions) * weight)
+    return count
+
+  def observe(self, channel_id, timestamp, message):
+    """
+    コメント1件を記録し、連投, 繰り返し投稿かどうかを判定する。
+
+    Parameters:
+    ----
+    channel_id : string
+      コメントしたチャンネルID(authorDetails.channelId)
+    timestamp : float
+      投稿時刻(parse_timeの戻り値)。Noneの場合は判定しない。
+    message : string
+      元のメッセージ
+
+    Returns:
+    ----
+    result : tuple or None
+      検出した場合は(パターンの配列, flood_info)、検出しなかった場合はNoneを返す。
+    """
+    if timestamp is None or channel_id is None:
+      self.skipped_count += 1
+      return None
+    self.observed_count += 1
+
+    patterns = []
+    flood_info = {FloodInfoKeyEnum.WINDOW.value: self.window}
+    if self.rate_limit > 0:
+      message_count = self.observe_rate(channel_id, timestamp)
+      flood_info[FloodInfoKeyEnum.MESSAGE_COUNT.value] = message_count
+      if message_count > self.rate_limit:
+        patterns.append('rate')
+    if self.duplicate_limit > 0:
+      duplicate_count = self.observe_duplicate(channel_id, timestamp, message or '')
+      flood_info[FloodInfoKeyEnum.DUPLICATE_COUNT.value] = duplicate_count
+      if duplicate_count > self.duplicate_limit:
+        patterns.append('duplicate')
+
+    if not patterns:
+      return None
+    for pattern in patterns:
+      self.detected_counts[pattern] += 1
+    return patterns, flood_info
+
+  def detect_many(self, records):
+    """
+    まとめて判定する。投稿時刻の順に記録する。（同じ時刻の場合は引数の順序）
+
+    Parameters:
+    ----
+    records : dict
+      key : コメントID
+      value : CommentRecord
+
+    Returns:
+    ----
+    results : dict
+      検出したコメントだけを返す。
+      key : コメントID
+      value : (パターンの配列, flood_info)
+    """
+    timestamps = {key: FloodDetector.parse_time(record.published_at) for key, record in records.items()}
+    # 投稿時刻を読み込めないコメントは最後にする。(判定しない)
+    keys = sorted(records, key=lambda key: (timestamps[key] is None, timestamps[key] or 0.0))
+    results = {}
+    for key in keys:
+      record = records[key]
+      result = self.observe(record.channel_id, timestamps[key], record.message)
+      if result is not None:
+        results[key] = result
+    return results
+
+  def get_stats(self):
+    return {
+      'window': self.window,
+      'action': self.action,
+      'observed': self.observed_count,
+      'skipped': self.skipped_count,
+      'authors': len(self.authors),
+      'evicted': self.evicted_count,
+      'detected': dict(self.detected_counts)
+    }
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import json
+
+# インストールされている場合は、高速なjsonライブラリを使う。
+try:
+  import orjson
+except ImportError:
+  orjson = None
+try:
+  import ujson
+except ImportError:
+  ujson = None
+
+class JsonCodec():
+  """
+  jsonの読み込み, 書き込みに使うライブラリを切り替える。
+
+  読み込みはインストールされている中で最も速いライブラリ(orjson, ujson, json)を使う。
+  書き込みはset_backendで指定したライブラリを使う。json(標準ライブラリ)以外は出力の空白や文字のエスケープが異なる。
+  """
+
+  BACKENDS = ['auto', 'orjson', 'ujson', 'json']
+
+  # 書き込みに使うライブラリ
+  dumps_backend = 'json'
+
+  @classmethod
+  def get_available_backends(cls):
+    return [name for name, module in [('orjson', orjson), ('ujson', ujson), ('json', json)] if module is not None]
+
+  @classmethod
+  def set_backend(cls, backend):
+    """
+    書き込みに使うライブラリを指定する。
+
+    Parameters:
+    ----
+    backend : string
+      auto : インストールされている中で最も速いライブラリ
+      orjson, ujson, json : 指定したライブラリ。インストールされていない場合はjson(標準ライブラリ)
+    """
+    if backend not in JsonCodec.BACKENDS:
+      raise ValueError('json backend must be one of {} : {}'.format(JsonCodec.BACKENDS, backend))
+    available = JsonCodec.get_available_backends()
+    if backend == 'auto':
+      backend = available[0]
+    JsonCodec.dumps_backend = backend if backend in available else 'json'
+
+  @classmethod
+  def get_loads_backend(cls):
+    return JsonCodec.get_available_backends()[0]
+
+  @classmethod
+  def loads(cls, data):
+    """
+    jsonを読み込む。
+
+    Parameters:
+    ----
+    data : bytes or string
+    """
+    if orjson is not None:
+      try:
+        return orjson.loads(data)
+      except ValueError:
+        # 64bitを超える整数などorjsonが扱えない値は、標準ライブラリで読み込み直す。
+        pass
+    elif ujson is not None:
+      try:
+        return ujson.loads(data)
+      except ValueError:
+        pass
+    return json.loads(data)
+
+  @classmethod
+  def load_file(cls, path):
+    with open(path, mode='rb') as f:
+      return JsonCodec.loads(f.read())
+
+  @classmethod
+  def dumps(cls, obj):
+    """
+    jsonの文字列にする。
+    """
+    if JsonCodec.dumps_backend == 'orjson':
+      return orjson.dumps(obj).decode('utf-8')
+    if JsonCodec.dumps_backend == 'ujson':
+      return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+    return json.dumps(obj)
+
+class PageReader():
+  """
+  コメントjsonファイルを別スレッドで先読みし、ファイルの順序で返す。
+  先読みするファイル数には上限があり、読み込んだjsonがメモリに溜まり続けることはない。
+  """
+
+  # 先読みするファイル数
+  READ_AHEAD = 4
+
+  def __init__(self, files, read_ahead=None):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    files : list[string]
+      読み込むファイルパス
+    read_ahead : int
+      先読みするファイル数。Noneの場合はREAD_AHEAD。1以下の場合は先読みしない。
+    """
+    self.files = files
+    self.read_ahead = PageReader.READ_AHEAD if read_ahead is None else read_ahead
+
+  def __iter__(self):
+    """
+    (ファイルパス, 読み込んだjson)を順に返す。
+    """
+    if self.read_ahead <= 1:
+      for file in self.files:
+        yield file, JsonCodec.load_file(file)
+      return
+
+    with ThreadPoolExecutor(max_workers=self.read_ahead) as executor:
+      files = iter(self.files)
+      futures = deque()
+      try:
+        for file in files:
+          futures.append((file, executor.submit(JsonCodec.load_file, file)))
+          if len(futures) >= self.read_ahead:
+            break
+        while futures:
+          file, future = futures.popleft()
+          page = future.result()
+          next_file = next(files, None)
+          if next_file is not None:
+            futures.append((next_file, executor.submit(JsonCodec.load_file, next_file)))
+          yield file, page
+      finally:
+        # 途中で読み込みをやめた場合は、先読みを取り消す。
+        for _, future in futures:
+          future.cancel()
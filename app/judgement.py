@@ -1,26 +1,29 @@
 # -*- coding: utf-8 -*-
-from logging import getLogger, config, StreamHandler, DEBUG
+from logging import getLogger
 from abc import ABCMeta, abstractmethod
 import os
 import glob
-import MeCab
-import json
-from difflib import SequenceMatcher 
-import pycld2 as cld2
+import time
 
 import sys
 sys.path.append('./')
-from commentutil import CommentTypeEnum, AddNGInfoKeyEnum, AddWarnInfoKeyEnum, OutputCommentKeyEnum
-from util import LogUtil
+from commentutil import AddNGInfoKeyEnum, AddWarnInfoKeyEnum, FloodInfoKeyEnum, CommentRecord
+from util import FileUtil
+from tagger import TaggerEngine
+from ngindex import NGPatternIndex
+from blocklist import ChannelBlocklist
+from shareddata import SharedReferenceData
+from corpus import PatternCorpus
+from writer import ResultListWriter
+from metrics import Metrics
+from language import LanguageDetector
+from warnrule import WarnRuleEngine
+from jsoncodec import JsonCodec, PageReader
 
 logger = getLogger("same_hierarchy")
-log_conf = LogUtil.get_log_conf('./log_config.json')
-config.dictConfig(log_conf)
-handler = StreamHandler()
-handler.setLevel(DEBUG)
-logger.setLevel(DEBUG)
-logger.addHandler(handler)
-logger.propagate = False
+
+# 言語判定ライブラリ(pycld2)。読み込みに時間がかかるため、初めて言語判定するときに読み込む。
+cld2 = None
 
 class JudgementInterface():
   """
@@ -32,138 +35,657 @@ class JudgementInterface():
   # 言語ごとのWARN判定文字列長TSVファイル
   LANG_LEN_PATH = './input/lang_len.tsv'
 
+  # length以外のWARN判定ルールのしきい値TSVファイル
+  WARN_RULE_PATH = './input/warn_rule.tsv'
+
+  # コンパイル済みのNGパターンの保存先
+  CORPUS_DIR = './output/cache/'
+
   def __init__( \
     self, \
     video_id, \
     ng_pattern_path, \
-    threshold):
+    threshold, \
+    workers=1, \
+    chunk_size=1000, \
+    cache=None, \
+    match_top_k=0, \
+    warn_rules=None, \
+    warn_target='judged'):
     """ コンストラクタ
     """
     self.video_id = video_id
     self.ng_pattern_path = ng_pattern_path
     self.threshold = threshold
 
+    # 並列数。2以上の場合、複数プロセスで判定する。
+    self.workers = workers
+    # 1プロセスに渡すコメント数
+    self.chunk_size = chunk_size
+    # 判定結果のキャッシュ(JudgementCache)。Noneの場合はキャッシュしない。
+    self.cache = cache
+    # NGパターンによる判定で返すNGパターンの件数。
+    # 0の場合は最初にしきい値を超えたNGパターンを返し、1以上の場合は類似度の高い順に指定した件数を返す。
+    self.match_top_k = match_top_k
+    # WARN判定に使うルール名(WarnRuleEngine.RULESのキー)の配列。Noneの場合はlengthだけ。
+    self.warn_rules = ['length'] if warn_rules is None else warn_rules
+    # WARN判定の対象。judged:判定対象の文字列(形態素解析を使用する場合は形態素解析結果), message:元のメッセージ
+    if warn_target not in WarnRuleEngine.TARGETS:
+      raise ValueError('warn_target must be one of {} : {}'.format(WarnRuleEngine.TARGETS, warn_target))
+    self.warn_target = warn_target
+
+    self.ng_channels = ChannelBlocklist([])
+    self.ng_pattern_index = None
+    # コンパイル済みのNGパターン(PatternCorpus)。コンパイルしていない場合はNone。
+    self.ng_pattern_corpus = None
+    # NGチャンネル一覧, NGパターンを読み込み直すNGDataReloader。Noneの場合は読み込み直さない。
+    self.reloader = None
+    # 連投, 繰り返し投稿を検出するFloodDetector。Noneの場合は検出しない。
+    self.flood_detector = None
+    # 動画をまたいでNGチャンネルを蓄積するChannelBlocklistStore。Noneの場合は蓄積しない。
+    self.ng_channel_store = None
+    # ワーカープロセスにNGチャンネル一覧, NGパターンをSharedReferenceDataで渡すかどうか。
+    self.use_shared_data = False
+    # 直前に生成したSharedReferenceData。(元のNGチャンネル一覧, 元のNGパターン, SharedReferenceData)
+    self.shared_data = None
+
+    # 計測値
+    self.metrics = Metrics()
+
+    # get_comment_infoで直前に読み込んだファイル
+    self.loaded_comment_file = None
+    self.loaded_comment_items = None
+
     self.result_all_comments = []
     self.result_ok_comments = []
     self.result_ng_comments = []
     self.result_warn_comments = []
     self.result_ng_channels = []
+    # result_ng_channelsの重複確認用
+    self.result_ng_channel_set = set()
 
-    self.LANG_LEN_DIC = {}
-    with open(self.LANG_LEN_PATH, mode='r') as f:
-      for line in f.readlines():
-        lines = line.replace('\r', '').replace('\n', '').split('\t')
-        self.LANG_LEN_DIC[lines[0]] = int(lines[1])
-    logger.info("lang_len: {}".format(self.LANG_LEN_DIC))
+    # 言語ごとのWARN判定文字列長と、length以外のWARN判定ルールのしきい値。初めて使うときに読み込む。(LANG_LEN_DIC, WARN_RULE_DIC)
+    self.lang_len_dic = None
+    self.warn_rule_dic = None
+    # WARN判定に使うWarnRuleEngine。しきい値を読み込み直した場合は作り直す。
+    self.warn_rule_engine = None
 
-  def exec(self):
-    live_comments = self.import_live_comments(self.video_id)
-    logger.info("live_comments len : {}".format(len(live_comments)))
+    self.language_detector = LanguageDetector(JudgementInterface.get_lang, cache)
 
-    ng_channels = self.import_ng_channel()
-    logger.info("ng_channels len : {}".format(len(ng_channels)))
-    # logger.debug("ng_channels : {}".format(ng_channels))
+  def exec(self, writer=None):
+    """
+    判定を実行する。
 
-    ng_patterns = self.import_ng_pattern(self.ng_pattern_path)
-    logger.info("ng_patterns len : {}".format(len(ng_patterns)))
+    Parameters:
+    ----
+    writer : ResultWriter
+      判定結果を1件ずつ書き込む先。
+      指定した場合、判定結果は配列に保持しない。（get_result_*_commentsは空の配列を返す。）
+    """
+    with self.metrics.stage('file_load'):
+      live_comments = self.import_live_comments(self.video_id)
+    logger.info("live_comments len : {}".format(len(live_comments)))
+    self.metrics.count('comments', len(live_comments))
 
-    pickup_comments = self.pickup_comment(live_comments)
-    logger.info("pickup_comments len : {}".format(len(pickup_comments)))
+    # 読み込み済み(バッチ判定で使い回す場合)は読み込まない。
+    if self.ng_pattern_index is None:
+      with self.metrics.stage('load_ng'):
+        self.prepare()
 
     # NG判定, WARN判定を行う
     logger.info("threshold: {}".format(self.threshold))
-    logger.info("ng_channels len: {}".format(len(ng_channels)))
-
-    # 言語判定
-    # key : コメントID
-    # value : lang
-    lang_comment = {}
-
-    # 判定でNGになったコメント
-    # key : コメントID
-    # value : dict {
-    #   ng_channel (必須) : チャンネルURL
-    #   ng_comment (任意) : {
-    #     ng_pattern : ng_patternのキー, または元のNGパターンのコメント
-    #     similarity : 類似度
-    #   }
-    #   ng_pattern (必須) : 配列。どのパターンで引っかかったか。 ["comment","channel"]
-    # }
-    judged_ng_comments = {}
-
-    # 判定でWARNになったコメント
-    # key : コメントID
-    # value : dict {
-    #   warn_comment_info : {
-    #     lang : コメント言語, 
-    #     length : 類似度
-    #   } 
-    #   warn_channel : チャンネルURL,
-    #   warn_pattern : どのパターンで判定されたか ["length"]
-    # }
-    judged_warn_comments = {}
-
-    for key in pickup_comments:
-      # コメント取得
-      comment = pickup_comments[key]
-
-      # 言語判定
-      comment_language = JudgementInterface.get_lang(comment)
-      lang_comment[key] = comment_language
-
-      # NG判定
-      # コメントのパターンからNG判定する。
-      # 形態素解析有りと無しでNGパターンの型が異なるので、ポリモーフィズムを使う。
-      # TODO ng_commentの構成がコメント、READMEと一致しているか確認する
-      ng, ng_comment, judgement_pattern = self.judgement_by_pattern(comment, ng_patterns, self.threshold)
-
-      # チャンネルURLから判断
-      channel_url = live_comments[key]['authorDetails']['channelUrl']
-      if channel_url in ng_channels:
-        ng = True
-        judgement_pattern.append('channel')
-
-      # どのチェックで引っかかったかはコメントIDをキーに登録
-      if ng:
-        ng_comment[AddNGInfoKeyEnum.NG_CHANNEL.value] = channel_url
-        ng_comment[AddNGInfoKeyEnum.NG_PATTERN.value] = judgement_pattern
-        judged_ng_comments[key] = ng_comment
-        if channel_url not in self.result_ng_channels:
-          self.result_ng_channels.append(channel_url)
-        # NGで引っかかったらWARN判定しない。
-        continue
-
-      # WARN判定
-      warn = False
-      warn_pattern = []
-      # 文字列長判定
-      if comment_language in self.LANG_LEN_DIC:
-        comment_length = len(comment)
-        if comment_length > self.LANG_LEN_DIC[comment_language]:
-          warn = True
-          warn_pattern.append('length')
-
-      if warn:
-        judged_warn_comments[key] = {
-          AddWarnInfoKeyEnum.WARN_COMMENT_INFO.value: {
-            AddWarnInfoKeyEnum.LANG.value: comment_language,
-            AddWarnInfoKeyEnum.LENGTH.value: comment_length
-          },
-          AddWarnInfoKeyEnum.WARN_CHANNEL.value: channel_url,
-          AddWarnInfoKeyEnum.WARN_PATTERN.value: warn_pattern
-        }
+    logger.info("ng_channels len: {}".format(len(self.ng_channels)))
+    with self.metrics.stage('judge'):
+      judged_ng_comments, judged_warn_comments = self.judge_comments(live_comments)
 
+    logger.info("ng_pattern_index stats : {}".format(self.ng_pattern_index.get_stats()))
     logger.info("judged_ng_comments len : {}".format(len(judged_ng_comments)))
     logger.info("result_ng_channels len : {}".format(len(self.result_ng_channels)))
     logger.info("judged_warn_comments len : {}".format(len(judged_warn_comments)))
 
     # TODO judged_warn_comments をマージする
     # 判定結果をマージする
-    self.result_all_comments , self.result_ok_comments , self.result_ng_comments , self.result_warn_comments = \
-      self.merge_comments(live_comments, judged_ng_comments, judged_warn_comments)
+    if writer is not None:
+      start = time.perf_counter()
+      self.write_comments(writer, live_comments, judged_ng_comments, judged_warn_comments)
+      # マージと書き込みは1件ずつ交互に行うので、書き込み時間を分けて記録する。
+      self.metrics.add_time('merge', time.perf_counter() - start - writer.get_write_time())
+      self.metrics.add_time('write', writer.get_write_time())
+      logger.info("written comments : {}".format(writer.get_counts()))
+      return
+    with self.metrics.stage('merge'):
+      self.result_all_comments , self.result_ok_comments , self.result_ng_comments , self.result_warn_comments = \
+        self.merge_comments(live_comments, judged_ng_comments, judged_warn_comments)
     logger.info("result_ok_comments len : {}".format(len(self.result_ok_comments)))
     # TODO ok_message, ng_message, warn_message配下出力を切り離す
 
+  def prepare(self):
+    """
+    判定に使用するNGチャンネル一覧とNGパターンを読み込む。
+    """
+    self.apply_ng_data(self.load_ng_data())
+
+  def load_ng_data(self, threshold=None):
+    """
+    NGチャンネル一覧, NGパターン, 言語ごとの文字列長を読み込んで返す。インスタンスは変更しない。
+    判定中に別スレッドで読み込み直す場合も使う。
+
+    Parameters:
+    ----
+    threshold : float
+      NG判定のしきい値。Noneの場合は現在のしきい値のまま。
+
+    Returns:
+    ----
+    ng_data : dict
+      apply_ng_dataの引数
+    """
+    ng_channels = self.import_ng_channel()
+    logger.info("ng_channels len : {}".format(len(ng_channels)))
+    # logger.debug("ng_channels : {}".format(ng_channels))
+
+    # コンパイル済みのNGパターンがあれば、NGパターンのファイルを読み直さない。
+    ng_pattern_corpus = self.load_ng_pattern_corpus()
+    if ng_pattern_corpus is not None:
+      logger.info("ng_pattern corpus loaded : {}".format(self.get_corpus_path()))
+      ng_pattern_index = self.create_ng_pattern_index_from_corpus(ng_pattern_corpus)
+    else:
+      ng_patterns = self.import_ng_pattern(self.ng_pattern_path)
+      ng_pattern_index = self.create_ng_pattern_index(ng_patterns)
+    logger.info("ng_patterns len : {}".format(len(ng_pattern_index)))
+
+    return {
+      'ng_channels': ng_channels,
+      'ng_pattern_corpus': ng_pattern_corpus,
+      'ng_pattern_index': ng_pattern_index,
+      'threshold': self.threshold if threshold is None else threshold,
+      'lang_len': JudgementInterface.import_lang_len(),
+      'warn_rule': WarnRuleEngine.import_thresholds(JudgementInterface.WARN_RULE_PATH)
+    }
+
+  @property
+  def LANG_LEN_DIC(self):
+    """
+    言語ごとのWARN判定文字列長。まだ読み込んでいない場合は読み込む。
+    """
+    if self.lang_len_dic is None:
+      self.LANG_LEN_DIC = JudgementInterface.import_lang_len()
+    return self.lang_len_dic
+
+  @LANG_LEN_DIC.setter
+  def LANG_LEN_DIC(self, lang_len):
+    self.lang_len_dic = lang_len
+    self.warn_rule_engine = None
+
+  @property
+  def WARN_RULE_DIC(self):
+    """
+    length以外のWARN判定ルールのしきい値。まだ読み込んでいない場合は読み込む。
+    """
+    if self.warn_rule_dic is None:
+      self.WARN_RULE_DIC = WarnRuleEngine.import_thresholds(JudgementInterface.WARN_RULE_PATH)
+    return self.warn_rule_dic
+
+  @WARN_RULE_DIC.setter
+  def WARN_RULE_DIC(self, warn_rule):
+    self.warn_rule_dic = warn_rule
+    self.warn_rule_engine = None
+
+  def get_warn_rule_engine(self):
+    """
+    WARN判定に使うWarnRuleEngineを返す。
+    """
+    if self.warn_rule_engine is None:
+      # lengthだけの場合は、しきい値のファイルを読み込まない。
+      thresholds = self.WARN_RULE_DIC if any(rule != 'length' for rule in self.warn_rules) else {}
+      self.warn_rule_engine = WarnRuleEngine(self.warn_rules, self.LANG_LEN_DIC, thresholds)
+    return self.warn_rule_engine
+
+  def get_worker_reference_data(self):
+    """
+    ワーカープロセスに渡すNGチャンネル一覧とNGパターンを返す。
+    use_shared_dataがTrueの場合はSharedReferenceDataに書き込み、ファイルを参照するNGチャンネル一覧とNGパターンを返す。
+    （ワーカープロセスにはファイルパスだけが渡り、各プロセスはmmapでファイルを共有する。）
+    NGチャンネル一覧, NGパターンを読み込み直すまでは、同じSharedReferenceDataを使い回す。
+
+    Returns:
+    ----
+    ng_channels : ChannelBlocklist or SharedChannelBlocklist
+    ng_pattern_index : NGPatternIndex or TokenPatternIndex
+      トークン列で比較する場合(TokenPatternIndex)は共有しない。
+    """
+    if not self.use_shared_data or type(self.ng_pattern_index) is not NGPatternIndex:
+      return self.ng_channels, self.ng_pattern_index
+    if self.shared_data is None or self.shared_data[0] is not self.ng_channels or self.shared_data[1] is not self.ng_pattern_index:
+      self.shared_data = (self.ng_channels, self.ng_pattern_index, SharedReferenceData.create(self.ng_channels, self.ng_pattern_index))
+    shared = self.shared_data[2]
+    return shared.get_channel_blocklist(), NGPatternIndex.from_shared(shared)
+
+  def apply_ng_data(self, ng_data):
+    """
+    load_ng_dataで読み込んだ値を判定に使用する。判定処理と同じスレッドで、判定の合間に呼び出す。
+    """
+    old_corpus = self.ng_pattern_corpus
+    self.ng_channels = ng_data['ng_channels']
+    self.ng_pattern_corpus = ng_data['ng_pattern_corpus']
+    self.ng_pattern_index = ng_data['ng_pattern_index']
+    self.threshold = ng_data['threshold']
+    self.LANG_LEN_DIC = ng_data['lang_len']
+    self.WARN_RULE_DIC = ng_data['warn_rule']
+    if self.cache is not None:
+      self.cache.save_pattern_set(self.ng_pattern_index)
+    # インデックスはコンパイル済みのNGパターンの値を複製して持つので、古いものは閉じてよい。
+    if old_corpus is not None and old_corpus is not self.ng_pattern_corpus:
+      old_corpus.close()
+
+  def apply_reloaded_ng_data(self):
+    """
+    読み込み直したNGチャンネル一覧, NGパターンがあれば、判定に使用する。
+    判定の途中で切り替わらないように、judge_commentsの開始時に呼び出す。
+    """
+    if self.reloader is None:
+      return
+    ng_data = self.reloader.take()
+    if ng_data is not None:
+      self.apply_ng_data(ng_data)
+      self.metrics.count('reload')
+      logger.info("ng data reloaded : threshold {}, ng_channels {}, ng_patterns {}".format( \
+        self.threshold, len(self.ng_channels), len(self.ng_pattern_index)))
+
+  def get_corpus_path(self):
+    """
+    コンパイル済みのNGパターンの保存先を返す。
+    """
+    return JudgementInterface.CORPUS_DIR + type(self).__name__ + '.corpus'
+
+  def load_ng_pattern_corpus(self):
+    """
+    コンパイル済みのNGパターンを読み込む。
+    コンパイル後にNGパターンのファイルが変更された場合は読み込まない。
+
+    Returns:
+    ----
+    corpus : PatternCorpus or None
+      コンパイルしていない場合はNoneを返す。
+    """
+    fingerprint = FileUtil.get_fingerprint(FileUtil.list_files(self.ng_pattern_path))
+    return PatternCorpus.load_if_fresh(self.get_corpus_path(), fingerprint)
+
+  def compile_ng_pattern(self):
+    """
+    NGパターンのファイルを読み込み、正規化, トークン化してコンパイル済みのNGパターンとして保存する。
+
+    Returns:
+    ----
+    path : string
+      保存先
+    """
+    fingerprint = FileUtil.get_fingerprint(FileUtil.list_files(self.ng_pattern_path))
+    ng_pattern_index = self.create_ng_pattern_index(self.import_ng_pattern(self.ng_pattern_path))
+    patterns = list(zip(ng_pattern_index.values, ng_pattern_index.texts))
+    tokens = self.tokenize_ng_patterns(ng_pattern_index.texts)
+    path = self.get_corpus_path()
+    PatternCorpus.save(path, fingerprint, patterns, tokens)
+    return path
+
+  @abstractmethod
+  def tokenize_ng_patterns(self, texts):
+    """ NGパターンの比較対象の文字列ごとに、コンパイル済みのNGパターンに保存する(表層形のトークン, 原形のトークン)を返す。
+    """
+    pass
+
+  def reset(self, video_id):
+    """
+    判定対象の動画を切り替える。
+    読み込み済みのNGチャンネル一覧, NGパターン, 言語ごとの文字列長は使い回し、判定結果と計測値だけを初期化する。
+
+    Parameters:
+    ----
+    video_id : string
+      次に判定する動画ID
+    """
+    self.video_id = video_id
+    self.metrics = Metrics()
+    self.loaded_comment_file = None
+    self.loaded_comment_items = None
+    self.clear_results()
+    if self.flood_detector is not None:
+      self.flood_detector.clear()
+    if self.ng_pattern_index is not None:
+      self.ng_pattern_index.compared_count = 0
+      self.ng_pattern_index.skipped_count = 0
+
+  def clear_results(self):
+    """
+    判定結果を初期化する。計測値は残す。
+    """
+    self.result_all_comments = []
+    self.result_ok_comments = []
+    self.result_ng_comments = []
+    self.result_warn_comments = []
+    self.result_ng_channels = []
+    self.result_ng_channel_set = set()
+
+  def judge_comments(self, live_comments):
+    """
+    コメントのNG判定, WARN判定を行う。
+    並列数が2以上の場合は、複数プロセスで判定する。
+
+    Parameters:
+    ----
+    live_comments : dict
+      import_live_commentsの戻り値。
+
+    Returns:
+    ----
+    judged_ng_comments : dict
+      判定でNGになったコメント
+      key : コメントID
+      value : dict {
+        ng_channel (必須) : チャンネルURL
+        ng_comment (任意) : {
+          ng_pattern : ng_patternのキー, または元のNGパターンのコメント
+          similarity : 類似度
+        }
+        ng_pattern (必須) : 配列。どのパターンで引っかかったか。 ["comment","channel"]
+        flood_info (任意) : 連投, 繰り返し投稿を検出した場合の直近のコメント数など
+      }
+    judged_warn_comments : dict
+      判定でWARNになったコメント
+      key : コメントID
+      value : dict {
+        warn_comment_info (連投, 繰り返し投稿だけでWARNになった場合はなし) : {
+          lang : コメント言語, 
+          length : 類似度
+        } 
+        warn_channel : チャンネルURL,
+        warn_pattern : どのパターンで判定されたか ["length"]
+        flood_info (任意) : 連投, 繰り返し投稿を検出した場合の直近のコメント数など
+      }
+    """
+    self.apply_reloaded_ng_data()
+    if self.workers > 1:
+      # 循環importを避けるため、ここでimportする。
+      from parallel import judge_comments_parallel
+      results = judge_comments_parallel(self, live_comments)
+    else:
+      pickup_comments = self.pickup_comment(live_comments)
+      logger.info("pickup_comments len : {}".format(len(pickup_comments)))
+      mplg_stats = self.get_mplg_stats()
+      if mplg_stats:
+        logger.info("mplg stats : {}".format(mplg_stats))
+
+      keys = list(pickup_comments)
+      judged = self.judge_comment_many([pickup_comments[key] for key in keys], [live_comments[key].channel_url for key in keys], \
+        [live_comments[key].message for key in keys])
+      results = [(key, ng_comment, warn_comment) for key, (ng_comment, warn_comment) in zip(keys, judged)]
+
+    logger.info("dedup : {}".format(self.get_dedup_stats()))
+    if self.cache is not None:
+      self.cache.commit()
+      logger.info("cache stats : {}".format(self.cache.get_stats()))
+
+    if self.flood_detector is not None:
+      with self.metrics.stage('flood'):
+        results = self.judge_flood(live_comments, results)
+
+    judged_ng_comments = {}
+    judged_warn_comments = {}
+    for key, ng_comment, warn_comment in results:
+      if ng_comment is not None:
+        judged_ng_comments[key] = ng_comment
+        channel_url = ng_comment[AddNGInfoKeyEnum.NG_CHANNEL.value]
+        if channel_url not in self.result_ng_channel_set:
+          self.result_ng_channel_set.add(channel_url)
+          self.result_ng_channels.append(channel_url)
+      elif warn_comment is not None:
+        judged_warn_comments[key] = warn_comment
+    return judged_ng_comments, judged_warn_comments
+
+  def judge_flood(self, live_comments, results):
+    """
+    連投, 繰り返し投稿を検出し、判定結果に追加する。
+    コメントの投稿時刻で判定するので、並列数によらず親プロセスでまとめて行う。
+
+    flood_detector.actionがngの場合は、NG判定結果のng_patternにパターン(rate, duplicate)を追加する。（WARNだった場合はNGにする）
+    warnの場合は、NGではないコメントのWARN判定結果のwarn_patternにパターンを追加する。
+    どちらもflood_infoに直近のコメント数などを追加する。
+
+    Parameters:
+    ----
+    live_comments : dict
+      import_live_commentsの戻り値。
+    results : list[tuple]
+      (コメントID, ng_comment, warn_comment)の配列
+
+    Returns:
+    ----
+    results : list[tuple]
+      パターンを追加した(コメントID, ng_comment, warn_comment)の配列。引数と同じ順序で返す。
+    """
+    detected = self.flood_detector.detect_many(live_comments)
+    self.metrics.count('flood_detected', len(detected))
+    if not detected:
+      return results
+
+    flood_results = []
+    for key, ng_comment, warn_comment in results:
+      if key in detected:
+        patterns, flood_info = detected[key]
+        channel_url = live_comments[key].channel_url
+        if self.flood_detector.action == 'ng':
+          if ng_comment is None:
+            ng_comment = {AddNGInfoKeyEnum.NG_CHANNEL.value: channel_url, AddNGInfoKeyEnum.NG_PATTERN.value: []}
+          ng_comment[AddNGInfoKeyEnum.NG_PATTERN.value] = ng_comment[AddNGInfoKeyEnum.NG_PATTERN.value] + patterns
+          ng_comment[FloodInfoKeyEnum.FLOOD_INFO.value] = flood_info
+          warn_comment = None
+        elif ng_comment is None:
+          if warn_comment is None:
+            warn_comment = {AddWarnInfoKeyEnum.WARN_CHANNEL.value: channel_url, AddWarnInfoKeyEnum.WARN_PATTERN.value: []}
+          warn_comment[AddWarnInfoKeyEnum.WARN_PATTERN.value] = warn_comment[AddWarnInfoKeyEnum.WARN_PATTERN.value] + patterns
+          warn_comment[FloodInfoKeyEnum.FLOOD_INFO.value] = flood_info
+      flood_results.append((key, ng_comment, warn_comment))
+    return flood_results
+
+  def judge_comment(self, comment, channel_url):
+    """
+    コメント1件のNG判定, WARN判定を行う。
+
+    Parameters:
+    ----
+    comment : string
+      コメント本体 or コメントの形態素解析結果
+    channel_url : string
+      コメントしたチャンネルのURL
+
+    Returns:
+    ----
+    ng_comment : dict or None
+      NG判定された場合、judged_ng_commentsの値を返す。NGではない場合、Noneを返す。
+    warn_comment : dict or None
+      WARN判定された場合、judged_warn_commentsの値を返す。WARNではない場合、Noneを返す。
+    """
+    return self.judge_comment_many([comment], [channel_url])[0]
+
+  def judge_comment_many(self, comments, channel_urls, messages=None):
+    """
+    まとめてNG判定, WARN判定を行う。
+    同じコメントのNGパターンによる判定と言語判定は1回だけ行い、チャンネルURLによる判定はコメントごとに行う。
+    NG判定を先に行い、NGではないコメントをWarnRuleEngineでまとめてWARN判定する。
+    言語判定はWARNになり得るコメントだけまとめて行う。
+
+    Parameters:
+    ----
+    comments : list[string]
+      コメント本体 or コメントの形態素解析結果の配列
+    channel_urls : list[string]
+      コメントしたチャンネルのURLの配列
+    messages : list[string]
+      元のメッセージの配列。warn_targetがmessageの場合にWARN判定の対象にする。Noneの場合はcommentsを使う。
+
+    Returns:
+    ----
+    results : list[tuple]
+      (ng_comment, warn_comment)の配列。引数と同じ順序で返す。値はjudge_commentと同じ。
+    """
+    results = []
+    # コメント1件あたりの判定時間（ミリ秒）。まとめて行う言語判定の時間は含まない。
+    latencies = []
+    # WARN判定するコメント（NGではないもの）の位置
+    warn_targets = []
+    # 同じコメントのNGパターンによる判定結果は使い回す。
+    # key : コメント(正規化しない。正規化するとNGパターンとの類似度が変わり、判定結果が変わり得るため)
+    # value : judgement_by_patternの戻り値
+    pattern_results = {}
+    for comment, channel_url in zip(comments, channel_urls):
+      start = time.perf_counter()
+      if comment not in pattern_results:
+        pattern_results[comment] = self.judgement_by_pattern(comment, self.ng_pattern_index, self.threshold)
+        self.metrics.add_time('judgement_by_pattern', time.perf_counter() - start)
+      ng_comment = self.judge_ng(pattern_results[comment], channel_url)
+      if ng_comment is None:
+        warn_targets.append(len(results))
+      results.append((ng_comment, None))
+      latencies.append((time.perf_counter() - start) * 1000)
+    self.metrics.count('dedup_comments', len(comments))
+    self.metrics.count('dedup_unique', len(pattern_results))
+
+    # WARN判定の特徴量を求め、言語判定が必要なコメントを絞り込む。
+    start = time.perf_counter()
+    engine = self.get_warn_rule_engine()
+    texts = messages if messages is not None and self.warn_target == 'message' else comments
+    warn_texts = [texts[i] for i in warn_targets]
+    features = engine.get_features(warn_texts)
+    lang_targets = engine.get_lang_targets(features)
+    warn_time = time.perf_counter() - start
+    self.metrics.count('lang_skipped', len(warn_targets) - len(lang_targets))
+
+    # 言語判定
+    langs = self.detect_langs([warn_texts[j] for j in lang_targets])
+
+    # WARN判定
+    start = time.perf_counter()
+    for j, warn_result in zip(lang_targets, engine.judge(features, lang_targets, langs)):
+      if warn_result is not None:
+        i = warn_targets[j]
+        results[i] = (None, self.create_warn_comment(warn_result, channel_urls[i]))
+    warn_time += time.perf_counter() - start
+    self.metrics.add_time('warn_rule', warn_time)
+    # まとめて行ったWARN判定の時間は、対象のコメントで等分する。
+    for i in warn_targets:
+      latencies[i] += warn_time / len(warn_targets) * 1000
+
+    for latency in latencies:
+      self.metrics.observe_latency(latency)
+    return results
+
+  def judge_ng(self, pattern_result, channel_url):
+    """
+    コメント1件のNG判定を行う。
+    NGパターンによる判定結果は同じコメントで使い回し、チャンネルURLによる判定はコメントごとに行う。
+
+    Parameters:
+    ----
+    pattern_result : tuple
+      コメントのjudgement_by_patternの戻り値。変更しない。
+    channel_url : string
+      コメントしたチャンネルのURL
+
+    Returns:
+    ----
+    ng_comment : dict or None
+      NG判定された場合、judged_ng_commentsの値を返す。NGではない場合、Noneを返す。
+    """
+    # NG判定
+    # コメントのパターンからNG判定する。
+    # 形態素解析有りと無しでNGパターンの型が異なるので、インデックスの生成はポリモーフィズムを使う。
+    # TODO ng_commentの構成がコメント、READMEと一致しているか確認する
+    ng, ng_comment, judgement_pattern = pattern_result
+    ng_comment = dict(ng_comment)
+    judgement_pattern = list(judgement_pattern)
+
+    # チャンネルURLから判断
+    if channel_url in self.ng_channels:
+      ng = True
+      judgement_pattern.append('channel')
+
+    # どのチェックで引っかかったかを登録
+    if ng:
+      ng_comment[AddNGInfoKeyEnum.NG_CHANNEL.value] = channel_url
+      ng_comment[AddNGInfoKeyEnum.NG_PATTERN.value] = judgement_pattern
+      return ng_comment
+    return None
+
+  def detect_langs(self, comments):
+    """
+    まとめて言語判定する。判定結果はLRUとキャッシュで使い回す。
+
+    Returns:
+    ----
+    langs : list[string]
+      言語の配列。引数と同じ順序で返す。
+    """
+    detector = self.language_detector
+    hit_count, detect_count = detector.hit_count, detector.detect_count
+    with self.metrics.stage('get_lang'):
+      langs = detector.detect_many(comments)
+    self.metrics.count('lang_lru_hit', detector.hit_count - hit_count)
+    self.metrics.count('lang_detected', detector.detect_count - detect_count)
+    return langs
+
+  def create_warn_comment(self, warn_result, channel_url):
+    """
+    WarnRuleEngine.judgeの判定結果から、judged_warn_commentsの値を作る。
+    """
+    comment_language, warn_pattern, values = warn_result
+    warn_comment_info = {AddWarnInfoKeyEnum.LANG.value: comment_language}
+    # length, WARNになったlength以外のルールの特徴量
+    warn_comment_info.update(values)
+    return {
+      AddWarnInfoKeyEnum.WARN_COMMENT_INFO.value: warn_comment_info,
+      AddWarnInfoKeyEnum.WARN_CHANNEL.value: channel_url,
+      AddWarnInfoKeyEnum.WARN_PATTERN.value: warn_pattern
+    }
+
+  def get_dedup_stats(self):
+    """
+    判定したコメント数と、そのうち重複を除いたコメント数を返す。
+    """
+    comments = self.metrics.counters.get('dedup_comments', 0)
+    unique = self.metrics.counters.get('dedup_unique', 0)
+    return {
+      'comments': comments,
+      'unique': unique,
+      'dedup_ratio': 1.0 - unique / comments if comments > 0 else 0.0
+    }
+
+  def get_report(self):
+    """
+    判定処理の計測結果を返す。
+    """
+    report = {
+      'video_id': self.video_id,
+      'class': type(self).__name__,
+      'threshold': self.threshold,
+      'workers': self.workers,
+      'match_top_k': self.match_top_k,
+      'warn_rules': self.warn_rules,
+      'warn_target': self.warn_target
+    }
+    report.update(self.metrics.to_dict())
+    report['dedup'] = self.get_dedup_stats()
+    if self.ng_pattern_index is not None:
+      # 類似度を計算した回数と、上限値で除外した回数
+      report['ng_pattern_index'] = self.ng_pattern_index.get_stats()
+    mplg_stats = self.get_mplg_stats()
+    if mplg_stats:
+      report['mplg'] = mplg_stats
+    if self.cache is not None:
+      report['cache'] = self.cache.get_stats()
+    if self.flood_detector is not None:
+      report['flood'] = self.flood_detector.get_stats()
+    return report
+
   def get_result_all_comments(self):
     return self.result_all_comments
   def get_result_ok_comments(self):
@@ -191,20 +713,62 @@ class JudgementInterface():
     live_comments : dict
       key : string
         コメントID。['items']['id']で取得できた値。
-      value : dict
-        コメントIDに紐づくjson(Python上はdict)
+      value : CommentRecord
+        コメントIDに紐づくコメント。
+        判定に必要な項目だけを保持し、json全体はoutput/all配下の出力時に読み直す。
     """
     INPUT_COMMENT_PATH = './input/comment/' + video_id + '/**'
     live_comments = {}
-    for file in [p for p in glob.glob(INPUT_COMMENT_PATH , recursive=True) if os.path.isfile(p) and os.path.splitext(p)[1][1:] != 'gitkeep' ]:
-      with open(file, mode='r') as f:
-        comments = json.load(f)
-        # コメント本体(items配下)だけほしい。
-        for comment in comments['items']:
-          comment_id = comment['id']
-          live_comments[comment_id] = comment;
+    files = [p for p in glob.glob(INPUT_COMMENT_PATH , recursive=True) if os.path.isfile(p) and os.path.splitext(p)[1][1:] != 'gitkeep' ]
+    # ファイルは別スレッドで先読みし、読み込みとjsonの解析を並行して行う。
+    for file, comments in PageReader(files):
+      # コメント本体(items配下)だけほしい。
+      for index, comment in enumerate(comments['items']):
+        comment_id = comment['id']
+        live_comments[comment_id] = CommentRecord.from_dict(comment, file, index)
     return live_comments
 
+  def get_comment_info(self, record):
+    """
+    コメントのjson全体を返す。
+    読み込み元のファイルを読み直す。直前に読み込んだファイルは使い回す。
+
+    Parameters:
+    ----
+    record : CommentRecord
+      import_live_commentsの戻り値の値
+
+    Returns:
+    ----
+    comment_info : dict
+      コメントIDに紐づくjson(Python上はdict)
+    """
+    if record.raw is not None:
+      return record.raw
+    if record.file != self.loaded_comment_file:
+      self.loaded_comment_items = JsonCodec.load_file(record.file)['items']
+      self.loaded_comment_file = record.file
+    return self.loaded_comment_items[record.index]
+
+  @classmethod
+  def import_lang_len(cls):
+    """
+    言語ごとのWARN判定文字列長を読み込む。
+
+    Returns:
+    ----
+    lang_len : dict
+      key : 言語
+      value : 文字列長
+    """
+    lang_len = {}
+    with open(JudgementInterface.LANG_LEN_PATH, mode='r') as f:
+      for line in f.readlines():
+        lines = line.replace('\r', '').replace('\n', '').split('\t')
+        lang_len[lines[0]] = int(lines[1])
+    logger.info("lang_len: {}".format(lang_len))
+    return lang_len
+
   def import_ng_channel(self):
     """
     NGチャンネル一覧を読み込む。
@@ -215,10 +779,26 @@ class JudgementInterface():
     
     Returns:
     ----
-    ng_channels: list
-      NGチャンネル一覧
+    ng_channels: ChannelBlocklist
+      NGチャンネル一覧。チャンネルURLで存在確認できる。
+      ng_channel_storeがmergeの場合は、蓄積したNGチャンネルを含む。
     """
-    return JudgementInterface.read_dir(JudgementInterface.NG_CHANNEL_DIR)
+    ng_channels = ChannelBlocklist.load(JudgementInterface.NG_CHANNEL_DIR)
+    if self.ng_channel_store is not None and self.ng_channel_store.is_merged():
+      ng_channels = ng_channels.union(self.ng_channel_store.get_channel_ids())
+    return ng_channels
+
+  def record_ng_channels(self, ng_channels):
+    """
+    NGに設定したユーザのチャンネルURLをng_channel_storeに追記する。ng_channel_storeがない場合は何もしない。
+
+    Parameters:
+    ----
+    ng_channels : list[string]
+      get_result_ng_channelsの戻り値, またはその一部
+    """
+    if self.ng_channel_store is not None:
+      self.ng_channel_store.append(self.video_id, ng_channels)
 
   @abstractmethod
   def import_ng_pattern(self, path):
@@ -254,34 +834,48 @@ class JudgementInterface():
         対象のコメントはENV_KEYを使用して取得する。（GoogleAPIが返してくるjsonがコメントの種類によってキーが異なる。）
     """
     
-    morphological_analysis_result = {}
-    for key in live_comments:
-      comment = CommentTypeEnum.get_comment(live_comments[key])    
+    keys = list(live_comments)
+    comments = [live_comments[key].message for key in keys]
 
-      # 形態素解析（実際に行うかは実装クラス依存。）
-      comment = self.mplg(comment)
-      morphological_analysis_result[key] = comment
-  
-    return morphological_analysis_result
+    # 形態素解析（実際に行うかは実装クラス依存。）
+    with self.metrics.stage('mplg'):
+      comments = self.mplg_unique(comments)
+
+    return dict(zip(keys, comments))
     
   @abstractmethod
-  def judgement_by_pattern(self, comment, ng_patterns, threshold):
+  def create_ng_pattern_index(self, ng_patterns):
+    """ NGパターンの類似度判定用インデックスを生成する。
+    Parameters
+    ---
+    ng_patterns : list or dict
+      import_ng_patternの戻り値
+    """
     pass
 
-  def judgement_by_pattern_common(self, comment, ng_pattern, threshold, ng_pattern_value):
+  def create_ng_pattern_index_from_corpus(self, corpus):
+    """ コンパイル済みのNGパターンから類似度判定用インデックスを生成する。
+    Parameters
+    ---
+    corpus : PatternCorpus
+      load_ng_pattern_corpusの戻り値
     """
-    コメントによるNG判定のうち、共通部分の処理。
+    return NGPatternIndex(corpus.get_patterns())
+
+  def judgement_by_pattern(self, comment, ng_pattern_index, threshold):
+    """
+    コメントによるNG判定。
+    類似度がしきい値を超えたNGパターンのうち、最初のNGパターンで判定する。
+    match_top_kが1以上の場合は、類似度が最も高いNGパターンで判定し、上位match_top_k件をmatchesに設定する。
     
     Paramters:
     ----
     comment : string
       コメント本体 or コメントの形態素解析結果
-    ng_pattern : string
-      NG対象のコメントパターン or NG対象のコメントパターンの形態素解析結果
+    ng_pattern_index : NGPatternIndex
+      create_ng_pattern_indexの戻り値
     threshold : float
       NG判定のしきい値
-    ng_pattern_value : string
-      NGと判定されたときに、返り値のng_commentのpatternに詰めてほしい値
     
     Returns:
     ----
@@ -290,9 +884,11 @@ class JudgementInterface():
     ng_comment : dict
       NG判定された場合、下記を返す。
       ng_comment['ng_comment'] = {
-        'pattern' : 引数のng_pattern_value
+        'pattern' : NGパターンのキー, または元のNGパターンのコメント
         'similarity': 類似度
       }
+      match_top_kが1以上の場合は、下記も返す。
+      ng_comment['matches'] = [{'pattern', 'similarity'}, ...] (類似度の高い順)
       NG判定されなかった場合、空の辞書型を返す。
     ng_pattern : array
       NG判定された場合、"comment"が詰められた配列を返す。
@@ -301,8 +897,21 @@ class JudgementInterface():
     ng = False
     ng_comment = {}
     judgement_pattern = []
-    similarity = SequenceMatcher(None, comment, ng_pattern).ratio()
-    if similarity > threshold:
+    if self.match_top_k > 0:
+      # 類似度の高い順に返す場合はキャッシュを使わない。
+      results = ng_pattern_index.search_top(comment, threshold, self.match_top_k)
+      result = results[0] if results else None
+      if results:
+        ng_comment[AddNGInfoKeyEnum.MATCHES.value] = [{
+          AddNGInfoKeyEnum.PATTERN.value: ng_pattern_value,
+          AddNGInfoKeyEnum.SIMILARITY.value: similarity
+        } for ng_pattern_value, similarity in results]
+    elif self.cache is not None:
+      result = self.cache.search_pattern(comment, ng_pattern_index, threshold)
+    else:
+      result = ng_pattern_index.search(comment, threshold)
+    if result is not None:
+      ng_pattern_value, similarity = result
       ng_comment[AddNGInfoKeyEnum.NG_COMMENT.value] = {
         AddNGInfoKeyEnum.PATTERN.value: ng_pattern_value,
         AddNGInfoKeyEnum.SIMILARITY.value: similarity
@@ -368,50 +977,49 @@ class JudgementInterface():
     # TODO Paramters を修正する
     # TODO WARNを判定した箇所で生成する
 
-    return_comment_list = []
-    ok_only_comments = []
-    ng_only_comments = []
-    warn_only_comments = []
-  
+    writer = ResultListWriter()
+    self.write_comments(writer, comments, ng_comments, warn_comments)
+    return writer.all_comments, writer.ok_comments, writer.ng_comments, writer.warn_comments
+
+  def write_comments(self, writer, comments, ng_comments, warn_comments):
+    """
+    コメントにNG情報を付与し、1件ずつwriterに書き込む。
+    書き込む内容はmerge_commentsの戻り値と同じ。
+
+    Parameters:
+    ----
+    writer : ResultWriter or ResultListWriter
+      書き込み先
+    comments : dict
+      JudgementInterface.import_live_commentsメソッドの戻り値。
+    ng_comments : dict
+      NG判定されたコメント
+    warn_comments : dict
+      WARN判定されたコメント
+    """
     for comment_id in comments:
-      comment_info = comments[comment_id]
-  
-      # TODO : もうちょっとなんとかならんか
-      ID = OutputCommentKeyEnum.ID.get_ng_key()
-      CHANNEL_ID = OutputCommentKeyEnum.CHANNEL_ID.get_ng_key()
-      DISPLAY_NAME = OutputCommentKeyEnum.DISPLAY_NAME.get_ng_key()
-      DISPLAY_MESSAGE = OutputCommentKeyEnum.DISPLAY_MESSAGE.get_ng_key()
-  
-      ID_ORIGIN = OutputCommentKeyEnum.ID.get_origin_key()
-      CHANNEL_ID_ORIGIN = OutputCommentKeyEnum.CHANNEL_ID.get_origin_key()
-      DISPLAY_NAME_ORIGIN = OutputCommentKeyEnum.DISPLAY_NAME.get_origin_key()
-      DISPLAY_MESSAGE_ORIGIN = OutputCommentKeyEnum.DISPLAY_MESSAGE.get_origin_key()
-  
+      record = comments[comment_id]
+      comment_info = self.get_comment_info(record)
+
       # ng_only_comments, warn_only_comments, ok_only_commentsに追加する用の変数。
-      tmp_comment = {
-        ID :              comment_info[ID_ORIGIN[0]],
-        CHANNEL_ID :      comment_info[CHANNEL_ID_ORIGIN[0]][CHANNEL_ID_ORIGIN[1]],
-        DISPLAY_NAME :    comment_info[DISPLAY_NAME_ORIGIN[0]][DISPLAY_NAME_ORIGIN[1]],
-        DISPLAY_MESSAGE : comment_info[DISPLAY_MESSAGE_ORIGIN[0]][DISPLAY_MESSAGE_ORIGIN[1]]
-      }
-      
+      tmp_comment = record.get_output_comment()
+
       if comment_id in ng_comments:
         comment_info[AddNGInfoKeyEnum.NG_FLG.value] = True
         comment_info[AddNGInfoKeyEnum.NG_INFO.value] = ng_comments[comment_id]
         comment_info[AddWarnInfoKeyEnum.WARN_FLG.value] = False
-        ng_only_comments.append(tmp_comment)
+        writer.write_ng(tmp_comment)
       elif comment_id in warn_comments:
         comment_info[AddNGInfoKeyEnum.NG_FLG.value] = False
         comment_info[AddWarnInfoKeyEnum.WARN_FLG.value] = True
         comment_info[AddWarnInfoKeyEnum.WARN_INFO.value] = warn_comments[comment_id]
-        warn_only_comments.append(tmp_comment)        
+        writer.write_warn(tmp_comment)
       else:
         comment_info[AddNGInfoKeyEnum.NG_FLG.value] = False
         comment_info[AddWarnInfoKeyEnum.WARN_FLG.value] = False
-        ok_only_comments.append(tmp_comment)
+        writer.write_ok(tmp_comment)
   
-      return_comment_list.append(comment_info)
-    return return_comment_list, ok_only_comments, ng_only_comments, warn_only_comments
+      writer.write_all(comment_info)
 
   @abstractmethod
   def mplg(self, text):
@@ -419,6 +1027,26 @@ class JudgementInterface():
     """
     pass
 
+  def mplg_many(self, texts):
+    """ 
+    必要であればまとめて形態素解析を行う。引数と同じ順序で返す。
+    """
+    return [self.mplg(text) for text in texts]
+
+  def mplg_unique(self, texts):
+    """
+    同じ文字列は1回だけ形態素解析する。引数と同じ順序で返す。
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    results = dict(zip(unique_texts, self.mplg_many(unique_texts)))
+    return [results[text] for text in texts]
+
+  def get_mplg_stats(self):
+    """
+    形態素解析の計測値を返す。形態素解析しない場合は空の辞書型を返す。
+    """
+    return {}
+
   @classmethod
   def read_dir(cls, path):
     """
@@ -440,10 +1068,13 @@ class JudgementInterface():
       
     """
     return_value_list = []
+    # 重複確認用
+    return_value_set = set()
     for file in [p for p in glob.glob(path , recursive=True) if os.path.isfile(p) and os.path.splitext(p)[1][1:] != 'gitkeep' ]:
       with open(file, mode='r') as f:
         for line in f.read().splitlines():
-          if line not in return_value_list:
+          if line not in return_value_set:
+            return_value_set.add(line)
             return_value_list.append(line)
     return return_value_list
 
@@ -461,17 +1092,32 @@ class JudgementInterface():
     ----
     string : 引数で渡された文字列の言語
     """
-    isReliable, textBytesFound, details = cld2.detect(text)
+    isReliable, textBytesFound, details = JudgementInterface.load_lang_detector().detect(text)
     return details[0][1]
 
+  @classmethod
+  def load_lang_detector(cls):
+    """
+    言語判定ライブラリ(pycld2)を返す。まだ読み込んでいない場合は読み込む。
+
+    Returns:
+    ----
+    cld2 : module
+      インストールされていない場合はImportErrorを投げる。
+    """
+    global cld2
+    if cld2 is None:
+      import pycld2 as cld2
+    return cld2
+
 class NotUseMPLGJudgement(JudgementInterface):
   """ NG判定時に形態素解析を使用しない """
 
   # NGコメント一覧のファイルが配置してあるパス
   NG_COMMENT_DIR = './input/ng_comment/**'
 
-  def __init__(self, video_id, threshold):
-    super().__init__(video_id, NotUseMPLGJudgement.NG_COMMENT_DIR, threshold)
+  def __init__(self, video_id, threshold, workers=1, chunk_size=1000, cache=None, match_top_k=0, warn_rules=None, warn_target='judged'):
+    super().__init__(video_id, NotUseMPLGJudgement.NG_COMMENT_DIR, threshold, workers, chunk_size, cache, match_top_k, warn_rules, warn_target)
 
   def import_ng_pattern(self, path):
     """ NGパターンの読み込み
@@ -482,16 +1128,10 @@ class NotUseMPLGJudgement(JudgementInterface):
     """
     return JudgementInterface.read_dir(NotUseMPLGJudgement.NG_COMMENT_DIR)
 
-  def judgement_by_pattern(self, comment, ng_patterns, threshold):
-    ng = False
-    ng_comment = {}
-    judgement_pattern = []
-    for i in range(len(ng_patterns)):
-      ng, ng_comment, judgement_pattern = self.judgement_by_pattern_common(comment, ng_patterns[i], threshold, ng_patterns[i])
-      if ng:
-        # NGで引っかかった場合はその時点でループを抜ける。
-        break
-    return ng, ng_comment, judgement_pattern
+  def create_ng_pattern_index(self, ng_patterns):
+    """ NGコメントをそのまま比較対象にする。
+    """
+    return NGPatternIndex([(ng_pattern, ng_pattern) for ng_pattern in ng_patterns])
 
   def mplg(self, text):
     """ 
@@ -499,6 +1139,11 @@ class NotUseMPLGJudgement(JudgementInterface):
     """
     return text
 
+  def tokenize_ng_patterns(self, texts):
+    """ 文字列全体で比較するので、トークンは使わない。MeCabを使わずに空のトークンを返す。
+    """
+    return [([], []) for _ in texts]
+
 class UseMPLGJudegement(JudgementInterface):
   """ NG判定時に形態素解析を使用する """
 
@@ -508,8 +1153,20 @@ class UseMPLGJudegement(JudgementInterface):
   # NGパターンの形態素解析結果を配置しているファイルパス
   NG_PATTERN_DIR = './input/ng_pattern/**'
 
-  def __init__(self, video_id, threshold):
-    super().__init__(video_id, UseMPLGJudegement.NG_PATTERN_DIR, threshold)
+  # 類似度の比較方法
+  # char : 形態素解析結果の文字列全体を1文字ずつ比較する。
+  # surface : 表層形のトークン列で比較する。
+  # base : 原形のトークン列で比較する。
+  SIMILARITY_ENGINES = ['char', 'surface', 'base']
+
+  def __init__(self, video_id, threshold, workers=1, chunk_size=1000, cache=None, similarity_engine='char', match_top_k=0, \
+    warn_rules=None, warn_target='judged'):
+    super().__init__(video_id, UseMPLGJudegement.NG_PATTERN_DIR, threshold, workers, chunk_size, cache, match_top_k, warn_rules, warn_target)
+    if similarity_engine not in UseMPLGJudegement.SIMILARITY_ENGINES:
+      raise ValueError('similarity_engine must be one of {} : {}'.format(UseMPLGJudegement.SIMILARITY_ENGINES, similarity_engine))
+    self.similarity_engine = similarity_engine
+    # Taggerはプロセス（スレッド）内で使い回す。
+    self.tagger_engine = TaggerEngine.get_engine(UseMPLGJudegement.DIC_PATH)
 
   def import_ng_pattern(self, path):
     """
@@ -534,20 +1191,41 @@ class UseMPLGJudegement(JudgementInterface):
         ng_pattern[file] = f.read()
     return ng_pattern  
 
-  def judgement_by_pattern(self, comment, ng_patterns, threshold):
-    ng = False
-    ng_comment = {}
-    judgement_pattern = []
-    for ng_key in ng_patterns:
-      ng, ng_comment, judgement_pattern = self.judgement_by_pattern_common(comment, ng_patterns[ng_key], threshold, ng_key)
-      if ng:
-        # NGで引っかかった場合はその時点でループを抜ける。
-        break
-    return ng, ng_comment, judgement_pattern
+  def create_ng_pattern_index(self, ng_patterns):
+    """ ファイル内容（形態素解析結果）を比較対象にし、ファイルパスをNGパターンのキーにする。
+    """
+    patterns = [(ng_key, ng_patterns[ng_key]) for ng_key in ng_patterns]
+    if self.similarity_engine == 'char':
+      return NGPatternIndex(patterns)
+    # NumPyの読み込みに時間がかかるため、トークン列で比較する場合だけ読み込む。
+    from tokenindex import TokenPatternIndex
+    return TokenPatternIndex.from_patterns(patterns, self.similarity_engine == 'base')
+
+  def create_ng_pattern_index_from_corpus(self, corpus):
+    """ トークン列で比較する場合は、コンパイル済みのトークンIDを使う。
+    """
+    if self.similarity_engine == 'char':
+      return NGPatternIndex(corpus.get_patterns())
+    from tokenindex import TokenPatternIndex
+    return TokenPatternIndex.from_corpus(corpus, self.similarity_engine == 'base')
 
   def mplg(self, text):
     """ 形態素解析する。
     """
-    m = MeCab.Tagger(UseMPLGJudegement.DIC_PATH)
-    soup = m.parse (text)
-    return soup
+    return self.tagger_engine.parse(text)
+
+  def mplg_many(self, texts):
+    """ まとめて形態素解析する。
+    """
+    if self.cache is not None:
+      return self.cache.get_mplg_many(texts, UseMPLGJudegement.DIC_PATH, self.tagger_engine.parse_many)
+    return self.tagger_engine.parse_many(texts)
+
+  def tokenize_ng_patterns(self, texts):
+    """ NGパターンは形態素解析結果なので、そのままトークンにする。
+    """
+    return [PatternCorpus.tokenize(text) for text in texts]
+
+  def get_mplg_stats(self):
+    return self.tagger_engine.get_stats()
+
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+class LanguageDetector():
+  """
+  言語判定結果をLRUで保持し、同じコメントの言語判定を繰り返さない。
+  LRUにない場合は、キャッシュ(JudgementCache)があればキャッシュから取得し、なければ判定する。
+  """
+
+  # LRUに保持するコメント数
+  LRU_SIZE = 10000
+
+  def __init__(self, detect, cache=None, size=LRU_SIZE):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    detect : callable
+      言語判定する関数。引数は文字列, 戻り値は言語。
+    cache : JudgementCache
+      判定結果のキャッシュ。Noneの場合はキャッシュしない。
+    size : int
+      LRUに保持するコメント数
+    """
+    self.detect = detect
+    self.cache = cache
+    self.size = size
+    # key : コメント(正規化しない。正規化すると言語判定の入力が変わり、判定結果が変わり得るため)
+    # value : 言語
+    self.lru = OrderedDict()
+
+    # 計測値
+    self.hit_count = 0
+    self.detect_count = 0
+
+  def detect_many(self, texts):
+    """
+    まとめて言語判定する。同じ文字列は1回だけ判定する。
+
+    Parameters:
+    ----
+    texts : list[string]
+      対象の文字列の配列
+
+    Returns:
+    ----
+    langs : list[string]
+      言語の配列。引数と同じ順序で返す。
+    """
+    langs = {}
+    for text in texts:
+      if text in langs:
+        self.hit_count += 1
+      elif text in self.lru:
+        self.lru.move_to_end(text)
+        langs[text] = self.lru[text]
+        self.hit_count += 1
+      else:
+        if self.cache is not None:
+          lang = self.cache.get_lang(text, self.detect)
+        else:
+          lang = self.detect(text)
+        self.detect_count += 1
+        langs[text] = lang
+        self.lru[text] = lang
+        if len(self.lru) > self.size:
+          self.lru.popitem(last=False)
+    return [langs[text] for text in texts]
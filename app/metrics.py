@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from bisect import bisect_left
+import time
+
+class Metrics():
+  """
+  判定処理の計測値を保持する。
+    - 段階ごとの処理時間（秒）と呼び出し回数
+    - 件数
+    - コメント1件あたりの判定時間（ミリ秒）のヒストグラム
+  """
+
+  # ヒストグラムの区切り（ミリ秒）。最後の区切りより大きい値は+Infに数える。
+  LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 50.0, 100.0, 500.0, 1000.0]
+
+  def __init__(self):
+    # key : 段階名
+    # value : [処理時間の合計（秒）, 呼び出し回数]
+    self.stages = {}
+    # key : 件数名
+    # value : 件数
+    self.counters = {}
+    self.latency_counts = [0] * (len(Metrics.LATENCY_BUCKETS) + 1)
+    self.latency_total = 0.0
+    self.latency_max = 0.0
+
+  @contextmanager
+  def stage(self, name):
+    """
+    withで囲んだ処理の時間を計測する。
+    """
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add_time(name, time.perf_counter() - start)
+
+  def add_time(self, name, elapsed, calls=1):
+    if name not in self.stages:
+      self.stages[name] = [0.0, 0]
+    self.stages[name][0] += elapsed
+    self.stages[name][1] += calls
+
+  def count(self, name, value=1):
+    self.counters[name] = self.counters.get(name, 0) + value
+
+  def observe_latency(self, latency):
+    """
+    コメント1件あたりの判定時間（ミリ秒）を記録する。
+    """
+    self.latency_counts[bisect_left(Metrics.LATENCY_BUCKETS, latency)] += 1
+    self.latency_total += latency
+    self.latency_max = max(self.latency_max, latency)
+
+  def merge(self, other):
+    """
+    別の計測値（to_dictの戻り値）を足し合わせる。ワーカープロセスの計測値の集計に使う。
+    """
+    for name, stage in other['stages'].items():
+      self.add_time(name, stage['time'], stage['calls'])
+    for name, value in other['counters'].items():
+      self.count(name, value)
+    for i, count in enumerate(other['latency']['histogram'].values()):
+      self.latency_counts[i] += count
+    self.latency_total += other['latency']['total_ms']
+    self.latency_max = max(self.latency_max, other['latency']['max_ms'])
+
+  def to_dict(self):
+    latency_count = sum(self.latency_counts)
+    histogram = {}
+    for i, bucket in enumerate(Metrics.LATENCY_BUCKETS):
+      histogram['<=' + str(bucket)] = self.latency_counts[i]
+    histogram['+Inf'] = self.latency_counts[-1]
+    return {
+      'stages': {name: {'time': stage[0], 'calls': stage[1]} for name, stage in self.stages.items()},
+      'counters': dict(self.counters),
+      'latency': {
+        'count': latency_count,
+        'total_ms': self.latency_total,
+        'average_ms': self.latency_total / latency_count if latency_count > 0 else 0.0,
+        'max_ms': self.latency_max,
+        'histogram': histogram
+      }
+    }
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from difflib import SequenceMatcher
+import hashlib
+import math
+
+class NGPatternIndex():
+  """
+  NGパターンの類似度判定用インデックス。
+
+  SequenceMatcher.ratio()は重いため、下記の上限値がしきい値以下のNGパターンは比較せずに除外する。
+    1. 文字列長から求まる上限値（SequenceMatcher.real_quick_ratio()と同じ）
+       文字列長でソートしたNGパターンを二分探索し、候補を絞り込む。
+    2. 文字の出現回数から求まる上限値（SequenceMatcher.quick_ratio()と同じ）
+  除外されなかったNGパターンは登録順に比較し、最初にしきい値を超えたNGパターンを返す。
+  （線形探索と同じ判定結果になる。）
+  """
+
+  def __init__(self, patterns):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    patterns : list[tuple]
+      (NG判定されたときに返す値, 比較対象の文字列)の配列。配列の順序で比較する。
+    """
+    self.values = [pattern[0] for pattern in patterns]
+    self.texts = [pattern[1] for pattern in patterns]
+    self.lengths = [len(text) for text in self.texts]
+    # NGパターンごとの文字の出現回数。必要になったときに数える。(get_char_counts)
+    self.char_counts = [None] * len(self.texts)
+
+    # 文字列長の昇順に並べたNGパターンの位置
+    self.length_order = sorted(range(len(self.texts)), key=lambda i: self.lengths[i])
+    self.sorted_lengths = [self.lengths[i] for i in self.length_order]
+    # 共有しているSharedReferenceData。from_sharedで生成した場合だけ設定する。
+    self.shared = None
+
+    # NGパターンごとのSequenceMatcher。比較対象(seq2)側の前処理を使い回す。
+    self.matchers = [None] * len(self.texts)
+
+    # NGパターンごとのハッシュ値と、NGパターン一覧のフィンガープリント。必要になったときに計算する。
+    self.pattern_hashes = None
+    self.fingerprint = None
+
+    # 計測値
+    self.compared_count = 0
+    self.skipped_count = 0
+
+  def __len__(self):
+    return len(self.texts)
+
+  @classmethod
+  def from_shared(cls, shared):
+    """
+    SharedReferenceDataのNGパターンを直接参照するインデックスを生成する。
+    NGパターンの文字列, 文字列長の並びはプロセスごとに持たず、ファイルを参照する。
+    pickleではSharedReferenceData(ファイルパス)だけを渡す。
+    """
+    index = NGPatternIndex([])
+    index.values = shared.get_pattern_values()
+    index.texts = shared.get_pattern_texts()
+    index.lengths = shared.pattern_lengths
+    index.char_counts = [None] * shared.pattern_count
+    index.length_order = shared.length_order
+    index.sorted_lengths = shared.sorted_lengths
+    index.matchers = [None] * shared.pattern_count
+    index.shared = shared
+    return index
+
+  def __reduce_ex__(self, protocol):
+    if self.shared is None:
+      return super().__reduce_ex__(protocol)
+    return (NGPatternIndex.from_shared, (self.shared,))
+
+  def get_char_counts(self, i):
+    """
+    i番目のNGパターンの文字の出現回数を返す。
+    """
+    char_counts = self.char_counts[i]
+    if char_counts is None:
+      char_counts = Counter(self.texts[i])
+      self.char_counts[i] = char_counts
+    return char_counts
+
+  def get_candidates(self, length, threshold):
+    """
+    文字列長の上限値がしきい値を超えるNGパターンの位置を、登録順に返す。
+
+    Parameters:
+    ----
+    length : int
+      コメントの文字列長
+    threshold : float
+      NG判定のしきい値
+
+    Returns:
+    ----
+    candidates : list[int]
+      NGパターンの位置
+    """
+    if threshold >= 1.0:
+      # 類似度は1.0を超えないので、NGになることはない。
+      return []
+    if threshold <= 0.0:
+      return list(range(len(self.texts)))
+
+    # 類似度の上限値 2 * min(la, lb) / (la + lb) > threshold となる文字列長lbの範囲。
+    # 浮動小数の誤差を考慮して広めに取り、後で上限値を個別に確認する。
+    min_length = math.floor(threshold * length / (2.0 - threshold))
+    max_length = math.ceil(length * (2.0 - threshold) / threshold)
+    lo = bisect_left(self.sorted_lengths, min_length)
+    hi = bisect_right(self.sorted_lengths, max_length)
+    return sorted(self.length_order[lo:hi])
+
+  def search(self, comment, threshold):
+    """
+    コメントとの類似度がしきい値を超える最初のNGパターンを探す。
+
+    Parameters:
+    ----
+    comment : string
+      コメント本体 or コメントの形態素解析結果
+    threshold : float
+      NG判定のしきい値
+
+    Returns:
+    ----
+    result : tuple or None
+      NG判定された場合、(NG判定されたときに返す値, 類似度)を返す。
+      NG判定されなかった場合、Noneを返す。
+    """
+    result = self.search_position(comment, threshold)
+    if result is None:
+      return None
+    return self.values[result[0]], result[1]
+
+  def search_position(self, comment, threshold, positions=None):
+    """
+    コメントとの類似度がしきい値を超える最初のNGパターンの位置を探す。
+
+    Parameters:
+    ----
+    comment : string
+      コメント本体 or コメントの形態素解析結果
+    threshold : float
+      NG判定のしきい値
+    positions : set[int]
+      比較対象にするNGパターンの位置。Noneの場合は全てのNGパターンを比較対象にする。
+
+    Returns:
+    ----
+    result : tuple or None
+      NG判定された場合、(NGパターンの位置, 類似度)を返す。
+      NG判定されなかった場合、Noneを返す。
+    """
+    comment_length = len(comment)
+    comment_counts = None
+    candidates = self.get_candidates(comment_length, threshold)
+    target_count = len(self.texts)
+    if positions is not None:
+      candidates = [i for i in candidates if i in positions]
+      target_count = len(positions)
+    self.skipped_count += target_count - len(candidates)
+
+    for i in candidates:
+      total_length = comment_length + self.lengths[i]
+      if total_length == 0:
+        # 両方空文字の場合、SequenceMatcherは1.0を返す。
+        upper_bound = 1.0
+      else:
+        upper_bound = 2.0 * min(comment_length, self.lengths[i]) / total_length
+      if upper_bound <= threshold:
+        self.skipped_count += 1
+        continue
+
+      if total_length > 0:
+        if comment_counts is None:
+          comment_counts = Counter(comment)
+        pattern_counts = self.get_char_counts(i)
+        small, large = (comment_counts, pattern_counts) if len(comment_counts) < len(pattern_counts) else (pattern_counts, comment_counts)
+        intersection = sum(min(count, large[char]) for char, count in small.items() if char in large)
+        if 2.0 * intersection / total_length <= threshold:
+          self.skipped_count += 1
+          continue
+
+      similarity = self.ratio(i, comment)
+      self.compared_count += 1
+      if similarity > threshold:
+        return i, similarity
+    return None
+
+  def search_top(self, comment, threshold, k):
+    """
+    コメントとの類似度がしきい値を超えるNGパターンのうち、類似度の高い順にk件返す。
+    類似度が同じ場合は登録順に返す。
+
+    上限値の高い順に比較し、上限値がk番目の類似度を下回ったら残りは比較しない。
+
+    Parameters:
+    ----
+    comment : string
+      コメント本体 or コメントの形態素解析結果
+    threshold : float
+      NG判定のしきい値
+    k : int
+      返すNGパターンの件数
+
+    Returns:
+    ----
+    results : list[tuple]
+      (NG判定されたときに返す値, 類似度)の配列。NG判定されなかった場合は空の配列を返す。
+    """
+    comment_length = len(comment)
+    comment_counts = None
+    candidates = self.get_candidates(comment_length, threshold)
+    self.skipped_count += len(self.texts) - len(candidates)
+
+    # 文字列長から求まる上限値の高い順に並べる。
+    bounds = []
+    for i in candidates:
+      total_length = comment_length + self.lengths[i]
+      upper_bound = 1.0 if total_length == 0 else 2.0 * min(comment_length, self.lengths[i]) / total_length
+      bounds.append((-upper_bound, i))
+    bounds.sort()
+
+    # (類似度, 位置)の配列。類似度の高い順, 同じ場合は登録順
+    results = []
+    for checked, (negative_bound, i) in enumerate(bounds):
+      # k件見つかっていて、上限値がk番目の類似度を下回る場合は、残りのNGパターンも上回らない。
+      if len(results) >= k and -negative_bound < results[-1][0]:
+        self.skipped_count += len(bounds) - checked
+        break
+      if -negative_bound <= threshold:
+        self.skipped_count += len(bounds) - checked
+        break
+
+      total_length = comment_length + self.lengths[i]
+      if total_length > 0:
+        if comment_counts is None:
+          comment_counts = Counter(comment)
+        pattern_counts = self.get_char_counts(i)
+        small, large = (comment_counts, pattern_counts) if len(comment_counts) < len(pattern_counts) else (pattern_counts, comment_counts)
+        intersection = sum(min(count, large[char]) for char, count in small.items() if char in large)
+        quick_bound = 2.0 * intersection / total_length
+        if quick_bound <= threshold or (len(results) >= k and quick_bound < results[-1][0]):
+          self.skipped_count += 1
+          continue
+
+      similarity = self.ratio(i, comment)
+      self.compared_count += 1
+      if similarity > threshold:
+        results.append((similarity, i))
+        results.sort(key=lambda result: (-result[0], result[1]))
+        del results[k:]
+    return [(self.values[i], similarity) for similarity, i in results]
+
+  def ratio(self, i, comment):
+    """
+    コメントとi番目のNGパターンの類似度を返す。
+    SequenceMatcher(None, comment, NGパターン).ratio()と同じ値を返す。
+    """
+    matcher = self.matchers[i]
+    if matcher is None:
+      matcher = SequenceMatcher(None, '', self.texts[i])
+      self.matchers[i] = matcher
+    matcher.set_seq1(comment)
+    return matcher.ratio()
+
+  def get_pattern_hashes(self):
+    """
+    NGパターンごとのハッシュ値を登録順に返す。
+    NGパターンの値と比較対象の文字列が同じであれば、同じハッシュ値になる。
+    """
+    if self.pattern_hashes is None:
+      self.pattern_hashes = [ \
+        hashlib.sha1((str(value) + '\0' + text).encode('utf-8')).hexdigest() \
+        for value, text in zip(self.values, self.texts)]
+    return self.pattern_hashes
+
+  def get_fingerprint(self):
+    """
+    NGパターン一覧のフィンガープリントを返す。NGパターンの追加, 削除, 並び替えで値が変わる。
+    """
+    if self.fingerprint is None:
+      self.fingerprint = hashlib.sha1('\n'.join(self.get_pattern_hashes()).encode('utf-8')).hexdigest()
+    return self.fingerprint
+
+  def get_stats(self):
+    """
+    比較した回数と、上限値で除外した回数を返す。
+    """
+    return {
+      'patterns': len(self.texts),
+      'compared': self.compared_count,
+      'skipped': self.skipped_count
+    }
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+from concurrent.futures import ProcessPoolExecutor
+
+import sys
+sys.path.append('./')
+from metrics import Metrics
+
+logger = getLogger("same_hierarchy")
+
+# ワーカープロセス内で使用する判定インスタンス
+_worker_judgement = None
+
+def init_worker(judgement_class, video_id, threshold, ng_channels, ng_pattern_index, cache, match_top_k=0, warn_rules=None, warn_target='judged'):
+  """
+  ワーカープロセスの初期化。
+  NGチャンネル一覧とNGパターンはワーカープロセスごとに1回だけ受け取る。
+  キャッシュはワーカープロセスごとに接続し直す。
+  """
+  global _worker_judgement
+  _worker_judgement = judgement_class(video_id, threshold, cache=cache, match_top_k=match_top_k, warn_rules=warn_rules, warn_target=warn_target)
+  _worker_judgement.ng_channels = ng_channels
+  _worker_judgement.ng_pattern_index = ng_pattern_index
+
+def judge_chunk(chunk):
+  """
+  ワーカープロセスでコメントの塊を判定する。
+
+  Parameters:
+  ----
+  chunk : list[tuple]
+    (コメントID, コメント, チャンネルURL)の配列
+
+  Returns:
+  ----
+  results : list[tuple]
+    (コメントID, ng_comment, warn_comment)の配列。引数と同じ順序で返す。
+  stats : dict
+    この塊で行ったNGパターンの比較回数, 除外回数
+  metrics : dict
+    この塊の計測値(Metrics.to_dictの戻り値)
+  """
+  judgement = _worker_judgement
+  judgement.metrics = Metrics()
+  index = judgement.ng_pattern_index
+  compared_count, skipped_count = index.compared_count, index.skipped_count
+
+  with judgement.metrics.stage('mplg'):
+    comments = judgement.mplg_unique([comment for key, comment, channel_url in chunk])
+  judged = judgement.judge_comment_many(comments, [channel_url for key, comment, channel_url in chunk], \
+    [comment for key, comment, channel_url in chunk])
+  results = [(key, ng_comment, warn_comment) for (key, _, _), (ng_comment, warn_comment) in zip(chunk, judged)]
+  if judgement.cache is not None:
+    judgement.cache.commit()
+
+  stats = {
+    'compared': index.compared_count - compared_count,
+    'skipped': index.skipped_count - skipped_count
+  }
+  return results, stats, judgement.metrics.to_dict()
+
+def judge_comments_parallel(judgement, live_comments):
+  """
+  コメントを塊に分割し、複数プロセスで判定する。
+  判定結果は元のコメント順に結合するので、直列で判定した場合と同じ結果になる。
+
+  Parameters:
+  ----
+  judgement : JudgementInterface
+    prepareを実行済みの判定インスタンス
+  live_comments : dict
+    import_live_commentsの戻り値。
+
+  Returns:
+  ----
+  results : list[tuple]
+    (コメントID, ng_comment, warn_comment)の配列。live_commentsと同じ順序で返す。
+  """
+  comments = [(key, live_comments[key].message, live_comments[key].channel_url) for key in live_comments]
+  chunks = [comments[i:i + judgement.chunk_size] for i in range(0, len(comments), judgement.chunk_size)]
+  logger.info("parallel workers : {}, chunks : {}".format(judgement.workers, len(chunks)))
+
+  results = []
+  index = judgement.ng_pattern_index
+  # use_shared_dataの場合は、ワーカープロセスにはファイルパスだけを渡す。
+  ng_channels, worker_index = judgement.get_worker_reference_data()
+  with ProcessPoolExecutor( \
+    max_workers=judgement.workers, \
+    initializer=init_worker, \
+    initargs=(type(judgement), judgement.video_id, judgement.threshold, ng_channels, worker_index, judgement.cache, judgement.match_top_k, \
+      judgement.warn_rules, judgement.warn_target)) as executor:
+    # mapは投入順に結果を返す。
+    for chunk_results, stats, metrics in executor.map(judge_chunk, chunks):
+      results.extend(chunk_results)
+      index.compared_count += stats['compared']
+      index.skipped_count += stats['skipped']
+      judgement.metrics.merge(metrics)
+  return results
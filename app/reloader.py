@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+import settings
+import os
+import threading
+
+import sys
+sys.path.append('./')
+from util import FileUtil
+
+logger = getLogger("same_hierarchy")
+
+class NGDataReloader():
+  """
+  NGチャンネル一覧, NGパターン, lang_len.tsv, warn_rule.tsv, .envの変更を監視し、変更されたら別スレッドで読み込み直す。
+
+  読み込み直した値は判定インスタンスに直接設定せず、判定インスタンスがjudge_commentsの開始時に
+  takeで受け取って丸ごと差し替える。（判定中に止まらず、読み込み途中の値を使うこともない。）
+  """
+
+  def __init__(self, judgement, interval):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    judgement : JudgementInterface
+      prepareを実行済みの判定インスタンス
+    interval : float
+      変更を確認する間隔（秒）
+    """
+    self.judgement = judgement
+    self.interval = interval
+    self.fingerprint = self.get_fingerprint()
+
+    self.lock = threading.Lock()
+    # 読み込み直した値(load_ng_dataの戻り値)。判定インスタンスが受け取るまで保持する。
+    self.pending = None
+    self.stop_event = threading.Event()
+    self.thread = None
+
+    # 計測値
+    self.reload_count = 0
+    self.error_count = 0
+
+  def get_files(self):
+    """
+    監視するファイルの一覧を返す。
+    """
+    judgement = self.judgement
+    files = FileUtil.list_files(judgement.NG_CHANNEL_DIR) + FileUtil.list_files(judgement.ng_pattern_path)
+    paths = [judgement.get_corpus_path(), judgement.LANG_LEN_PATH, judgement.WARN_RULE_PATH, settings.dotenv_path]
+    if judgement.ng_channel_store is not None and judgement.ng_channel_store.is_merged():
+      paths.append(judgement.ng_channel_store.log_path)
+    for path in paths:
+      if os.path.isfile(path):
+        files.append(path)
+    return files
+
+  def get_fingerprint(self):
+    return FileUtil.get_fingerprint(self.get_files())
+
+  def start(self):
+    """
+    監視用のスレッドを開始し、判定インスタンスに登録する。
+    """
+    self.judgement.reloader = self
+    self.thread = threading.Thread(target=self.run, name='ng_data_reloader', daemon=True)
+    self.thread.start()
+
+  def stop(self):
+    self.stop_event.set()
+    if self.thread is not None:
+      self.thread.join()
+    self.judgement.reloader = None
+
+  def run(self):
+    while not self.stop_event.wait(self.interval):
+      self.check()
+
+  def check(self):
+    """
+    ファイルが変更されていれば読み込み直す。
+
+    Returns:
+    ----
+    reloaded : boolean
+      読み込み直した場合はTrue
+    """
+    try:
+      fingerprint = self.get_fingerprint()
+    except OSError:
+      # 確認中にファイルが削除された場合は、次回に確認し直す。
+      return False
+    if fingerprint == self.fingerprint:
+      return False
+    logger.info("ng data changed. reloading.")
+
+    try:
+      env = settings.read_env_file()
+      threshold = float(env['similarity_threshold']) if 'similarity_threshold' in env else None
+      ng_data = self.judgement.load_ng_data(threshold)
+    except Exception:
+      # 読み込みに失敗した場合は、現在の値で判定を続ける。
+      # フィンガープリントは更新しないので、次回の確認で読み込み直す。
+      logger.exception("reload failed")
+      self.error_count += 1
+      return False
+    self.fingerprint = fingerprint
+
+    with self.lock:
+      # 判定インスタンスが受け取る前に再度読み込み直した場合、古い方は使われない。
+      if self.pending is not None and self.pending['ng_pattern_corpus'] is not None:
+        self.pending['ng_pattern_corpus'].close()
+      self.pending = ng_data
+      self.reload_count += 1
+    return True
+
+  def take(self):
+    """
+    読み込み直した値を返す。読み込み直していない場合はNoneを返す。
+    """
+    with self.lock:
+      ng_data, self.pending = self.pending, None
+    return ng_data
+
+  def get_stats(self):
+    return {
+      'reload': self.reload_count,
+      'error': self.error_count
+    }
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger, config, StreamHandler, DEBUG
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import settings
+import asyncio
+import time
+
+import sys
+sys.path.append('./')
+from util import LogUtil
+from reloader import NGDataReloader
+from commentutil import AddNGInfoKeyEnum, CommentRecord
+from jsoncodec import JsonCodec, PageReader
+
+logger = getLogger(__name__)
+log_conf = LogUtil.get_log_conf('./log_config.json')
+config.dictConfig(log_conf)
+handler = StreamHandler()
+handler.setLevel(DEBUG)
+logger.setLevel(DEBUG)
+logger.addHandler(handler)
+logger.propagate = False
+
+# 待ち受けるホストとポート
+SERVER_HOST = settings.ENV_DIC['server_host']
+SERVER_PORT = int(settings.ENV_DIC['server_port'])
+
+# リクエストをまとめて判定するときの、1回あたりのコメント数の上限
+SERVER_BATCH_COMMENTS = int(settings.ENV_DIC['server_batch_comments'])
+
+# 最初のリクエストを受け取ってから、後続のリクエストを待つ秒数
+SERVER_BATCH_WAIT = float(settings.ENV_DIC['server_batch_wait'])
+
+class JudgementServer():
+  """
+  ライブコメントを判定するHTTPサーバ。
+  NGチャンネル一覧, NGパターン, 言語ごとの文字列長, 形態素解析の辞書は起動時に1回だけ読み込む。
+
+  POST /judge
+    GoogleAPIで取得したコメントjson(items配列を持つ1ページ)を受け取り、判定結果を返す。
+    判定結果はmerge_commentsと同じ形式で、all, ok, ng, warnとng_channelsを持つjson。
+  GET /stats
+    処理したリクエスト数, 判定回数と判定処理の計測結果を返す。
+
+  同時に受け取ったリクエストは、コメント数の上限までまとめて1回で判定する。
+  判定処理は別スレッドで行い、判定中も次のリクエストを受け付ける。
+  """
+
+  # リクエストボディの上限（バイト）
+  MAX_BODY_SIZE = 64 * 1024 * 1024
+
+  def __init__(self, create_judgement, batch_comments=1000, batch_wait=0.005):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    create_judgement : callable
+      判定インスタンスを生成する関数。判定用のスレッドで1回だけ呼び出し、NGチャンネル一覧とNGパターンを読み込む。
+    batch_comments : int
+      まとめて判定するコメント数の上限
+    batch_wait : float
+      最初のリクエストを受け取ってから、後続のリクエストを待つ秒数
+    """
+    self.batch_comments = batch_comments
+    self.batch_wait = batch_wait
+
+    # 判定インスタンスはスレッドセーフではない（キャッシュのsqlite接続もスレッドをまたげない）ので、
+    # 生成から判定まで1スレッドで順番に行う。
+    self.executor = ThreadPoolExecutor(max_workers=1)
+    self.judgement = self.executor.submit(create_judgement).result()
+    self.executor.submit(self.judgement.prepare).result()
+    self.queue = None
+    self.batch_task = None
+    self.server = None
+
+    # 計測値
+    self.request_count = 0
+    self.batch_count = 0
+    self.comment_count = 0
+
+  async def start(self, host, port):
+    """
+    サーバを起動する。
+
+    Returns:
+    ----
+    sockets : list
+      待ち受けているソケット。portに0を指定した場合の確認用。
+    """
+    self.queue = asyncio.Queue()
+    self.batch_task = asyncio.ensure_future(self.run_batches())
+    self.server = await asyncio.start_server(self.handle_connection, host, port)
+    return self.server.sockets
+
+  async def close(self):
+    self.server.close()
+    await self.server.wait_closed()
+    self.batch_task.cancel()
+    try:
+      await self.batch_task
+    except asyncio.CancelledError:
+      pass
+    self.executor.shutdown()
+
+  async def judge_page(self, page):
+    """
+    1ページ分のコメントの判定を依頼し、判定結果を待つ。
+    """
+    future = asyncio.get_event_loop().create_future()
+    await self.queue.put((page, future))
+    return await future
+
+  async def run_batches(self):
+    """
+    受け取ったリクエストをまとめて判定する。
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+      requests = [await self.queue.get()]
+      comment_count = len(requests[0][0]['items'])
+      deadline = loop.time() + self.batch_wait
+      while comment_count < self.batch_comments:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+          break
+        try:
+          request = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+          break
+        requests.append(request)
+        comment_count += len(request[0]['items'])
+
+      try:
+        results = await loop.run_in_executor(self.executor, self.judge_pages, [page for page, _ in requests])
+      except Exception as e:
+        logger.exception("judge failed")
+        for _, future in requests:
+          if not future.done():
+            future.set_exception(e)
+        continue
+      for (_, future), result in zip(requests, results):
+        if not future.done():
+          future.set_result(result)
+
+  def judge_pages(self, pages):
+    """
+    複数ページのコメントをまとめて判定する。判定用のスレッドで実行する。
+
+    Parameters:
+    ----
+    pages : list[dict]
+      GoogleAPIで取得したコメントjsonの配列
+
+    Returns:
+    ----
+    results : list[dict]
+      ページごとの判定結果。引数と同じ順序で返す。
+    """
+    start = time.perf_counter()
+    page_comments = []
+    live_comments = {}
+    for page in pages:
+      comments = {}
+      for comment in page['items']:
+        comments[comment['id']] = CommentRecord.from_dict(comment)
+      page_comments.append(comments)
+      live_comments.update(comments)
+
+    judgement = self.judgement
+    judgement.clear_results()
+    judged_ng_comments, judged_warn_comments = judgement.judge_comments(live_comments)
+    judgement.record_ng_channels(judgement.get_result_ng_channels())
+
+    results = []
+    for comments in page_comments:
+      all_comments, ok_comments, ng_comments, warn_comments = \
+        judgement.merge_comments(comments, judged_ng_comments, judged_warn_comments)
+      ng_channels = list(dict.fromkeys( \
+        [judged_ng_comments[key][AddNGInfoKeyEnum.NG_CHANNEL.value] for key in comments if key in judged_ng_comments]))
+      results.append({
+        'all': all_comments,
+        'ok': ok_comments,
+        'ng': ng_comments,
+        'warn': warn_comments,
+        'ng_channels': ng_channels
+      })
+
+    self.batch_count += 1
+    self.comment_count += len(live_comments)
+    logger.info("judged : pages {}, comments {}, {:.3f} sec".format( \
+      len(pages), len(live_comments), time.perf_counter() - start))
+    return results
+
+  def get_stats(self):
+    stats = {
+      'requests': self.request_count,
+      'batches': self.batch_count,
+      'comments': self.comment_count,
+      'pages_per_batch': self.request_count / self.batch_count if self.batch_count > 0 else 0.0
+    }
+    stats['judgement'] = self.judgement.get_report()
+    if self.judgement.reloader is not None:
+      stats['reloader'] = self.judgement.reloader.get_stats()
+    return stats
+
+  async def handle_connection(self, reader, writer):
+    """
+    1接続分のリクエストを処理する。Connection: closeを受け取るまで接続を使い回す。
+    """
+    try:
+      while True:
+        request_line = await reader.readline()
+        if not request_line:
+          break
+        try:
+          method, path, version = request_line.decode('latin-1').split()
+        except ValueError:
+          await self.send_response(writer, HTTPStatus.BAD_REQUEST, {'error': 'invalid request line'}, False)
+          break
+
+        headers = {}
+        while True:
+          line = await reader.readline()
+          if line in (b'\r\n', b'\n', b''):
+            break
+          name, _, value = line.decode('latin-1').partition(':')
+          headers[name.strip().lower()] = value.strip()
+        keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+        try:
+          content_length = int(headers.get('content-length', '0'))
+        except ValueError:
+          await self.send_response(writer, HTTPStatus.BAD_REQUEST, {'error': 'invalid content-length'}, False)
+          break
+        if content_length > JudgementServer.MAX_BODY_SIZE:
+          await self.send_response(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'request body is too large'}, False)
+          break
+        body = await reader.readexactly(content_length) if content_length > 0 else b''
+
+        status, response = await self.dispatch(method, path.split('?')[0], body)
+        await self.send_response(writer, status, response, keep_alive)
+        if not keep_alive:
+          break
+    except (asyncio.IncompleteReadError, ConnectionError):
+      pass
+    finally:
+      writer.close()
+
+  async def dispatch(self, method, path, body):
+    """
+    リクエストを処理する。
+
+    Returns:
+    ----
+    status : HTTPStatus
+    response : dict
+      レスポンスのjson
+    """
+    if path == '/judge':
+      if method != 'POST':
+        return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'use POST'}
+      try:
+        page = JsonCodec.loads(body)
+        if not isinstance(page, dict) or not isinstance(page.get('items'), list):
+          raise ValueError('items is required')
+      except ValueError as e:
+        return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+      self.request_count += 1
+      try:
+        return HTTPStatus.OK, await self.judge_page(page)
+      except Exception as e:
+        return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': repr(e)}
+    if path == '/stats':
+      if method != 'GET':
+        return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'use GET'}
+      return HTTPStatus.OK, await asyncio.get_event_loop().run_in_executor(self.executor, self.get_stats)
+    return HTTPStatus.NOT_FOUND, {'error': 'not found'}
+
+  async def send_response(self, writer, status, response, keep_alive):
+    body = JsonCodec.dumps(response).encode('utf-8')
+    writer.write(('HTTP/1.1 {} {}\r\n'.format(status.value, status.phrase) + \
+      'Content-Type: application/json; charset=utf-8\r\n' + \
+      'Content-Length: {}\r\n'.format(len(body)) + \
+      'Connection: {}\r\n\r\n'.format('keep-alive' if keep_alive else 'close')).encode('latin-1') + body)
+    await writer.drain()
+
+async def serve(server, host, port):
+  sockets = await server.start(host, port)
+  logger.info("listening : {}".format([socket.getsockname() for socket in sockets]))
+  try:
+    await asyncio.Event().wait()
+  finally:
+    await server.close()
+
+if __name__ == '__main__':
+  logger.info("start.")
+  # 設定値のログ出力
+  settings.log_judgement_settings(logger)
+
+  JsonCodec.set_backend(settings.JSON_BACKEND)
+  PageReader.READ_AHEAD = settings.READ_AHEAD
+  logger.info("RELOAD_INTERVAL : {}".format(settings.RELOAD_INTERVAL))
+  logger.info("SERVER : {}:{}".format(SERVER_HOST, SERVER_PORT))
+
+  def create_judgement():
+    # キャッシュのsqlite接続はスレッドをまたげないので、判定用のスレッドで生成する。
+    # 連投, 繰り返し投稿はリクエストをまたいで検出する。
+    return settings.create_judgement('server')
+
+  server = JudgementServer(create_judgement, SERVER_BATCH_COMMENTS, SERVER_BATCH_WAIT)
+  reloader = NGDataReloader(server.judgement, settings.RELOAD_INTERVAL) if settings.RELOAD_INTERVAL > 0 else None
+  if reloader is not None:
+    reloader.start()
+  try:
+    asyncio.run(serve(server, SERVER_HOST, SERVER_PORT))
+  except KeyboardInterrupt:
+    pass
+  finally:
+    if reloader is not None:
+      reloader.stop()
+  logger.info("finish.")
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
 from os.path import join, dirname
-from dotenv import load_dotenv
+from dotenv import load_dotenv, dotenv_values
 
 load_dotenv(verbose=True)
 
@@ -9,7 +9,162 @@ dotenv_path = join(dirname(__file__), '.env')
 load_dotenv(dotenv_path)
 
 ENV_DIC = {}
-ENV_KEYS = ['video_id','mplg','similarity_threshold','comment_len_warn']
+ENV_KEYS = ['video_id','mplg','similarity_threshold','comment_len_warn','parallel_workers','parallel_chunk_size', \
+  'stream_source','stream_poll_interval','stream_idle_timeout','cache', \
+  'output_format','profile','batch_workers','similarity_engine', \
+  'server_host','server_port','server_batch_comments','server_batch_wait', \
+  'reload_interval','match_top_k','json_backend','read_ahead','columnar_format', \
+  'warn_rules','warn_target','flood_window','flood_rate_limit','flood_duplicate_limit','flood_action', \
+  'ng_channel_store','shared_data']
+
+# .envに記載がない場合の値
+ENV_DEFAULT_DIC = {
+  'parallel_workers': '1',
+  'parallel_chunk_size': '1000',
+  'stream_source': 'dir',
+  'stream_poll_interval': '1.0',
+  'stream_idle_timeout': '0',
+  'cache': '0',
+  'output_format': 'json',
+  'profile': '0',
+  'batch_workers': '1',
+  'similarity_engine': 'char',
+  'server_host': '127.0.0.1',
+  'server_port': '8080',
+  'server_batch_comments': '1000',
+  'server_batch_wait': '0.005',
+  'reload_interval': '0',
+  'match_top_k': '0',
+  'json_backend': 'json',
+  'read_ahead': '4',
+  'columnar_format': 'none',
+  'warn_rules': 'length',
+  'warn_target': 'judged',
+  'flood_window': '0',
+  'flood_rate_limit': '10',
+  'flood_duplicate_limit': '3',
+  'flood_action': 'warn',
+  'ng_channel_store': 'none',
+  'shared_data': '0'
+}
 
 for key in ENV_KEYS:
-  ENV_DIC[key] = os.environ.get(key)
+  ENV_DIC[key] = os.environ.get(key, ENV_DEFAULT_DIC.get(key))
+
+# envのキーを読み込む。各エントリポイント(app.py, batch.py, stream.py, server.py)で共通の設定値。
+VIDEO_ID = ENV_DIC['video_id']
+
+# 形態素解析を使用するかどうか。
+USE_MPLG = bool(int(ENV_DIC['mplg']))
+
+# 類似度閾値
+SIMILARITY_THRESHOLD = float(ENV_DIC['similarity_threshold'])
+
+# 形態素解析を使用する場合の類似度の比較方法。char, surface, base
+SIMILARITY_ENGINE = ENV_DIC['similarity_engine']
+
+# NGパターンによる判定で返すNGパターンの件数。0:最初にしきい値を超えたもの, 1以上:類似度の高い順に指定した件数
+MATCH_TOP_K = int(ENV_DIC['match_top_k'])
+
+# WARN判定に使うルール(カンマ区切り)。length, emoji, symbol, repeat, url
+WARN_RULES = [rule for rule in ENV_DIC['warn_rules'].split(',') if rule]
+
+# WARN判定の対象。judged:判定対象の文字列(形態素解析を使用する場合は形態素解析結果), message:元のメッセージ
+WARN_TARGET = ENV_DIC['warn_target']
+
+# 連投, 繰り返し投稿を検出する時間幅（秒）。0の場合は検出しない。
+FLOOD_WINDOW = float(ENV_DIC['flood_window'])
+# 時間幅内のコメント数の上限と、同じ内容のコメント数の上限。0の場合はそのパターンを検出しない。
+FLOOD_RATE_LIMIT = int(ENV_DIC['flood_rate_limit'])
+FLOOD_DUPLICATE_LIMIT = int(ENV_DIC['flood_duplicate_limit'])
+# 検出したコメントの判定。warn, ng
+FLOOD_ACTION = ENV_DIC['flood_action']
+
+# 動画をまたいでNGチャンネルを蓄積するかどうか。none:蓄積しない, write:蓄積する, merge:蓄積し、判定にも使う
+NG_CHANNEL_STORE = ENV_DIC['ng_channel_store']
+
+# 複数プロセスで判定する場合に、NGチャンネル一覧とNGパターンをファイルに書き込み、ワーカープロセスでmmapで共有するかどうか。
+USE_SHARED_DATA = bool(int(ENV_DIC['shared_data']))
+
+# 並列数。2以上の場合、複数プロセスで判定する。
+PARALLEL_WORKERS = int(ENV_DIC['parallel_workers'])
+PARALLEL_CHUNK_SIZE = max(1, int(ENV_DIC['parallel_chunk_size']))
+
+# 判定結果をキャッシュするかどうか。
+USE_CACHE = bool(int(ENV_DIC['cache']))
+
+# 出力に使うjsonライブラリ。auto, orjson, ujson, json
+JSON_BACKEND = ENV_DIC['json_backend']
+
+# コメントjsonファイルを先読みするファイル数
+READ_AHEAD = int(ENV_DIC['read_ahead'])
+
+# 出力形式。json:jsonの配列, jsonl:1行1コメントのJSON Lines
+OUTPUT_FORMAT = ENV_DIC['output_format']
+
+# 集計用の列形式での出力。none:出力しない, auto:pyarrowがあればparquet, なければcsv, parquet, csv
+COLUMNAR_FORMAT = ENV_DIC['columnar_format']
+
+# NGチャンネル一覧, NGパターン, lang_len.tsv, .envの変更を確認する間隔（秒）。0の場合は確認しない。
+RELOAD_INTERVAL = float(ENV_DIC['reload_interval'])
+
+def log_judgement_settings(logger):
+  """
+  判定の設定値をログに出力する。
+  """
+  logger.info("USE_MPLG : {}".format(USE_MPLG))
+  logger.info("SIMILARITY_ENGINE : {}".format(SIMILARITY_ENGINE))
+  logger.info("MATCH_TOP_K : {}".format(MATCH_TOP_K))
+  logger.info("WARN_RULES : {}".format(WARN_RULES))
+  logger.info("WARN_TARGET : {}".format(WARN_TARGET))
+  logger.info("FLOOD : window {}, rate_limit {}, duplicate_limit {}, action {}".format(FLOOD_WINDOW, FLOOD_RATE_LIMIT, FLOOD_DUPLICATE_LIMIT, FLOOD_ACTION))
+  logger.info("NG_CHANNEL_STORE : {}".format(NG_CHANNEL_STORE))
+  logger.info("USE_SHARED_DATA : {}".format(USE_SHARED_DATA))
+  logger.info("USE_CACHE : {}".format(USE_CACHE))
+  logger.info("JSON_BACKEND : {}".format(JSON_BACKEND))
+
+def create_judgement(video_id, workers=1, chunk_size=1000):
+  """
+  .envの設定値で判定インスタンスを生成する。
+  キャッシュ, 連投の検出, NGチャンネルの蓄積, ワーカープロセスとの共有の設定もここで行う。
+  判定に使うモジュールは、呼び出したときに読み込む。
+
+  Parameters:
+  ----
+  video_id : string
+    動画ID
+  workers : int
+    1つの動画を判定する並列数
+  chunk_size : int
+    並列で判定する場合に、1回で渡すコメント数
+
+  Returns:
+  ----
+  judgement : JudgementInterface
+  """
+  from judgement import NotUseMPLGJudgement, UseMPLGJudegement
+  from flood import FloodDetector
+  from blocklist import ChannelBlocklistStore
+
+  cache = None
+  if USE_CACHE:
+    from cache import JudgementCache
+    cache = JudgementCache()
+
+  if USE_MPLG:
+    judgement = UseMPLGJudegement(video_id, SIMILARITY_THRESHOLD, workers, chunk_size, cache, SIMILARITY_ENGINE, MATCH_TOP_K, WARN_RULES, WARN_TARGET)
+  else:
+    judgement = NotUseMPLGJudgement(video_id, SIMILARITY_THRESHOLD, workers, chunk_size, cache, MATCH_TOP_K, WARN_RULES, WARN_TARGET)
+
+  if FLOOD_WINDOW > 0:
+    judgement.flood_detector = FloodDetector(FLOOD_WINDOW, FLOOD_RATE_LIMIT, FLOOD_DUPLICATE_LIMIT, FLOOD_ACTION)
+  judgement.ng_channel_store = ChannelBlocklistStore.create(NG_CHANNEL_STORE)
+  judgement.use_shared_data = USE_SHARED_DATA
+  return judgement
+
+def read_env_file():
+  """
+  .envを読み直し、記載されているキーの値を返す。実行中に.envが変更された場合の確認用。
+  """
+  values = dotenv_values(dotenv_path)
+  return {key: values[key] for key in ENV_KEYS if values.get(key) is not None}
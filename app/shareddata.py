@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+from array import array
+from bisect import bisect_left
+import glob
+import hashlib
+import os
+import mmap
+import struct
+import time
+
+import sys
+sys.path.append('./')
+from blocklist import ChannelBlocklist
+
+logger = getLogger("same_hierarchy")
+
+class SharedReferenceData():
+  """
+  ワーカープロセスで共有する、読み取り専用のNGチャンネル一覧とNGパターン。
+
+  親プロセスで1回だけファイルに書き込み、各プロセスはmmapで開いてファイルを直接参照する。
+  ファイルの内容はOSのページキャッシュで共有されるので、ワーカープロセスを増やしてもプロセスごとにコピーを持たない。
+  pickleではファイルパスだけを渡し、受け取ったプロセスで開き直す。
+
+  ファイル構成（リトルエンディアン）
+    ヘッダ : マジック, バージョン, チャンネル数, NGパターン数
+    チャンネルIDのハッシュ値 : uint64 x チャンネル数 (昇順)
+    文字列の終了位置 : uint64 x (チャンネル数 + NGパターン数 * 2)
+    NGパターンの文字列長 : uint32 x NGパターン数
+    文字列長の昇順に並べたNGパターンの位置 : uint32 x NGパターン数
+    文字列長の昇順に並べたNGパターンの文字列長 : uint32 x NGパターン数
+    文字列 : UTF-8 (ハッシュ値の順のチャンネルID, NGパターンの値, 比較対象の文字列をNGパターン順に並べる)
+  """
+
+  MAGIC = b'NGSD'
+  VERSION = 1
+  HEADER = struct.Struct('<4sIII')
+
+  # 書き込み先
+  SHARED_DIR = './output/cache/'
+
+  # 古いファイルを削除するまでの秒数。実行中の別のプロセスが使っている可能性があるため、すぐには削除しない。
+  EXPIRE_SECONDS = 24 * 60 * 60
+
+  def __init__(self, path, buffer):
+    """ コンストラクタ。loadから呼び出す。
+
+    Parameters:
+    ----
+    path : string
+      ファイルパス
+    buffer : mmap
+      ファイルの内容
+    """
+    magic, version, channel_count, pattern_count = SharedReferenceData.HEADER.unpack_from(buffer, 0)
+    if magic != SharedReferenceData.MAGIC or version != SharedReferenceData.VERSION:
+      raise ValueError('unsupported shared data : magic={}, version={}'.format(magic, version))
+    self.path = path
+    self.buffer = buffer
+    self.channel_count = channel_count
+    self.pattern_count = pattern_count
+
+    view = memoryview(buffer)
+    position = SharedReferenceData.HEADER.size
+    self.channel_hashes = view[position:position + channel_count * 8].cast('Q')
+    position += channel_count * 8
+    string_count = channel_count + pattern_count * 2
+    self.string_ends = view[position:position + string_count * 8].cast('Q')
+    position += string_count * 8
+    self.pattern_lengths = view[position:position + pattern_count * 4].cast('I')
+    position += pattern_count * 4
+    self.length_order = view[position:position + pattern_count * 4].cast('I')
+    position += pattern_count * 4
+    self.sorted_lengths = view[position:position + pattern_count * 4].cast('I')
+    position += pattern_count * 4
+    self.strings = view[position:]
+
+  def __reduce__(self):
+    return (SharedReferenceData.load, (self.path,))
+
+  def get_string(self, i):
+    start = self.string_ends[i - 1] if i > 0 else 0
+    return bytes(self.strings[start:self.string_ends[i]]).decode('utf-8')
+
+  def get_channel_blocklist(self):
+    return SharedChannelBlocklist(self)
+
+  def get_pattern_values(self):
+    """ NG判定されたときに返す値の配列 """
+    return SharedStrings(self, self.channel_count, self.pattern_count, 2)
+
+  def get_pattern_texts(self):
+    """ 比較対象の文字列の配列 """
+    return SharedStrings(self, self.channel_count + 1, self.pattern_count, 2)
+
+  @classmethod
+  def hash_channel(cls, channel_id):
+    return int.from_bytes(hashlib.blake2b(channel_id.encode('utf-8'), digest_size=8).digest(), 'little')
+
+  @classmethod
+  def save(cls, channel_ids, values, texts, path=None):
+    """
+    ファイルに書き込む。同じ内容のファイルがあれば書き込まない。
+
+    Parameters:
+    ----
+    channel_ids : iterable
+      正規化済みのチャンネルID
+    values : list
+      NGパターンごとのNG判定されたときに返す値。文字列にして保存する。
+    texts : list[string]
+      NGパターンごとの比較対象の文字列
+    path : string
+      書き込み先。Noneの場合は内容のハッシュ値からSHARED_DIR配下のファイル名を決める。
+
+    Returns:
+    ----
+    path : string
+      書き込み先
+    """
+    channels = sorted((SharedReferenceData.hash_channel(channel_id), channel_id) for channel_id in channel_ids)
+    lengths = array('I', [len(text) for text in texts])
+    length_order = array('I', sorted(range(len(texts)), key=lambda i: lengths[i]))
+    sorted_lengths = array('I', [lengths[i] for i in length_order])
+
+    strings = [channel_id for _, channel_id in channels]
+    for value, text in zip(values, texts):
+      strings.extend([str(value), text])
+    string_ends = array('Q')
+    encoded = []
+    total = 0
+    for string in strings:
+      data = string.encode('utf-8')
+      encoded.append(data)
+      total += len(data)
+      string_ends.append(total)
+
+    sections = [array('Q', [channel_hash for channel_hash, _ in channels]), string_ends, lengths, length_order, sorted_lengths]
+    for section in sections:
+      if sys.byteorder != 'little':
+        section.byteswap()
+    content = b''.join([SharedReferenceData.HEADER.pack(SharedReferenceData.MAGIC, SharedReferenceData.VERSION, len(channels), len(texts))] + \
+      [section.tobytes() for section in sections] + encoded)
+
+    if path is None:
+      path = SharedReferenceData.SHARED_DIR + 'shared_' + hashlib.sha1(content).hexdigest() + '.bin'
+    if os.path.isfile(path):
+      return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 書き込み途中のファイルを読み込まないように、別名で書き込んでから置き換える。
+    tmp_path = path + '.' + str(os.getpid())
+    with open(tmp_path, mode='wb') as f:
+      f.write(content)
+    os.replace(tmp_path, path)
+    SharedReferenceData.remove_expired(path)
+    return path
+
+  @classmethod
+  def remove_expired(cls, current_path):
+    """
+    EXPIRE_SECONDSより前に書き込んだファイルを削除する。
+    """
+    now = time.time()
+    for path in glob.glob(os.path.join(os.path.dirname(current_path), 'shared_*.bin')):
+      if os.path.abspath(path) == os.path.abspath(current_path):
+        continue
+      try:
+        if now - os.path.getmtime(path) > SharedReferenceData.EXPIRE_SECONDS:
+          os.remove(path)
+      except OSError:
+        pass
+
+  @classmethod
+  def load(cls, path):
+    """
+    ファイルをmmapで開く。
+    """
+    with open(path, mode='rb') as f:
+      buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return SharedReferenceData(path, buffer)
+
+  @classmethod
+  def create(cls, ng_channels, ng_pattern_index):
+    """
+    NGチャンネル一覧とNGパターンを書き込み、開いたSharedReferenceDataを返す。
+
+    Parameters:
+    ----
+    ng_channels : ChannelBlocklist
+    ng_pattern_index : NGPatternIndex
+    """
+    start = time.perf_counter()
+    path = SharedReferenceData.save(ng_channels.channel_ids, ng_pattern_index.values, ng_pattern_index.texts)
+    data = SharedReferenceData.load(path)
+    logger.info("shared data : {}, channels {}, patterns {}, {} bytes, {:.3f} sec".format( \
+      path, data.channel_count, data.pattern_count, len(data.buffer), time.perf_counter() - start))
+    return data
+
+class SharedStrings():
+  """
+  SharedReferenceDataの文字列の配列。参照したときに文字列にする。
+  """
+
+  def __init__(self, data, start, count, step=1):
+    self.data = data
+    self.start = start
+    self.count = count
+    self.step = step
+
+  def __len__(self):
+    return self.count
+
+  def __getitem__(self, i):
+    if i < 0:
+      i += self.count
+    if i < 0 or i >= self.count:
+      raise IndexError('index out of range : {}'.format(i))
+    return self.data.get_string(self.start + i * self.step)
+
+  def __iter__(self):
+    for i in range(self.count):
+      yield self.data.get_string(self.start + i * self.step)
+
+class SharedChannelBlocklist():
+  """
+  SharedReferenceDataのNGチャンネル一覧。ChannelBlocklistと同じく、チャンネルURLで存在確認できる。
+  チャンネルIDのハッシュ値を二分探索し、ハッシュ値が一致したチャンネルIDを比較する。
+  """
+
+  def __init__(self, data):
+    self.data = data
+
+  def __contains__(self, channel_url):
+    channel_id = ChannelBlocklist.normalize(channel_url)
+    data = self.data
+    channel_hash = SharedReferenceData.hash_channel(channel_id)
+    i = bisect_left(data.channel_hashes, channel_hash)
+    while i < data.channel_count and data.channel_hashes[i] == channel_hash:
+      if data.get_string(i) == channel_id:
+        return True
+      i += 1
+    return False
+
+  def __len__(self):
+    return self.data.channel_count
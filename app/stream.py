@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger, config, StreamHandler, DEBUG
+import settings
+import os
+import glob
+import time
+from collections import OrderedDict
+
+import sys
+sys.path.append('./')
+from util import LogUtil
+from reloader import NGDataReloader
+from commentutil import CommentRecord
+from writer import ResultWriter
+from jsoncodec import JsonCodec, PageReader
+
+logger = getLogger(__name__)
+log_conf = LogUtil.get_log_conf('./log_config.json')
+config.dictConfig(log_conf)
+handler = StreamHandler()
+handler.setLevel(DEBUG)
+logger.setLevel(DEBUG)
+logger.addHandler(handler)
+logger.propagate = False
+
+# コメントの読み込み元。dir:input/comment/video_id配下を監視する, stdin:標準入力から読み込む
+STREAM_SOURCE = settings.ENV_DIC['stream_source']
+
+# input/comment/video_id配下を確認する間隔（秒）
+STREAM_POLL_INTERVAL = float(settings.ENV_DIC['stream_poll_interval'])
+
+# 新しいファイルが配置されないまま経過したら終了する秒数。0の場合は終了しない。
+STREAM_IDLE_TIMEOUT = float(settings.ENV_DIC['stream_idle_timeout'])
+
+class StreamJudgement():
+  """
+  ライブコメントを受け取った単位(items配列を持つjson 1ページ)で判定し、判定結果を出力ファイルに追記する。
+  出力ファイルは1行1コメントのJSON Lines形式(result_${動画ID}.jsonl)。
+  """
+
+  # 判定済みとして保持するコメントID数
+  MAX_JUDGED_COMMENT_IDS = 100000
+
+  def __init__(self, judgement, max_judged_comment_ids=MAX_JUDGED_COMMENT_IDS):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    judgement : JudgementInterface
+      判定インスタンス。NGチャンネル一覧とNGパターンはここで1回だけ読み込む。
+    max_judged_comment_ids : int
+      判定済みとして保持するコメントID数
+    """
+    self.judgement = judgement
+    self.judgement.prepare()
+
+    # 判定済みのコメントID。同じコメントが複数ページに含まれていても1回だけ判定する。
+    # ページの重複は直近のページ同士で起きるので、直近max_judged_comment_ids件だけを保持し、超えた場合は古いものから捨てる。
+    self.judged_comment_ids = OrderedDict()
+    self.max_judged_comment_ids = max_judged_comment_ids
+
+    # 計測値
+    self.comment_count = 0
+    self.total_latency = 0.0
+    self.max_latency = 0.0
+
+  def judge_page(self, page):
+    """
+    1ページ分のコメントを判定し、出力ファイルに追記する。
+
+    Parameters:
+    ----
+    page : dict
+      GoogleAPIで取得したコメントjson
+
+    Returns:
+    ----
+    latency : float
+      コメント1件あたりの判定時間（ミリ秒）
+    """
+    start = time.perf_counter()
+    live_comments = {}
+    for comment in page['items']:
+      comment_id = comment['id']
+      if comment_id not in self.judged_comment_ids:
+        live_comments[comment_id] = CommentRecord.from_dict(comment)
+    if len(live_comments) == 0:
+      return 0.0
+
+    ng_channel_count = len(self.judgement.result_ng_channels)
+    judged_ng_comments, judged_warn_comments = self.judgement.judge_comments(live_comments)
+
+    writer = ResultWriter(self.judgement.video_id, json_lines=True, mode='a')
+    try:
+      self.judgement.write_comments(writer, live_comments, judged_ng_comments, judged_warn_comments)
+      # 新しくNGになったチャンネルだけ追記する。
+      writer.write_ng_channels(self.judgement.result_ng_channels[ng_channel_count:])
+      self.judgement.record_ng_channels(self.judgement.result_ng_channels[ng_channel_count:])
+    finally:
+      writer.close()
+    counts = writer.get_counts()
+
+    for comment_id in live_comments:
+      self.judged_comment_ids[comment_id] = None
+    while len(self.judged_comment_ids) > self.max_judged_comment_ids:
+      self.judged_comment_ids.popitem(last=False)
+    elapsed = (time.perf_counter() - start) * 1000
+    latency = elapsed / len(live_comments)
+    self.comment_count += len(live_comments)
+    self.total_latency += elapsed
+    self.max_latency = max(self.max_latency, latency)
+    logger.info("judged : {}, ok : {}, ng : {}, warn : {}, latency : {:.3f} ms/comment".format( \
+      len(live_comments), counts['ok'], counts['ng'], counts['warn'], latency))
+    return latency
+
+  def tail_dir(self, poll_interval, idle_timeout):
+    """
+    input/comment/video_id配下を監視し、新しく配置されたファイルを判定する。
+
+    Parameters:
+    ----
+    poll_interval : float
+      ディレクトリを確認する間隔（秒）
+    idle_timeout : float
+      新しいファイルが配置されないまま経過したら終了する秒数。0の場合は終了しない。
+    """
+    input_comment_path = './input/comment/' + self.judgement.video_id + '/**'
+    judged_files = set()
+    last_judged = time.monotonic()
+    while True:
+      files = sorted([p for p in glob.glob(input_comment_path , recursive=True) \
+        if os.path.isfile(p) and os.path.splitext(p)[1][1:] != 'gitkeep' and p not in judged_files])
+      for file in files:
+        try:
+          page = JsonCodec.load_file(file)
+        except ValueError:
+          # 書き込み途中の可能性があるので、次回に再読み込みする。
+          logger.debug("skip incomplete file : {}".format(file))
+          continue
+        self.judge_page(page)
+        judged_files.add(file)
+        last_judged = time.monotonic()
+
+      if idle_timeout > 0 and time.monotonic() - last_judged > idle_timeout:
+        break
+      time.sleep(poll_interval)
+
+  def read_stdin(self):
+    """
+    標準入力から1行1ページのコメントjsonを読み込み、判定する。
+    """
+    for line in sys.stdin:
+      if line.strip() == '':
+        continue
+      self.judge_page(JsonCodec.loads(line))
+
+  def get_stats(self):
+    """
+    判定したコメント数と判定時間を返す。
+    """
+    return {
+      'comments': self.comment_count,
+      'average_latency_ms': self.total_latency / self.comment_count if self.comment_count > 0 else 0.0,
+      'max_latency_ms': self.max_latency
+    }
+
+if __name__ == '__main__':
+  logger.info("start.")
+  # 設定値のログ出力
+  logger.info("video_id : {}".format(settings.VIDEO_ID))
+  settings.log_judgement_settings(logger)
+  logger.info("STREAM_SOURCE : {}".format(STREAM_SOURCE))
+
+  JsonCodec.set_backend(settings.JSON_BACKEND)
+  PageReader.READ_AHEAD = settings.READ_AHEAD
+  logger.info("RELOAD_INTERVAL : {}".format(settings.RELOAD_INTERVAL))
+
+  judgement = settings.create_judgement(settings.VIDEO_ID)
+
+  stream = StreamJudgement(judgement)
+  reloader = NGDataReloader(judgement, settings.RELOAD_INTERVAL) if settings.RELOAD_INTERVAL > 0 else None
+  if reloader is not None:
+    reloader.start()
+  try:
+    if STREAM_SOURCE == 'stdin':
+      stream.read_stdin()
+    else:
+      stream.tail_dir(STREAM_POLL_INTERVAL, STREAM_IDLE_TIMEOUT)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    if reloader is not None:
+      reloader.stop()
+
+  logger.info("stream stats : {}".format(stream.get_stats()))
+  report = judgement.get_report()
+  report['stream'] = stream.get_stats()
+  if reloader is not None:
+    report['reloader'] = reloader.get_stats()
+  ResultWriter.write_report(settings.VIDEO_ID, report)
+  logger.info("finish.")
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+import threading
+import time
+
+logger = getLogger("same_hierarchy")
+
+class TaggerEngine():
+  """
+  MeCab.Taggerを使い回すためのエンジン。
+  Taggerの生成（辞書の読み込み）は重いため、一度生成したTaggerを保持して使い回す。
+  MeCab.Taggerはスレッドセーフではないため、Taggerはスレッドごとに1つ生成する。
+  MeCabは形態素解析を使用しない場合に読み込まないよう、初めてTaggerを生成するときに読み込む。
+  """
+
+  # プロセス内で共有するエンジン
+  # key : Taggerの引数
+  # value : TaggerEngine
+  __engines = {}
+  __engines_lock = threading.Lock()
+
+  def __init__(self, option):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    option : string
+      MeCab.Taggerに渡す引数（辞書パスなど）
+    """
+    self.option = option
+    self.local = threading.local()
+    self.lock = threading.Lock()
+
+    # 計測値
+    self.load_count = 0
+    self.load_time = 0.0
+    self.parse_count = 0
+    self.parse_time = 0.0
+
+  @classmethod
+  def get_engine(cls, option):
+    """
+    引数に対応するエンジンを返す。プロセス内で同じ引数のエンジンは1つだけ生成する。
+
+    Parameters:
+    ----
+    option : string
+      MeCab.Taggerに渡す引数
+
+    Returns:
+    ----
+    engine : TaggerEngine
+    """
+    with cls.__engines_lock:
+      if option not in cls.__engines:
+        cls.__engines[option] = TaggerEngine(option)
+      return cls.__engines[option]
+
+  def get_tagger(self):
+    """
+    呼び出し元スレッドのTaggerを返す。まだ生成していない場合は生成する。
+    """
+    tagger = getattr(self.local, 'tagger', None)
+    if tagger is None:
+      start = time.perf_counter()
+      import MeCab
+      tagger = MeCab.Tagger(self.option)
+      elapsed = time.perf_counter() - start
+      with self.lock:
+        self.load_count += 1
+        self.load_time += elapsed
+      logger.info("MeCab dictionary loaded : {:.3f} sec".format(elapsed))
+      self.local.tagger = tagger
+    return tagger
+
+  def parse(self, text):
+    """
+    形態素解析する。
+
+    Parameters:
+    ----
+    text : string
+      対象の文字列
+
+    Returns:
+    ----
+    string : 形態素解析結果
+    """
+    return self.parse_many([text])[0]
+
+  def parse_many(self, texts):
+    """
+    まとめて形態素解析する。
+
+    Parameters:
+    ----
+    texts : list[string]
+      対象の文字列の配列
+
+    Returns:
+    ----
+    list[string] : 形態素解析結果の配列。引数と同じ順序で返す。
+    """
+    tagger = self.get_tagger()
+    start = time.perf_counter()
+    results = [tagger.parse(text) for text in texts]
+    elapsed = time.perf_counter() - start
+    with self.lock:
+      self.parse_count += len(texts)
+      self.parse_time += elapsed
+    return results
+
+  def get_stats(self):
+    """
+    辞書読み込み時間と形態素解析時間の計測値を返す。
+
+    Returns:
+    ----
+    stats : dict
+      load_count : Taggerの生成回数
+      load_time : 辞書読み込み時間の合計（秒）
+      parse_count : 形態素解析したコメント数
+      parse_time : 形態素解析時間の合計（秒）
+      parse_time_per_comment : コメント1件あたりの形態素解析時間（ミリ秒）
+    """
+    with self.lock:
+      return {
+        'load_count': self.load_count,
+        'load_time': self.load_time,
+        'parse_count': self.parse_count,
+        'parse_time': self.parse_time,
+        'parse_time_per_comment': self.parse_time / self.parse_count * 1000 if self.parse_count > 0 else 0.0
+      }
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+from difflib import SequenceMatcher
+import hashlib
+
+import sys
+sys.path.append('./')
+from corpus import PatternCorpus
+
+# NumPyがインストールされている場合は、上限値の計算をまとめて行う。
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+class TokenPatternIndex():
+  """
+  形態素解析結果のトークン列で類似度を判定するNGパターンのインデックス。
+  NGPatternIndexと同じメソッドを持つ。
+
+  形態素解析結果の品詞などの列は比較せず、表層形または原形のトークンだけを比較する。
+  トークンはIDに変換し、類似度はトークンIDの列に対するSequenceMatcher.ratio()で求める。
+  トークンの出現回数から求まる上限値（SequenceMatcher.quick_ratio()と同じ）がしきい値以下のNGパターンは比較せずに除外する。
+  上限値はトークンごとの転置インデックスから求める。（NumPyがあればNGパターン全件分をまとめて計算する。）
+  除外されなかったNGパターンは登録順に比較し、最初にしきい値を超えたNGパターンを返す。
+  """
+
+  # NGパターンの語彙にないトークンのID。NGパターンのどのトークンとも一致しない。
+  UNKNOWN_TOKEN_ID = -1
+
+  def __init__(self, patterns, token_ids, vocabulary, base_form=False):
+    """ コンストラクタ。from_patterns, from_corpusから呼び出す。
+
+    Parameters:
+    ----
+    patterns : list[tuple]
+      (NG判定されたときに返す値, 比較対象の文字列)の配列。配列の順序で比較する。
+    token_ids : list[list[int]]
+      NGパターンごとのトークンIDの配列
+    vocabulary : dict
+      key : トークン
+      value : トークンID
+    base_form : boolean
+      Trueの場合は原形, Falseの場合は表層形で比較する。
+    """
+    self.values = [pattern[0] for pattern in patterns]
+    self.texts = [pattern[1] for pattern in patterns]
+    self.token_ids = token_ids
+    self.vocabulary = vocabulary
+    self.base_form = base_form
+    self.lengths = [len(ids) for ids in token_ids]
+
+    # 転置インデックス
+    # key : トークンID
+    # value : (トークンを含むNGパターンの位置の配列, NGパターン内の出現回数の配列)
+    postings = {}
+    for i, ids in enumerate(token_ids):
+      for token_id, count in Counter(ids).items():
+        positions, counts = postings.setdefault(token_id, ([], []))
+        positions.append(i)
+        counts.append(count)
+    if np is not None:
+      self.postings = {token_id: (np.array(positions, dtype=np.int64), np.array(counts, dtype=np.int64)) \
+        for token_id, (positions, counts) in postings.items()}
+      self.length_array = np.array(self.lengths, dtype=np.int64)
+    else:
+      self.postings = postings
+
+    # NGパターンごとのSequenceMatcher。比較対象(seq2)側の前処理を使い回す。
+    self.matchers = [None] * len(token_ids)
+
+    self.pattern_hashes = None
+    self.fingerprint = None
+
+    # 計測値
+    self.compared_count = 0
+    self.skipped_count = 0
+
+  def __len__(self):
+    return len(self.texts)
+
+  def get_engine(self):
+    return 'base' if self.base_form else 'surface'
+
+  @classmethod
+  def from_patterns(cls, patterns, base_form=False):
+    """
+    比較対象の文字列（形態素解析結果）をトークン化してインデックスを生成する。
+    """
+    vocabulary = {}
+    token_ids = []
+    for value, text in patterns:
+      surfaces, bases = PatternCorpus.tokenize(text)
+      token_ids.append([vocabulary.setdefault(token, len(vocabulary)) for token in (bases if base_form else surfaces)])
+    return TokenPatternIndex(patterns, token_ids, vocabulary, base_form)
+
+  @classmethod
+  def from_corpus(cls, corpus, base_form=False):
+    """
+    コンパイル済みのNGパターンのトークンIDからインデックスを生成する。
+    """
+    vocabulary = {token: i for i, token in enumerate(corpus.get_vocabulary())}
+    token_ids = [list(corpus.get_token_ids(i, base_form)) for i in range(len(corpus))]
+    return TokenPatternIndex(corpus.get_patterns(), token_ids, vocabulary, base_form)
+
+  def to_token_ids(self, comment):
+    """
+    コメントの形態素解析結果をトークンIDの配列にする。
+    """
+    surfaces, bases = PatternCorpus.tokenize(comment)
+    return [self.vocabulary.get(token, TokenPatternIndex.UNKNOWN_TOKEN_ID) for token in (bases if self.base_form else surfaces)]
+
+  def get_candidates(self, comment_ids, threshold, positions=None):
+    """
+    トークンの出現回数から求まる上限値がしきい値を超えるNGパターンの位置を、登録順に返す。
+    """
+    candidates = [i for i, _ in self.get_candidate_bounds(comment_ids, threshold)]
+    if positions is not None:
+      candidates = [i for i in candidates if i in positions]
+    return candidates
+
+  def get_candidate_bounds(self, comment_ids, threshold):
+    """
+    トークンの出現回数から求まる上限値がしきい値を超えるNGパターンの位置と上限値を、登録順に返す。
+
+    Returns:
+    ----
+    candidate_bounds : list[tuple]
+      (NGパターンの位置, 上限値)の配列
+    """
+    comment_length = len(comment_ids)
+    comment_counts = Counter(comment_ids)
+    comment_counts.pop(TokenPatternIndex.UNKNOWN_TOKEN_ID, None)
+
+    if np is not None:
+      intersections = np.zeros(len(self.lengths), dtype=np.int64)
+      for token_id, count in comment_counts.items():
+        if token_id in self.postings:
+          pattern_positions, counts = self.postings[token_id]
+          intersections[pattern_positions] += np.minimum(counts, count)
+      total_lengths = self.length_array + comment_length
+      # 両方空の場合、SequenceMatcherは1.0を返す。
+      upper_bounds = np.where(total_lengths == 0, 1.0, 2.0 * intersections / np.maximum(total_lengths, 1))
+      candidates = np.flatnonzero(upper_bounds > threshold)
+      return list(zip(candidates.tolist(), upper_bounds[candidates].tolist()))
+
+    intersections = {}
+    for token_id, count in comment_counts.items():
+      if token_id in self.postings:
+        for i, pattern_count in zip(*self.postings[token_id]):
+          intersections[i] = intersections.get(i, 0) + min(pattern_count, count)
+    candidate_bounds = []
+    for i, pattern_length in enumerate(self.lengths):
+      total_length = comment_length + pattern_length
+      upper_bound = 1.0 if total_length == 0 else 2.0 * intersections.get(i, 0) / total_length
+      if upper_bound > threshold:
+        candidate_bounds.append((i, upper_bound))
+    return candidate_bounds
+
+  def search(self, comment, threshold):
+    """
+    コメントとの類似度がしきい値を超える最初のNGパターンを探す。
+    NGPatternIndex.searchと同じ。
+    """
+    result = self.search_position(comment, threshold)
+    if result is None:
+      return None
+    return self.values[result[0]], result[1]
+
+  def search_position(self, comment, threshold, positions=None):
+    """
+    コメントとの類似度がしきい値を超える最初のNGパターンの位置を探す。
+    NGPatternIndex.search_positionと同じ。
+    """
+    comment_ids = self.to_token_ids(comment)
+    candidates = self.get_candidates(comment_ids, threshold, positions)
+    target_count = len(self.texts) if positions is None else len(positions)
+    self.skipped_count += target_count - len(candidates)
+
+    for i in candidates:
+      similarity = self.ratio(i, comment_ids)
+      self.compared_count += 1
+      if similarity > threshold:
+        return i, similarity
+    return None
+
+  def search_top(self, comment, threshold, k):
+    """
+    コメントとの類似度がしきい値を超えるNGパターンのうち、類似度の高い順にk件返す。
+    NGPatternIndex.search_topと同じ。
+    """
+    comment_ids = self.to_token_ids(comment)
+    # 上限値の高い順, 同じ場合は登録順に並べる。
+    bounds = sorted(self.get_candidate_bounds(comment_ids, threshold), key=lambda bound: (-bound[1], bound[0]))
+    self.skipped_count += len(self.texts) - len(bounds)
+
+    # (類似度, 位置)の配列。類似度の高い順, 同じ場合は登録順
+    results = []
+    for checked, (i, upper_bound) in enumerate(bounds):
+      # k件見つかっていて、上限値がk番目の類似度を下回る場合は、残りのNGパターンも上回らない。
+      if len(results) >= k and upper_bound < results[-1][0]:
+        self.skipped_count += len(bounds) - checked
+        break
+      similarity = self.ratio(i, comment_ids)
+      self.compared_count += 1
+      if similarity > threshold:
+        results.append((similarity, i))
+        results.sort(key=lambda result: (-result[0], result[1]))
+        del results[k:]
+    return [(self.values[i], similarity) for similarity, i in results]
+
+  def ratio(self, i, comment_ids):
+    """
+    コメントのトークンIDの配列とi番目のNGパターンの類似度を返す。
+    """
+    matcher = self.matchers[i]
+    if matcher is None:
+      matcher = SequenceMatcher(None, [], self.token_ids[i])
+      self.matchers[i] = matcher
+    matcher.set_seq1(comment_ids)
+    return matcher.ratio()
+
+  def get_pattern_hashes(self):
+    """
+    NGパターンごとのハッシュ値を登録順に返す。
+    比較方法(表層形, 原形)が異なる場合は別のハッシュ値になる。
+    """
+    if self.pattern_hashes is None:
+      self.pattern_hashes = [ \
+        hashlib.sha1((self.get_engine() + '\0' + str(value) + '\0' + text).encode('utf-8')).hexdigest() \
+        for value, text in zip(self.values, self.texts)]
+    return self.pattern_hashes
+
+  def get_fingerprint(self):
+    """
+    NGパターン一覧のフィンガープリントを返す。
+    """
+    if self.fingerprint is None:
+      self.fingerprint = hashlib.sha1('\n'.join(self.get_pattern_hashes()).encode('utf-8')).hexdigest()
+    return self.fingerprint
+
+  def get_stats(self):
+    """
+    比較した回数と、上限値で除外した回数を返す。
+    """
+    return {
+      'patterns': len(self.texts),
+      'engine': self.get_engine(),
+      'vectorized': np is not None,
+      'compared': self.compared_count,
+      'skipped': self.skipped_count
+    }
@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
+import os
+import re
+import glob
 import json
+import hashlib
+import unicodedata
 
 class LogUtil:
   
@@ -9,4 +14,34 @@ class LogUtil:
     """
     with open(log_conf_path, mode='r') as f:
       log_conf = json.loads(f.read())
-    return log_conf
\ No newline at end of file
+    return log_conf
+
+class FileUtil:
+
+  @classmethod
+  def list_files(cls, path):
+    """ 指定されたパターンに一致するファイルを名前順に返す。.gitkeepは除外。
+    """
+    return sorted([p for p in glob.glob(path , recursive=True) if os.path.isfile(p) and os.path.splitext(p)[1][1:] != 'gitkeep' ])
+
+  @classmethod
+  def get_fingerprint(cls, files):
+    """ ファイル一覧のフィンガープリント。ファイルパス, サイズ, 更新日時から求める。
+    """
+    sha1 = hashlib.sha1()
+    for file in files:
+      stat = os.stat(file)
+      sha1.update('{}\0{}\0{}\n'.format(file, stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    return sha1.hexdigest()
+
+class TextUtil:
+
+  # 連続する空白文字
+  WHITESPACE_PATTERN = re.compile(r'\s+')
+
+  @classmethod
+  def normalize(cls, text):
+    """ 比較用に文字列を正規化する。
+    NFKC正規化（全角英数字, 半角カナの幅を揃える）を行い、連続する空白を半角スペース1つにして前後の空白を除く。
+    """
+    return TextUtil.WHITESPACE_PATTERN.sub(' ', unicodedata.normalize('NFKC', text)).strip()
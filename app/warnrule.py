@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+import os
+import re
+
+import sys
+sys.path.append('./')
+from commentutil import AddWarnInfoKeyEnum
+
+logger = getLogger("same_hierarchy")
+
+# NumPy。読み込みに時間がかかるため、初めてWARN判定するときに読み込む。(import_numpy)
+np = None
+
+def import_numpy():
+  """
+  NumPyを読み込む。インストールされていない場合はNoneを返す。
+  """
+  global np
+  if np is None:
+    try:
+      import numpy as np
+    except ImportError:
+      return None
+  return np
+
+class WarnRuleEngine():
+  """
+  WARN判定のルールをコメントの配列にまとめて適用する。
+
+  コメントごとの特徴量(文字列長, 絵文字の割合など)を先に配列として求め、ルールの判定は配列の比較で行う。
+  特徴量はコメント1件につき1回の呼び出しで、適用するルールの分をまとめて求める。
+  ルールを追加しても、コメントごとのPythonのループは増えない。
+  NumPyがインストールされている場合は、コメント数によらずしきい値の比較をNumPyの配列で行う。
+  ルールはどれも「特徴量 > しきい値」の場合にWARNにする。しきい値は言語ごとに指定できる。
+  """
+
+  # ルール名と特徴量名
+  # length : 文字列長。しきい値はlang_len.tsvの言語ごとの文字列長
+  # emoji : 絵文字の割合
+  # symbol : 記号(文字, 数字, 空白以外)の割合
+  # repeat : 同じ文字が続く最大の長さ
+  # url : URLの数
+  RULES = {
+    'length': AddWarnInfoKeyEnum.LENGTH.value,
+    'emoji': AddWarnInfoKeyEnum.EMOJI_RATIO.value,
+    'symbol': AddWarnInfoKeyEnum.SYMBOL_RATIO.value,
+    'repeat': AddWarnInfoKeyEnum.REPEAT_RUN.value,
+    'url': AddWarnInfoKeyEnum.URL_COUNT.value
+  }
+
+  # WARN判定の対象。judged:判定対象の文字列(形態素解析を使用する場合は形態素解析結果), message:元のメッセージ
+  TARGETS = ['judged', 'message']
+
+  # 言語によらないしきい値を指定する場合の言語
+  ANY_LANG = '*'
+
+  # 整数の特徴量。それ以外は割合(float)
+  INTEGER_FEATURES = [AddWarnInfoKeyEnum.LENGTH.value, AddWarnInfoKeyEnum.REPEAT_RUN.value, AddWarnInfoKeyEnum.URL_COUNT.value]
+
+  EMOJI_PATTERN = re.compile('[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D]')
+  SYMBOL_PATTERN = re.compile(r'[^\w\s]')
+  REPEAT_PATTERN = re.compile(r'(.)\1+', re.DOTALL)
+  URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+
+  def __init__(self, rules, lang_len, thresholds):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    rules : list[string]
+      適用するルール名(RULESのキー)の配列。warn_patternはこの順序で出力する。
+    lang_len : dict
+      lengthルールのしきい値
+      key : 言語
+      value : 文字列長
+    thresholds : dict
+      length以外のルールのしきい値(import_thresholdsの戻り値)
+    """
+    for rule in rules:
+      if rule not in WarnRuleEngine.RULES:
+        raise ValueError('warn rule must be one of {} : {}'.format(list(WarnRuleEngine.RULES), rule))
+    self.rules = rules
+    # key : ルール名
+    # value : dict { key : 言語 or ANY_LANG, value : しきい値 }
+    self.thresholds = {}
+    for rule in rules:
+      table = lang_len if rule == 'length' else thresholds.get(rule, {})
+      if table:
+        self.thresholds[rule] = table
+      else:
+        logger.warning("warn rule has no threshold : {}".format(rule))
+    # get_feature_rowで求める特徴量。lengthは常に求める。
+    self.use_emoji = 'emoji' in rules
+    self.use_symbol = 'symbol' in rules
+    self.use_repeat = 'repeat' in rules
+    self.use_url = 'url' in rules
+    # get_feature_rowの戻り値と同じ順序の特徴量名
+    self.feature_names = [WarnRuleEngine.RULES[rule] for rule, used in \
+      [('length', True), ('emoji', self.use_emoji), ('symbol', self.use_symbol), ('repeat', self.use_repeat), ('url', self.use_url)] if used]
+
+  @classmethod
+  def import_thresholds(cls, path):
+    """
+    length以外のルールのしきい値を読み込む。
+    1行に ルール名, 言語(言語によらない場合は*), しきい値 をタブ区切りで記載する。
+
+    Returns:
+    ----
+    thresholds : dict
+      key : ルール名
+      value : dict { key : 言語, value : しきい値 }
+    """
+    thresholds = {}
+    if not os.path.isfile(path):
+      return thresholds
+    with open(path, mode='r') as f:
+      for line in f.readlines():
+        lines = line.replace('\r', '').replace('\n', '').split('\t')
+        if len(lines) < 3:
+          continue
+        thresholds.setdefault(lines[0], {})[lines[1]] = float(lines[2])
+    logger.info("warn_rule: {}".format(thresholds))
+    return thresholds
+
+  def is_lang_dependent(self, rule):
+    """
+    ルールのしきい値が言語によって異なるかどうか。
+    lengthルールは言語ごとの文字列長だけで判定するので、常に言語によって異なる。
+    """
+    return rule == 'length' or any(lang != WarnRuleEngine.ANY_LANG for lang in self.thresholds[rule])
+
+  def get_threshold(self, rule, lang):
+    """
+    言語に対応するしきい値を返す。ない場合はNoneを返す。
+    """
+    table = self.thresholds[rule]
+    if lang in table:
+      return table[lang]
+    if rule == 'length':
+      return None
+    return table.get(WarnRuleEngine.ANY_LANG)
+
+  def get_feature_row(self, text):
+    """
+    コメント1件の特徴量を、feature_namesの順に求める。
+    """
+    length = len(text)
+    row = [length]
+    if self.use_emoji:
+      row.append(len(WarnRuleEngine.EMOJI_PATTERN.findall(text)) / length if length > 0 else 0.0)
+    if self.use_symbol:
+      row.append(len(WarnRuleEngine.SYMBOL_PATTERN.findall(text)) / length if length > 0 else 0.0)
+    if self.use_repeat:
+      row.append(max([len(m.group(0)) for m in WarnRuleEngine.REPEAT_PATTERN.finditer(text)], default=min(length, 1)))
+    if self.use_url:
+      row.append(len(WarnRuleEngine.URL_PATTERN.findall(text)))
+    return row
+
+  def get_features(self, texts):
+    """
+    コメントごとの特徴量を求める。コメントごとのループは1回だけで、適用するルールの特徴量をまとめて求める。
+
+    Returns:
+    ----
+    features : dict
+      key : 特徴量名
+      value : コメントごとの特徴量の配列。NumPyがある場合はnumpy.ndarray。
+    """
+    rows = [self.get_feature_row(text) for text in texts]
+    if import_numpy() is not None:
+      matrix = np.array(rows, dtype=np.float64).reshape(len(rows), len(self.feature_names))
+      return {name: matrix[:, j].astype(np.int64) if name in WarnRuleEngine.INTEGER_FEATURES else matrix[:, j] \
+        for j, name in enumerate(self.feature_names)}
+    columns = list(zip(*rows)) if rows else [()] * len(self.feature_names)
+    return {name: list(column) for name, column in zip(self.feature_names, columns)}
+
+  def get_lang_targets(self, features):
+    """
+    言語判定が必要なコメントの位置を昇順で返す。
+    言語によらないルールでWARNになるコメントと、言語によってWARNになり得るコメント
+    （特徴量がいずれかの言語のしきい値を超えるもの）が対象。
+    """
+    mask = None
+    for rule in self.rules:
+      if rule not in self.thresholds:
+        continue
+      values = features[WarnRuleEngine.RULES[rule]]
+      if self.is_lang_dependent(rule):
+        threshold = min(self.thresholds[rule].values())
+      else:
+        threshold = self.thresholds[rule][WarnRuleEngine.ANY_LANG]
+      mask = WarnRuleEngine.greater(values, threshold) if mask is None else WarnRuleEngine.logical_or(mask, WarnRuleEngine.greater(values, threshold))
+    if mask is None:
+      return []
+    if np is not None and isinstance(mask, np.ndarray):
+      return np.flatnonzero(mask).tolist()
+    return [i for i, target in enumerate(mask) if target]
+
+  def judge(self, features, lang_targets, langs):
+    """
+    WARN判定する。
+
+    Parameters:
+    ----
+    features : dict
+      get_featuresの戻り値
+    lang_targets : list[int]
+      get_lang_targetsの戻り値
+    langs : list[string]
+      lang_targetsの位置のコメントの言語
+
+    Returns:
+    ----
+    results : list[tuple]
+      lang_targetsと同じ順序で、WARNの場合は(言語, warn_pattern, 特徴量)、WARNではない場合はNoneの配列。
+      特徴量はdict { key : 特徴量名, value : 値 }で、lengthと、WARNになったlength以外のルールの特徴量を持つ。
+    """
+    vectorized = np is not None and isinstance(features[AddWarnInfoKeyEnum.LENGTH.value], np.ndarray)
+    if vectorized:
+      positions = np.array(lang_targets, dtype=np.int64)
+      # 言語ごとにしきい値を引くため、言語をコードにする。
+      unique_langs, lang_codes = np.unique(np.array(langs, dtype=object), return_inverse=True) if langs else ([], positions)
+    # key : ルール名
+    # value : lang_targetsごとのWARNかどうか
+    masks = {}
+    for rule in self.rules:
+      if rule not in self.thresholds:
+        continue
+      name = WarnRuleEngine.RULES[rule]
+      if vectorized:
+        # しきい値がない言語はNaNにし、比較結果をFalseにする。
+        thresholds = np.array([np.nan if self.get_threshold(rule, lang) is None else self.get_threshold(rule, lang) \
+          for lang in unique_langs], dtype=np.float64)
+        masks[rule] = (features[name][positions] > thresholds[lang_codes]) if langs else np.zeros(0, dtype=bool)
+      else:
+        values = features[name]
+        thresholds = [self.get_threshold(rule, lang) for lang in langs]
+        masks[rule] = [threshold is not None and values[i] > threshold for i, threshold in zip(lang_targets, thresholds)]
+
+    warn_rules = [rule for rule in self.rules if rule in masks]
+    if vectorized:
+      warn_mask = np.zeros(len(lang_targets), dtype=bool)
+      for rule in warn_rules:
+        warn_mask |= masks[rule]
+      warn_positions = np.flatnonzero(warn_mask).tolist()
+    else:
+      warn_positions = [j for j in range(len(lang_targets)) if any(masks[rule][j] for rule in warn_rules)]
+
+    results = [None] * len(lang_targets)
+    for j in warn_positions:
+      i = lang_targets[j]
+      warn_pattern = [rule for rule in warn_rules if masks[rule][j]]
+      values = {}
+      for name in [AddWarnInfoKeyEnum.LENGTH.value] + [WarnRuleEngine.RULES[rule] for rule in warn_pattern]:
+        values[name] = features[name][i].item() if vectorized else features[name][i]
+      results[j] = (langs[j], warn_pattern, values)
+    return results
+
+  @classmethod
+  def greater(cls, values, threshold):
+    if np is not None and isinstance(values, np.ndarray):
+      return values > threshold
+    return [value > threshold for value in values]
+
+  @classmethod
+  def logical_or(cls, mask1, mask2):
+    if np is not None and isinstance(mask1, np.ndarray):
+      return mask1 | mask2
+    return [value1 or value2 for value1, value2 in zip(mask1, mask2)]
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+import sys
+sys.path.append('./')
+from jsoncodec import JsonCodec
+from columnar import ColumnarWriter
+
+class JsonArrayWriter():
+  """
+  jsonの配列を1件ずつファイルに書き込む。
+  書き込み結果はjson.dumps(list)と同じになる。（JsonCodecの書き込みにjson(標準ライブラリ)を使う場合）
+  """
+
+  def __init__(self, path, mode='w'):
+    self.file = open(path, encoding='utf-8', mode=mode)
+    self.count = 0
+    # 書き込み時間の合計（秒）
+    self.write_time = 0.0
+
+  def write(self, obj):
+    start = time.perf_counter()
+    self.file.write(('[' if self.count == 0 else ', ') + JsonCodec.dumps(obj))
+    self.count += 1
+    self.write_time += time.perf_counter() - start
+
+  def close(self):
+    self.file.write('[]' if self.count == 0 else ']')
+    self.file.close()
+
+class JsonLinesWriter():
+  """
+  1行1件のjson(JSON Lines)をファイルに書き込む。
+  """
+
+  def __init__(self, path, mode='w'):
+    self.file = open(path, encoding='utf-8', mode=mode)
+    self.count = 0
+    # 書き込み時間の合計（秒）
+    self.write_time = 0.0
+
+  def write(self, obj):
+    start = time.perf_counter()
+    self.file.write(JsonCodec.dumps(obj) + '\n')
+    self.count += 1
+    self.write_time += time.perf_counter() - start
+
+  def close(self):
+    self.file.close()
+
+class ResultListWriter():
+  """
+  判定結果をファイルに書き込まず、配列に保持する。
+  """
+
+  def __init__(self):
+    self.all_comments = []
+    self.ok_comments = []
+    self.ng_comments = []
+    self.warn_comments = []
+
+  def write_all(self, comment_info):
+    self.all_comments.append(comment_info)
+
+  def write_ok(self, comment):
+    self.ok_comments.append(comment)
+
+  def write_ng(self, comment):
+    self.ng_comments.append(comment)
+
+  def write_warn(self, comment):
+    self.warn_comments.append(comment)
+
+class ResultWriter():
+  """
+  判定結果をoutput配下のファイルに1件ずつ書き込む。
+  """
+
+  OUTPUT_DIR_ALL = './output/all/'
+  OUTPUT_DIR_NG_CHANNEL = './output/ng_channel/'
+  OUTPUT_DIR_OK_MESSAGES = './output/ok_message/'
+  OUTPUT_DIR_NG_MESSAGES = './output/ng_message/'
+  OUTPUT_DIR_WARN_MESSAGES = './output/warn_message/'
+  OUTPUT_DIR_METRICS = './output/metrics/'
+  OUTPUT_DIR_COLUMNAR = './output/columnar/'
+
+  def __init__(self, video_id, json_lines=False, mode='w', columnar_format=None):
+    """ コンストラクタ
+
+    Parameters:
+    ----
+    video_id : string
+      動画ID。output/*/result_${動画ID}.json(.jsonl)に書き込む。
+    json_lines : boolean
+      Trueの場合はJSON Lines形式(.jsonl)で書き込む。Falseの場合はjsonの配列(.json)で書き込む。
+    mode : string
+      ファイルを開くときのモード。JSON Lines形式の場合は'a'で追記できる。
+    columnar_format : string
+      parquet or csvを指定した場合、allと同じ内容を集計用の列形式でoutput/columnar配下にも書き込む。(ColumnarWriter.resolve_formatの戻り値)
+      追記はできない。
+    """
+    self.video_id = video_id
+    self.mode = mode
+    if json_lines:
+      writer_class, extension = JsonLinesWriter, '.jsonl'
+    else:
+      writer_class, extension = JsonArrayWriter, '.json'
+    self.all_writer = writer_class(ResultWriter.OUTPUT_DIR_ALL + 'result_' + video_id + extension, mode)
+    self.ok_writer = writer_class(ResultWriter.OUTPUT_DIR_OK_MESSAGES + 'result_' + video_id + extension, mode)
+    self.ng_writer = writer_class(ResultWriter.OUTPUT_DIR_NG_MESSAGES + 'result_' + video_id + extension, mode)
+    self.warn_writer = writer_class(ResultWriter.OUTPUT_DIR_WARN_MESSAGES + 'result_' + video_id + extension, mode)
+    self.columnar_writer = None
+    if columnar_format is not None:
+      self.columnar_writer = ColumnarWriter(ResultWriter.OUTPUT_DIR_COLUMNAR + 'result_' + video_id, columnar_format)
+
+  def write_all(self, comment_info):
+    self.all_writer.write(comment_info)
+    if self.columnar_writer is not None:
+      self.columnar_writer.write(comment_info)
+
+  def write_ok(self, comment):
+    self.ok_writer.write(comment)
+
+  def write_ng(self, comment):
+    self.ng_writer.write(comment)
+
+  def write_warn(self, comment):
+    self.warn_writer.write(comment)
+
+  def write_ng_channels(self, ng_channels):
+    """
+    NGに設定したユーザのチャンネルURLを書き込む。
+    """
+    with open(ResultWriter.OUTPUT_DIR_NG_CHANNEL + 'result_' + self.video_id + '.txt', mode=self.mode) as f:
+      for ng_channel in ng_channels:
+        f.write(ng_channel + '\n')
+
+  def get_counts(self):
+    """
+    書き込んだ件数を返す。
+    """
+    return {
+      'all': self.all_writer.count,
+      'ok': self.ok_writer.count,
+      'ng': self.ng_writer.count,
+      'warn': self.warn_writer.count
+    }
+
+  def get_write_time(self):
+    """
+    書き込み時間の合計（秒）を返す。
+    """
+    write_time = self.all_writer.write_time + self.ok_writer.write_time + self.ng_writer.write_time + self.warn_writer.write_time
+    if self.columnar_writer is not None:
+      write_time += self.columnar_writer.write_time
+    return write_time
+
+  @classmethod
+  def write_report(cls, video_id, report):
+    """
+    判定処理の計測結果をoutput/metrics配下にjsonで出力する。
+    """
+    with open(ResultWriter.OUTPUT_DIR_METRICS + 'result_' + video_id + '.json', encoding='utf-8', mode='w') as f:
+      f.write(json.dumps(report, indent=2))
+
+  @classmethod
+  def write_batch_summary(cls, summary):
+    """
+    バッチ判定の集計結果をoutput/metrics/batch_summary.jsonに出力する。
+    """
+    with open(ResultWriter.OUTPUT_DIR_METRICS + 'batch_summary.json', encoding='utf-8', mode='w') as f:
+      f.write(json.dumps(summary, indent=2))
+
+  def close(self):
+    self.all_writer.close()
+    self.ok_writer.close()
+    self.ng_writer.close()
+    self.warn_writer.close()
+    if self.columnar_writer is not None:
+      self.columnar_writer.close()
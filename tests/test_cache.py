@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+import pytest
+from cache import JudgementCache
+from ngindex import NGPatternIndex
+
+# 類似度がしきい値付近になるNGパターンが多くなるように、文字の種類を少なくする。
+CHARS = 'abcde'
+THRESHOLDS = [0.3, 0.5, 0.7]
+
+def random_text(rand):
+  return ''.join(rand.choice(CHARS) for _ in range(rand.randint(0, 8)))
+
+def search_all(cache, patterns, comments):
+  """
+  1回の実行と同じく、NGパターン一覧を保存してから全てのコメントを判定する。
+  """
+  index = NGPatternIndex(patterns)
+  cache.save_pattern_set(index)
+  results = [cache.search_pattern(comment, index, threshold) for comment, threshold in comments]
+  cache.commit()
+  return results
+
+def cold_search_all(patterns, comments):
+  index = NGPatternIndex(patterns)
+  return [index.search(comment, threshold) for comment, threshold in comments]
+
+def add_pattern(rand, patterns):
+  patterns.insert(rand.randint(0, len(patterns)), ('added{}'.format(rand.random()), random_text(rand)))
+
+def reorder_patterns(rand, patterns):
+  i, j = rand.sample(range(len(patterns)), 2)
+  patterns[i], patterns[j] = patterns[j], patterns[i]
+
+def remove_pattern(rand, patterns):
+  patterns.pop(rand.randrange(len(patterns)))
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('change', [add_pattern, reorder_patterns, remove_pattern])
+def test_warm_cache_after_pattern_change_matches_cold_run(tmp_path, seed, change):
+  rand = random.Random(seed)
+  path = str(tmp_path / 'cache.sqlite3')
+  patterns = [('pattern{}'.format(i), random_text(rand)) for i in range(30)]
+  comments = [(random_text(rand), rand.choice(THRESHOLDS)) for _ in range(200)]
+  assert search_all(JudgementCache(path), patterns, comments) == cold_search_all(patterns, comments)
+
+  for _ in range(3):
+    change(rand, patterns)
+    # 次回の実行と同じく、キャッシュファイルを開き直す。
+    cache = JudgementCache(path)
+    assert search_all(cache, patterns, comments) == cold_search_all(patterns, comments)
+    assert cache.get_stats()['hit'].get('pattern_partial', 0) > 0
+
+def test_warm_cache_without_pattern_change_hits(tmp_path):
+  rand = random.Random(0)
+  path = str(tmp_path / 'cache.sqlite3')
+  patterns = [('pattern{}'.format(i), random_text(rand)) for i in range(30)]
+  comments = [(random_text(rand), rand.choice(THRESHOLDS)) for _ in range(200)]
+  search_all(JudgementCache(path), patterns, comments)
+  cache = JudgementCache(path)
+  assert search_all(cache, patterns, comments) == cold_search_all(patterns, comments)
+  assert cache.get_stats()['miss'].get('pattern', 0) == 0
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+import os
+import random
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+import pytest
+from commentutil import CommentRecord, FloodInfoKeyEnum
+from flood import FloodDetector
+
+def create_record(comment_id, channel_id, second, message):
+  return CommentRecord(comment_id, channel_id, 'http://www.youtube.com/channel/' + channel_id, 'user', message, message, \
+    published_at='2022-01-01T00:{:02d}:{:02d}.000+00:00'.format(second // 60, second % 60))
+
+def test_duplicate_count_of_late_comment_is_not_boosted():
+  detector = FloodDetector(10, 0, 1)
+  detector.detect_many({'a{}'.format(i): create_record('a{}'.format(i), 'UC1', i, 'spam') for i in range(3)})
+  # 2つ目のSketchに切り替わる。
+  detector.detect_many({'b0': create_record('b0', 'UC1', 12, 'spam')})
+  # 現在のSketchの開始(10秒)より前の時刻のコメントが、後のバッチで届く。
+  results = detector.detect_many({'c0': create_record('c0', 'UC1', 5, 'spam')})
+  # 1つ前のSketchの3回は割り引かずに数え、それより多くは数えない。
+  assert results['c0'][1][FloodInfoKeyEnum.DUPLICATE_COUNT.value] == 5
+
+@pytest.mark.parametrize('seed', range(20))
+def test_duplicate_count_never_exceeds_observed_count_with_out_of_order_batches(seed):
+  rand = random.Random(seed)
+  detector = FloodDetector(10, 0, 1)
+  observed = Counter()
+  for batch_number in range(30):
+    records = {}
+    for i in range(rand.randint(1, 10)):
+      comment_id = '{}_{}'.format(batch_number, i)
+      # バッチをまたいで投稿時刻が前後する。
+      records[comment_id] = create_record(comment_id, rand.choice(['UC1', 'UC2']), rand.randint(0, 120), rand.choice(['spam', 'buy now']))
+    results = detector.detect_many(records)
+    for comment_id in sorted(records, key=lambda comment_id: FloodDetector.parse_time(records[comment_id].published_at)):
+      record = records[comment_id]
+      observed[(record.channel_id, record.message)] += 1
+      if comment_id in results:
+        assert results[comment_id][1][FloodInfoKeyEnum.DUPLICATE_COUNT.value] <= observed[(record.channel_id, record.message)]
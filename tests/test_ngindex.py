@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from difflib import SequenceMatcher
+import os
+import random
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+import pytest
+from ngindex import NGPatternIndex
+
+# 類似度がしきい値付近になるNGパターンが多くなるように、文字の種類を少なくする。
+CHARS = 'abcde'
+
+def brute_force_position(comment, texts, threshold, positions=None):
+  """
+  NGパターンを登録順に全件SequenceMatcherで比較した、しきい値を超える最初の位置。search_positionの期待値。
+  """
+  for i, text in enumerate(texts):
+    if positions is not None and i not in positions:
+      continue
+    similarity = SequenceMatcher(None, comment, text).ratio()
+    if similarity > threshold:
+      return i, similarity
+  return None
+
+def random_text(rand):
+  return ''.join(rand.choice(CHARS) for _ in range(rand.randint(0, 20)))
+
+@pytest.mark.parametrize('seed', range(5))
+def test_search_position_matches_brute_force(seed):
+  rand = random.Random(seed)
+  texts = [random_text(rand) for _ in range(200)]
+  index = NGPatternIndex([('pattern{}'.format(i), text) for i, text in enumerate(texts)])
+  for _ in range(100):
+    comment = random_text(rand)
+    threshold = rand.choice([0.0, 0.3, 0.5, 0.7, 0.9, 1.0])
+    assert index.search_position(comment, threshold) == brute_force_position(comment, texts, threshold)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_search_position_with_positions_matches_brute_force(seed):
+  rand = random.Random(seed)
+  texts = [random_text(rand) for _ in range(200)]
+  index = NGPatternIndex([('pattern{}'.format(i), text) for i, text in enumerate(texts)])
+  for _ in range(100):
+    comment = random_text(rand)
+    threshold = rand.choice([0.0, 0.3, 0.5, 0.7, 0.9])
+    positions = set(rand.sample(range(len(texts)), rand.randint(0, len(texts))))
+    assert index.search_position(comment, threshold, positions) == brute_force_position(comment, texts, threshold, positions)
+
+def test_search_position_with_empty_strings():
+  # 両方空文字の場合、SequenceMatcherは1.0を返す。
+  index = NGPatternIndex([('empty', ''), ('text', 'abc')])
+  assert index.search_position('', 0.5) == brute_force_position('', ['', 'abc'], 0.5) == (0, 1.0)
+  assert index.search_position('abc', 0.5) == (1, 1.0)
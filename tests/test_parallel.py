@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+
+import importlib.util
+import sys
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, APP_DIR)
+import pytest
+from judgement import NotUseMPLGJudgement
+from commentutil import AddNGInfoKeyEnum, AddWarnInfoKeyEnum
+
+VIDEO_ID = 'test_video'
+MESSAGES = ['こんにちは', 'spam spam buy now', '888', 'ＮＧワード入りのコメント', 'ありがとう', 'buy now cheap!!', \
+  'wwwwwwwwww', '🎉🎉🎉🎉', 'http://example.com spam spam', 'Hello everyone, nice stream today']
+# WARN判定される長いコメント
+LONG_MESSAGES = ['とても長いコメント' * 20, 'very long comment ' * 20]
+
+# WARN判定の言語判定にはpycld2を使う。
+requires_lang_detector = pytest.mark.skipif(importlib.util.find_spec('pycld2') is None, reason='pycld2 is not installed')
+
+def create_page(page_number, messages, count=25):
+  """
+  GoogleAPIで取得したコメントjsonと同じ形式の1ページ。
+  """
+  items = []
+  for i in range(count):
+    n = page_number * count + i
+    channel_id = 'UC{:03d}'.format(n % 11)
+    message = messages[n % len(messages)] + ('!' * (n % 3))
+    items.append({
+      'kind': 'youtube#liveChatMessage',
+      'id': 'comment{:05d}'.format(n),
+      'snippet': {
+        'type': 'textMessageEvent',
+        'authorChannelId': channel_id,
+        'publishedAt': '2022-01-01T00:00:{:02d}.000+00:00'.format(n % 60),
+        'hasDisplayContent': True,
+        'displayMessage': message,
+        'textMessageDetails': {'messageText': message}
+      },
+      'authorDetails': {
+        'channelId': channel_id,
+        'channelUrl': 'http://www.youtube.com/channel/' + channel_id,
+        'displayName': 'user' + channel_id
+      }
+    })
+  return {'kind': 'youtube#liveChatMessageListResponse', 'items': items}
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+  """
+  appディレクトリと同じ構成の作業ディレクトリ。
+  """
+  for name in ['input/comment/' + VIDEO_ID, 'input/ng_channel', 'input/ng_comment', 'input/ng_pattern', 'log', 'output/cache']:
+    os.makedirs(str(tmp_path / name))
+  for name in ['log_config.json', 'input/lang_len.tsv', 'input/warn_rule.tsv']:
+    shutil.copy(os.path.join(APP_DIR, name), str(tmp_path / name))
+  (tmp_path / 'input/ng_channel/list.txt').write_text('http://www.youtube.com/channel/UC003\n', encoding='utf-8')
+  (tmp_path / 'input/ng_comment/list.txt').write_text('spam spam buy\nＮＧワード\nbuy now cheap\n', encoding='utf-8')
+  monkeypatch.chdir(str(tmp_path))
+  return tmp_path
+
+def write_pages(workdir, messages):
+  for page_number in range(4):
+    (workdir / 'input/comment' / VIDEO_ID / 'page{:02d}.json'.format(page_number)).write_text( \
+      json.dumps(create_page(page_number, messages)), encoding='utf-8')
+
+def judge(workers, match_top_k, warn_rules):
+  judgement = NotUseMPLGJudgement(VIDEO_ID, 0.4, workers=workers, chunk_size=7, match_top_k=match_top_k, warn_rules=warn_rules)
+  judgement.exec()
+  return judgement.get_result_all_comments(), judgement.get_result_ng_channels()
+
+@pytest.mark.parametrize('match_top_k', [0, 2])
+def test_parallel_judgement_matches_serial_judgement(workdir, match_top_k):
+  write_pages(workdir, MESSAGES)
+  serial_comments, serial_ng_channels = judge(1, match_top_k, None)
+  parallel_comments, parallel_ng_channels = judge(2, match_top_k, None)
+  assert len(serial_comments) == 100
+  assert any(comment[AddNGInfoKeyEnum.NG_FLG.value] for comment in serial_comments)
+  # 並列で判定しても、コメントの順序と判定結果は直列で判定した場合と同じ。
+  assert parallel_comments == serial_comments
+  assert parallel_ng_channels == serial_ng_channels
+
+@requires_lang_detector
+@pytest.mark.parametrize('match_top_k', [0, 2])
+def test_parallel_warn_judgement_matches_serial_judgement(workdir, match_top_k):
+  write_pages(workdir, MESSAGES + LONG_MESSAGES)
+  warn_rules = ['length', 'emoji', 'symbol', 'repeat', 'url']
+  serial_comments, serial_ng_channels = judge(1, match_top_k, warn_rules)
+  parallel_comments, parallel_ng_channels = judge(2, match_top_k, warn_rules)
+  assert len(serial_comments) == 100
+  assert any(comment[AddWarnInfoKeyEnum.WARN_FLG.value] for comment in serial_comments)
+  assert parallel_comments == serial_comments
+  assert parallel_ng_channels == serial_ng_channels
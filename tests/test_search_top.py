@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from difflib import SequenceMatcher
+import os
+import random
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+import pytest
+from ngindex import NGPatternIndex
+from tokenindex import TokenPatternIndex
+from corpus import PatternCorpus
+
+# 類似度が同じNGパターンが多くなるように、文字の種類を少なくする。
+CHARS = 'abcde'
+TOKENS = ['あ', 'い', 'う', 'えお', 'か']
+
+def full_scan_top(comment, patterns, threshold, k, ratio):
+  """
+  NGパターンを全件比較した、類似度の高い順（同じ場合は登録順）のk件。search_topの期待値。
+  """
+  results = []
+  for i, (value, text) in enumerate(patterns):
+    similarity = ratio(comment, text)
+    if similarity > threshold:
+      results.append((-similarity, i, value))
+  results.sort(key=lambda result: (result[0], result[1]))
+  return [(value, -negative_similarity) for negative_similarity, _, value in results[:k]]
+
+def char_ratio(comment, text):
+  return SequenceMatcher(None, comment, text).ratio()
+
+def token_ratio(comment, text):
+  return SequenceMatcher(None, PatternCorpus.tokenize(comment)[0], PatternCorpus.tokenize(text)[0]).ratio()
+
+def random_text(rand):
+  return ''.join(rand.choice(CHARS) for _ in range(rand.randint(0, 10)))
+
+def random_mplg_result(rand):
+  """ MeCabの出力と同じ形式の文字列 """
+  tokens = [rand.choice(TOKENS) for _ in range(rand.randint(0, 6))]
+  return ''.join(token + '\t名詞,一般,*,*,*,*,' + token + '\n' for token in tokens) + 'EOS\n'
+
+@pytest.mark.parametrize('seed', range(5))
+def test_ng_pattern_index_search_top_matches_full_scan(seed):
+  rand = random.Random(seed)
+  patterns = [('pattern{}'.format(i), random_text(rand)) for i in range(200)]
+  index = NGPatternIndex(patterns)
+  for _ in range(200):
+    comment = random_text(rand)
+    threshold = rand.choice([0.0, 0.2, 0.5, 0.8])
+    k = rand.randint(1, 5)
+    assert index.search_top(comment, threshold, k) == full_scan_top(comment, patterns, threshold, k, char_ratio)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_token_pattern_index_search_top_matches_full_scan(seed):
+  rand = random.Random(seed)
+  patterns = [('pattern{}'.format(i), random_mplg_result(rand)) for i in range(200)]
+  index = TokenPatternIndex.from_patterns(patterns)
+  for _ in range(200):
+    comment = random_mplg_result(rand)
+    threshold = rand.choice([0.0, 0.2, 0.5, 0.8])
+    k = rand.randint(1, 5)
+    assert index.search_top(comment, threshold, k) == full_scan_top(comment, patterns, threshold, k, token_ratio)
+
+def test_ng_pattern_index_search_top_ties_in_registration_order():
+  # 同じ文字列のNGパターンは類似度が同じなので、登録順に返す。
+  patterns = [('first', 'abcd'), ('longer', 'abcdxyz'), ('second', 'abcd'), ('third', 'dcba'), ('fourth', 'abcd')]
+  index = NGPatternIndex(patterns)
+  assert index.search_top('abcd', 0.5, 3) == [('first', 1.0), ('second', 1.0), ('fourth', 1.0)]
+  assert index.search_top('abcd', 0.5, 4) == [('first', 1.0), ('second', 1.0), ('fourth', 1.0), ('longer', char_ratio('abcd', 'abcdxyz'))]
+
+def test_token_pattern_index_search_top_ties_in_registration_order():
+  texts = [['あ', 'い'], ['あ', 'い', 'う', 'か'], ['あ', 'い'], ['い', 'あ'], ['あ', 'い']]
+  patterns = [(str(i), ''.join(token + '\t名詞,一般,*,*,*,*,' + token + '\n' for token in tokens) + 'EOS\n') \
+    for i, tokens in enumerate(texts)]
+  index = TokenPatternIndex.from_patterns(patterns)
+  comment = patterns[0][1]
+  assert index.search_top(comment, 0.5, 3) == [('0', 1.0), ('2', 1.0), ('4', 1.0)]
+  assert index.search_top(comment, 0.5, 4) == full_scan_top(comment, patterns, 0.5, 4, token_ratio)
+
+def test_search_top_returns_empty_when_nothing_exceeds_threshold():
+  index = NGPatternIndex([('value', 'abc')])
+  assert index.search_top('xyz', 0.5, 3) == []
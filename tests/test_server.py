@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import importlib
+import json
+import os
+import shutil
+
+import sys
+import types
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, APP_DIR)
+import pytest
+
+# server.pyはsettings.pyを経由してpython-dotenvを読み込む。
+# 設定値は環境変数で渡すので、python-dotenvがインストールされていない場合は.envを読まないモジュールで置き換える。
+try:
+  import dotenv
+except ImportError:
+  dotenv = types.ModuleType('dotenv')
+  dotenv.load_dotenv = lambda *args, **kwargs: False
+  dotenv.dotenv_values = lambda *args, **kwargs: {}
+  sys.modules['dotenv'] = dotenv
+
+VIDEO_ID = 'test_video'
+MESSAGES = ['こんにちは', 'spam spam buy now', '888', 'ＮＧワード入りのコメント', 'ありがとう', 'buy now cheap!!']
+
+def create_page(page_number, count=20):
+  """
+  GoogleAPIで取得したコメントjsonと同じ形式の1ページ。
+  """
+  items = []
+  for i in range(count):
+    n = page_number * count + i
+    channel_id = 'UC{:03d}'.format(n % 7)
+    message = MESSAGES[n % len(MESSAGES)]
+    items.append({
+      'kind': 'youtube#liveChatMessage',
+      'id': 'comment{:05d}'.format(n),
+      'snippet': {
+        'type': 'textMessageEvent',
+        'authorChannelId': channel_id,
+        'publishedAt': '2022-01-01T00:00:{:02d}.000+00:00'.format(n % 60),
+        'hasDisplayContent': True,
+        'displayMessage': message,
+        'textMessageDetails': {'messageText': message}
+      },
+      'authorDetails': {
+        'channelId': channel_id,
+        'channelUrl': 'http://www.youtube.com/channel/' + channel_id,
+        'displayName': 'user' + channel_id
+      }
+    })
+  return {'kind': 'youtube#liveChatMessageListResponse', 'items': items}
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+  """
+  appディレクトリと同じ構成の作業ディレクトリ。
+  """
+  for name in ['input/comment/' + VIDEO_ID, 'input/ng_channel', 'input/ng_comment', 'input/ng_pattern', 'log', 'output/cache']:
+    os.makedirs(str(tmp_path / name))
+  for name in ['log_config.json', 'input/lang_len.tsv', 'input/warn_rule.tsv']:
+    shutil.copy(os.path.join(APP_DIR, name), str(tmp_path / name))
+  (tmp_path / 'input/ng_channel/list.txt').write_text('http://www.youtube.com/channel/UC003\n', encoding='utf-8')
+  (tmp_path / 'input/ng_comment/list.txt').write_text('spam spam buy\nＮＧワード\n', encoding='utf-8')
+  pages = [create_page(page_number) for page_number in range(4)]
+  for page_number, page in enumerate(pages):
+    (tmp_path / 'input/comment' / VIDEO_ID / 'page{:02d}.json'.format(page_number)).write_text(json.dumps(page), encoding='utf-8')
+
+  monkeypatch.chdir(str(tmp_path))
+  monkeypatch.setenv('mplg', '0')
+  monkeypatch.setenv('similarity_threshold', '0.4')
+  return pages
+
+async def request(port, method, path, body=b''):
+  reader, writer = await asyncio.open_connection('127.0.0.1', port)
+  writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format( \
+    method, path, len(body)).encode('ascii') + body)
+  await writer.drain()
+  data = await reader.read()
+  writer.close()
+  head, _, response = data.partition(b'\r\n\r\n')
+  return head.split(b'\r\n')[0], json.loads(response)
+
+def test_server_matches_batch_judgement(workdir):
+  pages = workdir
+  judgement_module = importlib.import_module('judgement')
+  server = importlib.import_module('server')
+
+  # app.pyと同じく、動画のコメントをまとめて判定した結果
+  expected_judgement = judgement_module.NotUseMPLGJudgement(VIDEO_ID, 0.4)
+  expected_judgement.exec()
+  expected = {comment['id']: comment for comment in expected_judgement.get_result_all_comments()}
+  expected_ng_channels = set(expected_judgement.get_result_ng_channels())
+
+  async def run():
+    judgement_server = server.JudgementServer(lambda: judgement_module.NotUseMPLGJudgement('server', 0.4), 1000, 0.01)
+    sockets = await judgement_server.start('127.0.0.1', 0)
+    port = sockets[0].getsockname()[1]
+    try:
+      # 同時に送信したページはまとめて判定される。
+      responses = await asyncio.gather(*[request(port, 'POST', '/judge', json.dumps(page).encode('utf-8')) for page in pages])
+      bad_request = await request(port, 'POST', '/judge', b'{broken')
+      stats = await request(port, 'GET', '/stats')
+    finally:
+      await judgement_server.close()
+    return responses, bad_request, stats
+
+  responses, bad_request, stats = asyncio.run(run())
+
+  actual = {}
+  actual_ng_channels = set()
+  for status, response in responses:
+    assert status.endswith(b'200 OK')
+    for comment in response['all']:
+      actual[comment['id']] = comment
+    actual_ng_channels.update(response['ng_channels'])
+  assert actual == expected
+  assert actual_ng_channels == expected_ng_channels
+  assert bad_request[0].endswith(b'400 Bad Request')
+  assert stats[1]['requests'] == len(pages)
+  assert stats[1]['comments'] == len(expected)
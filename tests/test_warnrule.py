@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+import pytest
+import warnrule
+from warnrule import WarnRuleEngine
+
+PARTS = ['a', 'w', 'ｗ', '草', '🎉', '!', '?', ' ', 'http://example.com/a', 'www.example.jp', 'ー', '❤️']
+LANGS = ['ja', 'en', 'ko']
+
+def random_case(rand):
+  rules = rand.sample(list(WarnRuleEngine.RULES), rand.randint(1, len(WarnRuleEngine.RULES)))
+  lang_len = {lang: rand.randint(0, 30) for lang in rand.sample(LANGS, rand.randint(1, 3))}
+  thresholds = {}
+  for rule in ['emoji', 'symbol', 'repeat', 'url']:
+    thresholds[rule] = {lang: rand.random() if rule in ['emoji', 'symbol'] else rand.randint(0, 5) \
+      for lang in rand.sample(LANGS + [WarnRuleEngine.ANY_LANG], rand.randint(1, 3))}
+  texts = [''.join(rand.choice(PARTS) for _ in range(rand.randint(0, 30))) for _ in range(rand.randint(0, 50))]
+  langs = [rand.choice(LANGS) for _ in texts]
+  return rules, lang_len, thresholds, texts, langs
+
+def judge_all(rules, lang_len, thresholds, texts, langs):
+  engine = WarnRuleEngine(rules, lang_len, thresholds)
+  features = engine.get_features(texts)
+  lang_targets = engine.get_lang_targets(features)
+  results = [None] * len(texts)
+  for i, result in zip(lang_targets, engine.judge(features, lang_targets, [langs[i] for i in lang_targets])):
+    results[i] = result
+  return results
+
+def judge_one(rules, lang_len, thresholds, text, lang):
+  """
+  コメント1件ずつ、ルールごとに判定した結果。WarnRuleEngineの期待値。
+  """
+  length = len(text)
+  values = {
+    'length': length,
+    'emoji_ratio': len(WarnRuleEngine.EMOJI_PATTERN.findall(text)) / length if length > 0 else 0.0,
+    'symbol_ratio': len(WarnRuleEngine.SYMBOL_PATTERN.findall(text)) / length if length > 0 else 0.0,
+    'repeat_run': max([len(m.group(0)) for m in WarnRuleEngine.REPEAT_PATTERN.finditer(text)], default=min(length, 1)),
+    'url_count': len(WarnRuleEngine.URL_PATTERN.findall(text))
+  }
+  warn_pattern = []
+  for rule in rules:
+    table = lang_len if rule == 'length' else thresholds.get(rule, {})
+    threshold = table.get(lang, None if rule == 'length' else table.get(WarnRuleEngine.ANY_LANG))
+    if threshold is not None and values[WarnRuleEngine.RULES[rule]] > threshold:
+      warn_pattern.append(rule)
+  if not warn_pattern:
+    return None
+  names = ['length'] + [WarnRuleEngine.RULES[rule] for rule in warn_pattern]
+  return lang, warn_pattern, {name: values[name] for name in names}
+
+@pytest.fixture
+def without_numpy(monkeypatch):
+  monkeypatch.setattr(warnrule, 'np', None)
+  monkeypatch.setattr(warnrule, 'import_numpy', lambda: None)
+
+@pytest.mark.parametrize('seed', range(100))
+def test_warn_rules_match_per_comment_judgement(seed, without_numpy):
+  rules, lang_len, thresholds, texts, langs = random_case(random.Random(seed))
+  assert judge_all(rules, lang_len, thresholds, texts, langs) == \
+    [judge_one(rules, lang_len, thresholds, text, lang) for text, lang in zip(texts, langs)]
+
+@pytest.mark.parametrize('seed', range(100))
+def test_warn_rules_with_numpy_match_per_comment_judgement(seed):
+  if warnrule.import_numpy() is None:
+    pytest.skip('numpy is not installed')
+  rules, lang_len, thresholds, texts, langs = random_case(random.Random(seed))
+  results = judge_all(rules, lang_len, thresholds, texts, langs)
+  assert results == [judge_one(rules, lang_len, thresholds, text, lang) for text, lang in zip(texts, langs)]
+  # 出力するjsonの型が変わらないように、特徴量はPythonの値で返す。
+  for result in results:
+    if result is not None:
+      assert all(type(value) in [int, float] for value in result[2].values())